@@ -1,3 +1,10 @@
+from test_server.delay import (
+    Delay,
+    EmpiricalDelay,
+    FixedDelay,
+    LogNormalDelay,
+    UniformDelay,
+)
 from test_server.error import (
     InternalError,
     NoResponseError,
@@ -5,20 +12,28 @@ from test_server.error import (
     TestServerError,
     WaitTimeoutError,
 )
-from test_server.server import Request, Response, TestServer
+from test_server.pool import TestServerPool
+from test_server.server import Namespace, Request, Response, TestServer
 from test_server.structure import HttpHeaderStorage
 
 from .const import TEST_SERVER_PACKAGE_VERSION
 
 __version__ = TEST_SERVER_PACKAGE_VERSION
 __all__ = [
+    "Delay",
+    "EmpiricalDelay",
+    "FixedDelay",
     "HttpHeaderStorage",
     "InternalError",
+    "LogNormalDelay",
+    "Namespace",
     "NoResponseError",
     "Request",
     "RequestNotProcessedError",
     "Response",
     "TestServer",
     "TestServerError",
+    "TestServerPool",
+    "UniformDelay",
     "WaitTimeoutError",
 ]
@@ -0,0 +1,666 @@
+"""Server engine that handles all connections in single asyncio event loop.
+
+The engine is an alternative to ThreadingTCPServer. It requires python 3.
+The uvloop event loop is used if the uvloop package is installed.
+"""
+
+# from __future__ import annotations
+
+import asyncio
+import logging
+import socket
+import sys
+import threading
+from typing import Any, cast
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Callable, Iterable
+
+# pylint: enable=import-error
+from .body import (
+    MAX_LINE_SIZE,
+    READ_CHUNK_SIZE,
+    RequestBody,
+    add_trailer,
+    is_chunked,
+    parse_chunk_size,
+)
+from .delay import resolve_delay
+from .error import InternalError
+from .file_body import FileBody
+from .head import BadRequestError, header_value, parse_request_head
+from .prefork import set_reuse_port
+from .server import (
+    CONNECTION_CLOSE_HEADER,
+    INTERNAL_ERROR_RESPONSE_STATUS,
+    LISTEN_BACKLOG,
+    VALID_METHODS,
+    HandlerResult,
+    PreparedResponse,
+    Request,
+    Response,
+    TestServer,
+    add_required_response_headers,
+    build_handler_result,
+    serialize_response_head,
+)
+from .stats import monotonic
+from .stream import iter_stream_body, setup_stream_framing
+from .structure import HttpHeaderStorage
+from .throttle import Throttle, create_throttle  # pylint: disable=unused-import
+
+try:
+    import uvloop  # type: ignore[import-not-found,unused-ignore]
+except ImportError:
+    uvloop = None
+
+__all__ = ["AsyncioServer"]
+LOG = logging.getLogger()
+MAX_REQUEST_HEAD_SIZE = 65536  # type: int
+# Errors which mean the connection is closed or timed out. Since python 3.11
+# asyncio.TimeoutError is builtin TimeoutError which is subclass of OSError
+CONNECTION_ERRORS = (
+    (asyncio.IncompleteReadError, OSError)
+    if sys.version_info >= (3, 11)
+    else (asyncio.IncompleteReadError, asyncio.TimeoutError, OSError)
+)  # type: tuple[type[Exception], ...]
+
+
+def open_file_body(
+    body,  # type: FileBody
+):
+    # type: (...) -> None
+    try:
+        body.open()
+    except OSError as ex:
+        # Must not be handled as connection error
+        raise InternalError(str(ex))
+
+
+def call_raw_callback(
+    resp,  # type: Response
+):
+    # type: (...) -> bytes
+    data = cast(Callable[[], Any], resp.raw_callback)()
+    if not isinstance(data, bytes):
+        raise InternalError("Raw callback must return bytes data")
+    return data
+
+
+def build_result(
+    resp,  # type: Response
+    port,  # type: None | int
+    protocol_version,  # type: str
+):
+    # type: (...) -> HandlerResult | PreparedResponse
+    """Return pre-serialized response or build it from response parameters."""
+    prepared = resp.prepare(port, protocol_version)
+    if prepared is not None:
+        return prepared
+    result = HandlerResult()
+    build_handler_result(resp, result)
+    if isinstance(result.data, FileBody):
+        open_file_body(result.data)
+    return result
+
+
+class AsyncioServer(object):  # pylint: disable=too-many-instance-attributes
+    """Serve requests to TestServer from single event loop.
+
+    The object provides the subset of socketserver.TCPServer interface
+    used by TestServer: socket, serve_forever(), shutdown(), server_close()
+    and stop(). The socket is bound and listening when the object is created,
+    the event loop is created by serve_forever() in the thread which runs it.
+    """
+
+    def __init__(
+        self,
+        server_address,  # type: tuple[str, int]
+        test_server,  # type: TestServer
+    ):
+        # type: (...) -> None
+        self.test_server = test_server
+        self.server_address = server_address
+        self.loop = None  # type: None | asyncio.AbstractEventLoop
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if test_server.workers:
+            set_reuse_port(self.socket)
+        self.socket.bind(server_address)
+        self.socket.listen(LISTEN_BACKLOG)
+        self.socket.setblocking(False)
+        # Guards creation and closing of the event loop
+        self._lock = threading.Lock()
+        self._stop_requested = False
+        self._stop_event = None  # type: None | asyncio.Event
+        # Seconds to wait for requests being processed when server stops
+        self._stop_timeout = 0.0
+        self._finished = threading.Event()
+        self._stopping = False
+        # Tasks handling connections and writers of these connections
+        self._tasks = {}  # type: dict[asyncio.Future[None], asyncio.StreamWriter]
+        # Connections waiting for next request
+        self._idle = set()  # type: set[asyncio.StreamWriter]
+        self.test_server.server_started.set()
+
+    # **************
+    # Server control
+    # **************
+
+    def serve_forever(
+        self,
+        poll_interval=0.5,  # type: float # noqa: ARG002 # pylint: disable=W0613
+    ):
+        # type: (...) -> None
+        with self._lock:
+            if self._stop_requested:
+                self._finished.set()
+                return
+            loop = (
+                uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+            )  # type: asyncio.AbstractEventLoop
+            asyncio.set_event_loop(loop)
+            self._stop_event = asyncio.Event()
+            self.loop = loop
+        try:
+            loop.run_until_complete(self._serve())
+        finally:
+            with self._lock:
+                loop.close()
+                self._finished.set()
+
+    def shutdown(self):
+        # type: () -> None
+        """Stop the event loop and wait until it is finished."""
+        with self._lock:
+            self._stop_requested = True
+            if self.loop is None or self._finished.is_set():
+                return
+            self.loop.call_soon_threadsafe(cast(asyncio.Event, self._stop_event).set)
+        self._finished.wait()
+
+    def server_close(self):
+        # type: () -> None
+        self.socket.close()
+
+    def stop(
+        self,
+        timeout,  # type: float
+    ):
+        # type: (...) -> None
+        """Stop the server, requests being processed have timeout seconds to finish."""
+        self._stop_timeout = timeout
+        self.shutdown()
+        self.server_close()
+
+    async def _serve(self):
+        # type: () -> None
+        server = await asyncio.start_server(
+            self._start_connection, sock=self.socket, limit=MAX_REQUEST_HEAD_SIZE
+        )
+        await cast(asyncio.Event, self._stop_event).wait()
+        server.close()
+        # Connections waiting for next request are closed at once,
+        # requests being processed have limited time to finish
+        self._stopping = True
+        for task, writer in self._tasks.items():
+            if writer in self._idle:
+                task.cancel()
+        pending = set(self._tasks)
+        if pending:
+            _done, pending = await asyncio.wait(pending, timeout=self._stop_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        await server.wait_closed()
+
+    # ******************
+    # Request processing
+    # ******************
+
+    def _start_connection(
+        self,
+        reader,  # type: asyncio.StreamReader
+        writer,  # type: asyncio.StreamWriter
+    ):
+        # type: (...) -> None
+        """Run task which handles the connection and keep track of it."""
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            # Response is written at once, there is nothing to wait for
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        task = asyncio.ensure_future(self._handle_connection(reader, writer))
+        self._tasks[task] = writer
+        task.add_done_callback(lambda done: self._tasks.pop(done, None))
+
+    async def _handle_connection(
+        self,
+        reader,  # type: asyncio.StreamReader
+        writer,  # type: asyncio.StreamWriter
+    ):
+        # type: (...) -> None
+        connected = monotonic()
+        try:
+            num_requests = 0
+            close = False
+            while not close and not self._stopping:
+                num_requests += 1
+                # Until request head is received
+                self._idle.add(writer)
+                close = await self._handle_request(
+                    reader, writer, num_requests, connected
+                )
+        except CONNECTION_ERRORS:
+            pass
+        except BadRequestError as ex:
+            LOG.error("Bad request to test server: %s", ex)
+            try:  # noqa: SIM105
+                await self._write_response(
+                    writer,
+                    ex.status,
+                    HttpHeaderStorage(),
+                    str(ex).encode("utf-8"),
+                    close=True,
+                )
+            except OSError:
+                pass
+        finally:
+            self._idle.discard(writer)
+            writer.close()
+
+    async def _read_head(
+        self,
+        reader,  # type: asyncio.StreamReader
+        num_requests,  # type: int
+    ):
+        # type: (...) -> bytes
+        timeout = (
+            self.test_server.keep_alive_timeout if num_requests > 1 else None
+        )  # type: None | float
+        try:
+            return await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        except asyncio.LimitOverrunError:
+            raise BadRequestError("Request head is too long")
+
+    def _must_close(
+        self,
+        version,  # type: str
+        headers,  # type: HttpHeaderStorage
+        num_requests,  # type: int
+    ):
+        # type: (...) -> bool
+        """Decide if connection is closed after response to current request.
+
+        Follows the logic of BaseHTTPRequestHandler.parse_request
+        """
+        if self.test_server.protocol_version != "HTTP/1.1":
+            return True
+        close = version != "HTTP/1.1"
+        conn_type = header_value(headers, "Connection").lower()
+        if conn_type == "close":
+            close = True
+        elif conn_type == "keep-alive":
+            close = False
+        max_requests = self.test_server.keep_alive_max_requests
+        if max_requests is not None and num_requests >= max_requests:
+            close = True
+        return close
+
+    async def _handle_request(  # pylint: disable=too-many-locals
+        self,
+        reader,  # type: asyncio.StreamReader
+        writer,  # type: asyncio.StreamWriter
+        num_requests,  # type: int
+        connected,  # type: float
+    ):
+        # type: (...) -> bool
+        """Process one request.
+
+        Args:
+            reader: connection reader
+            writer: connection writer
+            num_requests: number of the request in the connection
+            connected: time the connection has been accepted at
+
+        Returns:
+            True if connection must be closed.
+        """
+        head = await self._read_head(reader, num_requests)
+        self._idle.discard(writer)
+        timings = {"received": monotonic()}
+        if num_requests == 1:
+            timings["connected"] = connected
+        method, target, version, headers, raw_headers = parse_request_head(head)
+        timings["parsed"] = monotonic()
+        close = self._must_close(version, headers, num_requests)
+        if method.lower() not in VALID_METHODS:
+            await self._write_response(
+                writer,
+                501,
+                HttpHeaderStorage(),
+                "Unsupported method ({!r})".format(method).encode("utf-8"),
+                close=True,
+            )
+            return True
+        if (
+            header_value(headers, "Expect").lower() == "100-continue"
+            and self.test_server.protocol_version == "HTTP/1.1"
+        ):
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        scope, target = self.test_server.route_request(
+            header_value(headers, "Host"), target
+        )
+        throttle = None  # type: None | Throttle
+        generation = None  # type: None | int
+        try:
+            generation, resp = scope.select_response(
+                method.lower(), target, headers.items()
+            )
+            timings["dispatched"] = monotonic()
+            throttle = create_throttle(
+                resp.rate_limit_bps, resp.burst, self.test_server.bandwidth_bucket
+            )
+            delay = resolve_delay(resp.sleep)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            timings["delayed"] = monotonic()
+            req = await self._read_request(
+                reader,
+                writer,
+                method,
+                target,
+                headers,
+                raw_headers,
+                timings,
+                generation,
+            )
+            scope.add_request(req)
+            if resp.raw_callback:
+                data = call_raw_callback(resp)
+                timings["built"] = monotonic()
+                scope.mark_request_processed(generation)
+                await self._write_paced(writer, data, throttle)
+                timings["sent"] = monotonic()
+                scope.record_timings(target.partition("?")[0], timings, generation)
+                return True
+            result = build_result(
+                resp, self.test_server.port, self.test_server.protocol_version
+            )
+            timings["built"] = monotonic()
+        except (asyncio.CancelledError, asyncio.IncompleteReadError, OSError):
+            raise
+        except Exception as ex:
+            LOG.exception("Unexpected error happend in test server request handler")
+            result = HandlerResult(
+                status=INTERNAL_ERROR_RESPONSE_STATUS, data=str(ex).encode("utf-8")
+            )
+            close = True
+        scope.mark_request_processed(generation)
+        close = await self._write_result(writer, result, close, version, throttle)
+        timings["sent"] = monotonic()
+        scope.record_timings(target.partition("?")[0], timings, generation)
+        return close
+
+    async def _read_request(  # noqa: PLR0913, PLR0917
+        self,
+        reader,  # type: asyncio.StreamReader
+        writer,  # type: asyncio.StreamWriter
+        method,  # type: str
+        target,  # type: str
+        headers,  # type: HttpHeaderStorage
+        raw_headers,  # type: bytes
+        timings,  # type: dict[str, float]
+        generation,  # type: None | int
+    ):
+        # type: (...) -> Request
+        """Read request body and build Request object."""
+        trailers = []  # type: list[tuple[str, str]]
+        if is_chunked(header_value(headers, "Transfer-Encoding")):
+            body, trailers = await self._read_chunked_body(reader)
+        else:
+            content_len = int(header_value(headers, "Content-Length", "0"))
+            body = await self._read_body(reader, content_len)
+        timings["body_read"] = monotonic()
+        path, _sep, query_string = target.partition("?")
+        return Request(
+            client_ip=writer.get_extra_info("peername")[0],
+            path=path,
+            data=body,
+            method=method.upper(),
+            headers=headers,
+            raw_headers=raw_headers,
+            trailers=trailers,
+            query_string=query_string,
+            spool_threshold=self.test_server.spool_threshold,
+            timings=timings,
+            generation=generation,
+        )
+
+    async def _read_body(
+        self,
+        reader,  # type: asyncio.StreamReader
+        length,  # type: int
+    ):
+        # type: (...) -> RequestBody
+        spool_threshold = self.test_server.spool_threshold
+        if spool_threshold is None or length <= spool_threshold:
+            return RequestBody(await reader.readexactly(length) if length else b"")
+        body = RequestBody.create_spooled(spool_threshold)
+        remaining = length
+        while remaining > 0:
+            chunk = await reader.read(min(remaining, READ_CHUNK_SIZE))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            body.write(chunk)
+            remaining -= len(chunk)
+        return body
+
+    async def _read_line(
+        self,
+        reader,  # type: asyncio.StreamReader
+    ):
+        # type: (...) -> bytes
+        line = await reader.readuntil(b"\n")
+        if len(line) > MAX_LINE_SIZE:
+            raise ValueError("Line of chunked body is too long")
+        return line
+
+    async def _read_chunked_body(
+        self,
+        reader,  # type: asyncio.StreamReader
+    ):
+        # type: (...) -> tuple[RequestBody, list[tuple[str, str]]]
+        """Async version of body.read_chunked_body()."""
+        body = RequestBody.create_spooled(self.test_server.spool_threshold)
+        while True:
+            remaining = parse_chunk_size(await self._read_line(reader))
+            if not remaining:
+                break
+            while remaining > 0:
+                chunk = await reader.read(min(remaining, READ_CHUNK_SIZE))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                body.write(chunk)
+                remaining -= len(chunk)
+            if (await self._read_line(reader)).strip():
+                raise ValueError("Chunk data is not followed by line break")
+        trailers = []  # type: list[tuple[str, str]]
+        while True:
+            line = await self._read_line(reader)
+            if not line.strip():
+                break
+            add_trailer(trailers, line)
+        return body, trailers
+
+    async def _write_result(
+        self,
+        writer,  # type: asyncio.StreamWriter
+        result,  # type: HandlerResult | PreparedResponse
+        close,  # type: bool
+        version,  # type: str
+        throttle,  # type: None | Throttle
+    ):
+        # type: (...) -> bool
+        """Write pre-serialized response or response built by handler.
+
+        Returns:
+            True if connection must be closed.
+        """
+        if isinstance(result, PreparedResponse):
+            return await self._write_prepared(writer, result, close, throttle)
+        return await self._write_response(
+            writer,
+            result.status,
+            result.headers,
+            result.data,
+            close,
+            chunked_allowed=version == "HTTP/1.1",
+            throttle=throttle,
+        )
+
+    async def _write_prepared(
+        self,
+        writer,  # type: asyncio.StreamWriter
+        prepared,  # type: PreparedResponse
+        close,  # type: bool
+        throttle=None,  # type: None | Throttle
+    ):
+        # type: (...) -> bool
+        """Write pre-serialized response.
+
+        Returns:
+            True if connection must be closed.
+        """
+        head = prepared.head
+        if prepared.connection is not None:
+            close = close or prepared.connection == "close"
+        elif close and prepared.protocol_version == "HTTP/1.1":
+            head += CONNECTION_CLOSE_HEADER
+        head += b"\r\n"
+        if throttle is None:
+            await self._write_paced(writer, head + prepared.body)
+        else:
+            writer.write(head)
+            await self._write_paced(writer, prepared.body, throttle)
+        return close
+
+    async def _write_response(  # noqa: PLR0913, PLR0917
+        self,
+        writer,  # type: asyncio.StreamWriter
+        status,  # type: int
+        headers,  # type: HttpHeaderStorage
+        data,  # type: bytes | Iterable[Any] | FileBody
+        close,  # type: bool
+        chunked_allowed=True,  # type: bool
+        throttle=None,  # type: None | Throttle
+    ):
+        # type: (...) -> bool
+        """Write response and wait until it is accepted by transport.
+
+        Returns:
+            True if connection must be closed.
+        """
+        protocol_version = self.test_server.protocol_version
+        add_required_response_headers(headers, self.test_server.port)
+        stream, stream_close = self._setup_body_framing(
+            headers, data, chunked_allowed and protocol_version == "HTTP/1.1"
+        )
+        close = close or stream_close
+        if "connection" in headers:
+            close = close or headers.get("connection").lower() == "close"
+        elif close and protocol_version == "HTTP/1.1":
+            headers.set("Connection", "close")
+        head = serialize_response_head(protocol_version, status, headers) + b"\r\n"
+        if isinstance(data, FileBody):
+            try:
+                writer.write(head)
+                await self._send_file(writer, data, throttle)
+            finally:
+                data.close()
+            return close
+        if stream is None:
+            if throttle is None:
+                await self._write_paced(writer, head + cast(bytes, data))
+            else:
+                writer.write(head)
+                await self._write_paced(writer, cast(bytes, data), throttle)
+            return close
+        writer.write(head)
+        try:
+            for piece in stream:
+                await self._write_paced(writer, piece, throttle)
+        except (OSError, asyncio.CancelledError):
+            raise
+        except Exception:
+            LOG.exception("Unexpected error happend while streaming response body")
+            return True
+        return close
+
+    def _setup_body_framing(
+        self,
+        headers,  # type: HttpHeaderStorage
+        data,  # type: bytes | Iterable[Any] | FileBody
+        chunked_allowed,  # type: bool
+    ):
+        # type: (...) -> tuple[None | Iterable[bytes], bool]
+        """Set headers which indicate the end of response body.
+
+        Returns:
+            Tuple of pieces of streamed body (None if body is not iterable)
+            and flag which is True if connection must be closed.
+        """
+        if isinstance(data, FileBody):
+            if "content-length" not in headers:
+                headers.set("Content-Length", str(data.length))
+        elif isinstance(data, bytes):
+            if "content-length" not in headers:
+                headers.set("Content-Length", str(len(data)))
+        else:
+            chunked, size, close = setup_stream_framing(headers, chunked_allowed)
+            return iter_stream_body(data, chunked, size), close
+        return None, False
+
+    async def _send_file(
+        self,
+        writer,  # type: asyncio.StreamWriter
+        body,  # type: FileBody
+        throttle=None,  # type: None | Throttle
+    ):
+        # type: (...) -> None
+        length = body.length or 0
+        spans = (
+            throttle.iter_spans(length) if throttle else [(0.0, 0, length)]
+        )  # type: Iterable[tuple[float, int, int]]
+        # The uvloop event loop does not implement sendfile()
+        sendfile = getattr(self.loop, "sendfile", None)
+        await writer.drain()
+        for wait, start, end in spans:
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if sendfile is None:
+                for chunk in body.iter_chunks(start=start, count=end - start):
+                    writer.write(chunk)
+                    await writer.drain()
+            elif end > start:
+                await sendfile(
+                    writer.transport, body.file, body.offset + start, end - start
+                )
+
+    async def _write_paced(
+        self,
+        writer,  # type: asyncio.StreamWriter
+        data,  # type: bytes
+        throttle=None,  # type: None | Throttle
+    ):
+        # type: (...) -> None
+        """Write data and wait until client reads it if transport buffer is full."""
+        if throttle is None:
+            writer.write(data)
+            await writer.drain()
+            return
+        for wait, start, end in throttle.iter_spans(len(data)):
+            if wait > 0:
+                await asyncio.sleep(wait)
+            writer.write(data[start:end])
+            await writer.drain()
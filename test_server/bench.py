@@ -0,0 +1,375 @@
+"""Benchmark of test server throughput and latency.
+
+The benchmark starts local TestServer and sends requests to it from
+multiple client threads. Results could be saved into JSON file and compared
+with results of other version later.
+
+Usage:
+    python -m test_server.bench --concurrency 8 --requests 5000 --keep-alive
+    python -m test_server.bench --save baseline.json
+    python -m test_server.bench --compare baseline.json
+"""
+
+# from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from threading import Lock, Thread
+from typing import Any
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Iterator, Mapping, Sequence
+from six.moves.http_client import HTTPConnection
+
+# pylint: enable=import-error
+from .const import TEST_SERVER_PACKAGE_VERSION
+from .server import VALID_ENGINES, Response, TestServer
+
+__all__ = ["main", "percentile", "run_benchmark"]
+RESPONSE_TYPES = ["static", "callback", "stream", "file"]  # type: list[str]
+# Size of chunks produced by streamed response
+STREAM_CHUNK_SIZE = 4096  # type: int
+PERCENTILES = [50, 99, 99.9]  # type: list[float]
+CLIENT_TIMEOUT = 10  # type: float
+
+
+def percentile(
+    values,  # type: Sequence[float]
+    pct,  # type: float
+):
+    # type: (...) -> float
+    """Return percentile of sorted values using nearest-rank method."""
+    if not values:
+        return 0.0
+    rank = int(-(-pct * len(values) // 100))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def format_percentile(
+    pct,  # type: float
+):
+    # type: (...) -> str
+    return "p" + "{:g}".format(pct).replace(".", "")
+
+
+def iter_stream(
+    size,  # type: int
+):
+    # type: (...) -> Iterator[bytes]
+    chunk = b"x" * STREAM_CHUNK_SIZE
+    for start in range(0, size, STREAM_CHUNK_SIZE):
+        yield chunk[: min(STREAM_CHUNK_SIZE, size - start)]
+
+
+def create_response(
+    response_type,  # type: str
+    response_size,  # type: int
+    file_path=None,  # type: None | str
+):
+    # type: (...) -> Response
+    data = b"x" * response_size
+    if response_type == "callback":
+        return Response(callback=lambda: {"type": "response", "data": data})
+    if response_type == "stream":
+        # New iterator is needed for each response
+        return Response(
+            callback=lambda: {"type": "response", "data": iter_stream(response_size)}
+        )
+    if response_type == "file":
+        return Response(file=file_path)
+    return Response(data=data)
+
+
+class ClientStats(object):
+    """Latencies and errors collected by client threads."""
+
+    def __init__(self):
+        # type: () -> None
+        self.latencies = []  # type: list[float]
+        self.errors = 0
+        self._lock = Lock()
+
+    def add(
+        self,
+        latencies,  # type: list[float]
+        errors,  # type: int
+    ):
+        # type: (...) -> None
+        with self._lock:
+            self.latencies.extend(latencies)
+            self.errors += errors
+
+
+def run_client(  # noqa: PLR0913, PLR0917
+    address,  # type: str
+    port,  # type: int
+    num_requests,  # type: int
+    keep_alive,  # type: bool
+    body,  # type: bytes
+    stats,  # type: ClientStats
+):
+    # type: (...) -> None
+    """Send requests one by one and measure time of each of them."""
+    latencies = []  # type: list[float]
+    errors = 0
+    method = "POST" if body else "GET"
+    conn = None  # type: None | HTTPConnection
+    for _ in range(num_requests):
+        start = time.time()
+        try:
+            if conn is None:
+                conn = HTTPConnection(address, port, timeout=CLIENT_TIMEOUT)
+            conn.request(method, "/", body=body or None)
+            res = conn.getresponse()
+            res.read()
+            if res.status != 200:  # noqa: PLR2004
+                errors += 1
+        except Exception:  # noqa: BLE001
+            errors += 1
+            conn = None
+            continue
+        latencies.append(time.time() - start)
+        if not keep_alive:
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+    stats.add(latencies, errors)
+
+
+def run_clients(
+    server,  # type: TestServer
+    requests,  # type: int
+    concurrency,  # type: int
+    keep_alive,  # type: bool
+    body_size,  # type: int
+):
+    # type: (...) -> dict[str, Any]
+    """Send requests to the server from client threads and return results."""
+    stats = ClientStats()
+    body = b"x" * body_size
+    threads = [
+        Thread(
+            target=run_client,
+            args=(
+                server.address,
+                server.port,
+                requests // concurrency + (idx < requests % concurrency),
+                keep_alive,
+                body,
+                stats,
+            ),
+        )
+        for idx in range(concurrency)
+    ]
+    start = time.time()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.time() - start
+    latencies = sorted(stats.latencies)
+    results = {
+        "elapsed": elapsed,
+        "errors": stats.errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+    }  # type: dict[str, Any]
+    for pct in PERCENTILES:
+        results[format_percentile(pct)] = percentile(latencies, pct)
+    return results
+
+
+def run_benchmark(  # noqa: PLR0913, PLR0917 # pylint: disable=too-many-arguments
+    requests=1000,  # type: int
+    concurrency=4,  # type: int
+    keep_alive=False,  # type: bool
+    body_size=0,  # type: int
+    response_size=100,  # type: int
+    response_type="static",  # type: str
+    engine="threading",  # type: str
+    max_workers=None,  # type: None | int
+    workers=None,  # type: None | int
+):
+    # type: (...) -> dict[str, Any]
+    """Run benchmark and return its configuration and results.
+
+    Args:
+        requests: total number of requests
+        concurrency: number of client threads, each one sends requests
+            one after another
+        keep_alive: reuse connection for subsequent requests of client
+        body_size: size of request body, requests with body are sent
+            with POST method
+        response_size: size of response body
+        response_type: "static" is response with data, "callback" builds
+            data in callback, "stream" sends data produced by iterable,
+            "file" sends the file
+        engine: server engine
+        max_workers: number of server threads (threading engine)
+        workers: number of server processes
+    """
+    if response_type not in RESPONSE_TYPES:
+        raise ValueError("Invalid response type: {}".format(response_type))
+    config = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "keep_alive": keep_alive,
+        "body_size": body_size,
+        "response_size": response_size,
+        "response_type": response_type,
+        "engine": engine,
+        "max_workers": max_workers,
+        "workers": workers,
+    }  # type: dict[str, Any]
+    file_path = None
+    if response_type == "file":
+        with tempfile.NamedTemporaryFile(delete=False) as out:
+            out.write(b"x" * response_size)
+            file_path = out.name
+    server = TestServer(
+        protocol_version="HTTP/1.1" if keep_alive else "HTTP/1.0",
+        keep_alive_max_requests=None,
+        engine=engine,
+        max_workers=max_workers,
+        workers=workers,
+        max_logged_requests=1,
+        access_log=False,
+    )
+    # Response must be added before worker processes are forked
+    server.add_response(
+        create_response(response_type, response_size, file_path), count=-1
+    )
+    server.start()
+    try:
+        results = run_clients(server, requests, concurrency, keep_alive, body_size)
+    finally:
+        server.stop()
+        if file_path:
+            os.unlink(file_path)
+    return {
+        "version": TEST_SERVER_PACKAGE_VERSION,
+        "python": platform.python_version(),
+        "config": config,
+        "results": results,
+    }
+
+
+def format_results(
+    report,  # type: Mapping[str, Any]
+):
+    # type: (...) -> list[str]
+    results = report["results"]
+    lines = [
+        "requests/s: {:.1f}".format(results["rps"]),
+        "errors: {}".format(results["errors"]),
+    ]
+    lines.extend(
+        "{}: {:.2f} ms".format(key, results[key] * 1000)
+        for key in (format_percentile(pct) for pct in PERCENTILES)
+    )
+    return lines
+
+
+def compare_reports(
+    report,  # type: Mapping[str, Any]
+    baseline,  # type: Mapping[str, Any]
+):
+    # type: (...) -> tuple[list[str], float]
+    """Compare results with baseline.
+
+    Returns:
+        Tuple of (report lines, throughput change in percents).
+    """
+    lines = [
+        "baseline: test_server {}, python {}".format(
+            baseline.get("version"), baseline.get("python")
+        )
+    ]
+    if baseline.get("config") != report["config"]:
+        lines.append("warning: baseline was measured with different options")
+    change = 0.0
+    for key in ["rps"] + [format_percentile(pct) for pct in PERCENTILES]:
+        old, new = baseline["results"][key], report["results"][key]
+        diff = (new - old) * 100.0 / old if old else 0.0
+        if key == "rps":
+            change = diff
+            lines.append(
+                "requests/s: {:.1f} -> {:.1f} ({:+.1f}%)".format(old, new, diff)
+            )
+        else:
+            lines.append(
+                "{}: {:.2f} -> {:.2f} ms ({:+.1f}%)".format(
+                    key, old * 1000, new * 1000, diff
+                )
+            )
+    return lines, change
+
+
+def build_parser():
+    # type: () -> argparse.ArgumentParser
+    parser = argparse.ArgumentParser(
+        prog="python -m test_server.bench",
+        description="Measure throughput and latency of test server",
+    )
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("-k", "--keep-alive", action="store_true")
+    parser.add_argument("--body-size", type=int, default=0)
+    parser.add_argument("--response-size", type=int, default=100)
+    parser.add_argument("--response-type", choices=RESPONSE_TYPES, default="static")
+    parser.add_argument("--engine", choices=VALID_ENGINES, default="threading")
+    parser.add_argument("--max-workers", type=int, help="number of server threads")
+    parser.add_argument("--workers", type=int, help="number of server processes")
+    parser.add_argument("--save", metavar="PATH", help="save results to JSON file")
+    parser.add_argument(
+        "--compare", metavar="PATH", help="compare results with JSON file"
+    )
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        metavar="PERCENT",
+        help="exit with error if throughput is lower than baseline by more percents",
+    )
+    return parser
+
+
+def main(
+    argv=None,  # type: None | Sequence[str]
+):
+    # type: (...) -> int
+    opts = build_parser().parse_args(argv)
+    report = run_benchmark(
+        requests=opts.requests,
+        concurrency=opts.concurrency,
+        keep_alive=opts.keep_alive,
+        body_size=opts.body_size,
+        response_size=opts.response_size,
+        response_type=opts.response_type,
+        engine=opts.engine,
+        max_workers=opts.max_workers,
+        workers=opts.workers,
+    )
+    for line in format_results(report):
+        sys.stdout.write(line + "\n")
+    if opts.save:
+        with open(opts.save, "wb") as out:  # noqa: PTH123
+            out.write(json.dumps(report, indent=2, sort_keys=True).encode("utf-8"))
+    if opts.compare:
+        with open(opts.compare, "rb") as inp:  # noqa: PTH123
+            baseline = json.loads(inp.read().decode("utf-8"))
+        lines, change = compare_reports(report, baseline)
+        for line in lines:
+            sys.stdout.write(line + "\n")
+        if opts.max_regression is not None and change < -opts.max_regression:
+            sys.stdout.write("throughput regression: {:.1f}%\n".format(-change))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+# from __future__ import annotations
+
+import tempfile
+from io import BufferedIOBase, BytesIO
+from typing import IO
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Iterator
+
+# pylint: enable=import-error
+
+__all__ = ["RequestBody", "is_chunked", "read_body", "read_chunked_body"]
+DEFAULT_SPOOL_THRESHOLD = 1024 * 1024  # type: int
+READ_CHUNK_SIZE = 64 * 1024  # type: int
+MAX_LINE_SIZE = 65536  # type: int
+MAX_TRAILERS = 100  # type: int
+
+
+class RequestBody(object):
+    """Body of HTTP request stored in memory or in temporary file.
+
+    Bodies larger than spool threshold are written to temporary file
+    while they are received so large uploads do not consume memory.
+    """
+
+    __slots__ = ["_data", "_file", "size"]
+
+    def __init__(
+        self,
+        data=b"",  # type: bytes
+    ):
+        # type: (...) -> None
+        self._data = data
+        self._file = None  # type: None | IO[bytes]
+        self.size = len(data)
+
+    @classmethod
+    def create_spooled(  # noqa: ANN206
+        cls,
+        spool_threshold,  # type: None | int
+    ):
+        # type: (...) -> RequestBody
+        """Create empty body to be filled with write() calls.
+
+        The body is moved to disk once it exceeds the threshold.
+        None threshold means the body is always kept in memory.
+        """
+        body = cls()
+        if spool_threshold is not None:
+            # pylint: disable=consider-using-with
+            body._file = tempfile.SpooledTemporaryFile(  # noqa: SIM115
+                max_size=spool_threshold
+            )
+            # pylint: enable=consider-using-with
+        return body
+
+    def write(
+        self,
+        data,  # type: bytes
+    ):
+        # type: (...) -> None
+        if self._file is None:
+            self._file = BytesIO(self._data)
+            self._file.seek(0, 2)
+            self._data = b""
+        self._file.write(data)
+        self.size += len(data)
+
+    @property
+    def in_memory(self):
+        # type: () -> bool
+        """Return False if the body has been written to disk."""
+        if self._file is None:
+            return True
+        return not getattr(self._file, "_rolled", False)
+
+    def getvalue(self):
+        # type: () -> bytes
+        """Return whole body as bytes, reading it from disk if necessary."""
+        if self._file is None:
+            return self._data
+        self._file.seek(0)
+        return self._file.read()
+
+    def open(self):
+        # type: () -> IO[bytes]
+        """Return file object to read the body from start.
+
+        For spooled body the same file object is returned each time.
+        """
+        if self._file is None:
+            return BytesIO(self._data)
+        self._file.seek(0)
+        return self._file
+
+    def iter_chunks(
+        self,
+        chunk_size=READ_CHUNK_SIZE,  # type: int
+    ):
+        # type: (...) -> Iterator[bytes]
+        """Iterate over body data in chunks without loading it to memory."""
+        fobj = self.open()
+        while True:
+            chunk = fobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        # type: () -> None
+        if self._file is not None:
+            self._file.close()
+
+
+def read_body(
+    rfile,  # type: BufferedIOBase
+    length,  # type: int
+    spool_threshold=None,  # type: None | int
+):
+    # type: (...) -> RequestBody
+    """Read body of given length from the stream.
+
+    Body larger than spool_threshold is read in chunks into temporary file.
+    """
+    if spool_threshold is None or length <= spool_threshold:
+        return RequestBody(rfile.read(length))
+    body = RequestBody.create_spooled(spool_threshold)
+    remaining = length
+    while remaining > 0:
+        chunk = rfile.read(min(remaining, READ_CHUNK_SIZE))
+        if not chunk:
+            break
+        body.write(chunk)
+        remaining -= len(chunk)
+    return body
+
+
+def parse_chunk_size(
+    line,  # type: bytes
+):
+    # type: (...) -> int
+    """Parse size line of chunked transfer encoding, chunk extensions are ignored."""
+    size_str = line.split(b";", 1)[0].strip()
+    try:
+        size = int(size_str, 16)
+    except ValueError:
+        raise ValueError("Invalid chunk size: {!r}".format(size_str))
+    if size < 0:
+        raise ValueError("Invalid chunk size: {!r}".format(size_str))
+    return size
+
+
+def parse_trailer_line(
+    line,  # type: bytes
+):
+    # type: (...) -> tuple[str, str]
+    key, sep, val = line.decode("iso-8859-1").partition(":")
+    if not sep:
+        raise ValueError("Invalid trailer line: {!r}".format(line))
+    return key.strip(), val.strip()
+
+
+def add_trailer(
+    trailers,  # type: list[tuple[str, str]]
+    line,  # type: bytes
+):
+    # type: (...) -> None
+    if len(trailers) >= MAX_TRAILERS:
+        raise ValueError("Too many trailers in chunked body")
+    trailers.append(parse_trailer_line(line))
+
+
+def read_line(
+    rfile,  # type: BufferedIOBase
+):
+    # type: (...) -> bytes
+    line = rfile.readline(MAX_LINE_SIZE + 1)
+    if len(line) > MAX_LINE_SIZE:
+        raise ValueError("Line of chunked body is too long")
+    if not line.endswith(b"\n"):
+        raise ValueError("Chunked body is incomplete")
+    return line
+
+
+def read_chunked_body(
+    rfile,  # type: BufferedIOBase
+    spool_threshold=None,  # type: None | int
+):
+    # type: (...) -> tuple[RequestBody, list[tuple[str, str]]]
+    """Read and decode body sent with chunked transfer encoding.
+
+    Decoded data is written into body which is moved to disk once it exceeds
+    spool_threshold.
+
+    Returns:
+        Tuple of body and list of trailer headers.
+    """
+    body = RequestBody.create_spooled(spool_threshold)
+    while True:
+        remaining = parse_chunk_size(read_line(rfile))
+        if not remaining:
+            break
+        while remaining > 0:
+            data = rfile.read(min(remaining, READ_CHUNK_SIZE))
+            if not data:
+                raise ValueError("Chunked body is incomplete")
+            body.write(data)
+            remaining -= len(data)
+        if read_line(rfile).strip():
+            raise ValueError("Chunk data is not followed by line break")
+    trailers = []  # type: list[tuple[str, str]]
+    while True:
+        line = read_line(rfile)
+        if not line.strip():
+            break
+        add_trailer(trailers, line)
+    return body, trailers
+
+
+def is_chunked(
+    transfer_encoding,  # type: str
+):
+    # type: (...) -> bool
+    """Check if the last transfer coding applied to body is chunked."""
+    return transfer_encoding.lower().split(",")[-1].strip() == "chunked"
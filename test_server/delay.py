@@ -0,0 +1,170 @@
+"""Distributions of response delays.
+
+An instance of Delay could be passed to Response(sleep=...), then the delay
+of each response is drawn from the distribution independently.
+"""
+
+# from __future__ import annotations
+
+import math
+import random
+from bisect import bisect_right
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Mapping
+
+# pylint: enable=import-error
+
+__all__ = [
+    "Delay",
+    "EmpiricalDelay",
+    "FixedDelay",
+    "LogNormalDelay",
+    "UniformDelay",
+    "resolve_delay",
+]
+
+
+class Delay(object):
+    """Base class of delay distributions.
+
+    Args:
+        rng: random generator, pass random.Random(seed) to get reproducible
+            sequence of delays
+    """
+
+    def __init__(
+        self,
+        rng=None,  # type: None | random.Random
+    ):
+        # type: (...) -> None
+        self.rng = rng or random.Random()  # noqa: S311
+
+    def sample(self):
+        # type: () -> float
+        """Return delay in seconds."""
+        raise NotImplementedError
+
+
+class FixedDelay(Delay):
+    def __init__(
+        self,
+        seconds,  # type: float
+    ):
+        # type: (...) -> None
+        Delay.__init__(self)
+        if seconds < 0:
+            raise ValueError("Delay must not be negative")
+        self.seconds = seconds
+
+    def sample(self):
+        # type: () -> float
+        return self.seconds
+
+
+class UniformDelay(Delay):
+    def __init__(
+        self,
+        low,  # type: float
+        high,  # type: float
+        rng=None,  # type: None | random.Random
+    ):
+        # type: (...) -> None
+        Delay.__init__(self, rng)
+        if low < 0 or high < low:
+            raise ValueError("Invalid delay range: {}..{}".format(low, high))
+        self.low = low
+        self.high = high
+
+    def sample(self):
+        # type: () -> float
+        return self.rng.uniform(self.low, self.high)
+
+
+class LogNormalDelay(Delay):
+    """Log-normal distribution defined by its median and shape.
+
+    Args:
+        median: median delay in seconds
+        sigma: standard deviation of delay logarithm, the larger it is
+            the longer the tail of distribution
+        max_delay: optional upper limit of delay
+    """
+
+    def __init__(
+        self,
+        median,  # type: float
+        sigma,  # type: float
+        max_delay=None,  # type: None | float
+        rng=None,  # type: None | random.Random
+    ):
+        # type: (...) -> None
+        Delay.__init__(self, rng)
+        if median <= 0 or sigma < 0:
+            raise ValueError("Median must be positive and sigma must not be negative")
+        self.median = median
+        self.sigma = sigma
+        self.max_delay = max_delay
+
+    def sample(self):
+        # type: () -> float
+        value = self.rng.lognormvariate(math.log(self.median), self.sigma)
+        if self.max_delay is not None:
+            return min(value, self.max_delay)
+        return value
+
+
+class EmpiricalDelay(Delay):
+    """Distribution defined by percentiles of observed latency.
+
+    Delay is interpolated linearly between given percentiles. Delays below
+    the lowest percentile are equal to its value, the same is for delays above
+    the highest percentile.
+
+    Example:
+        EmpiricalDelay({50: 0.01, 90: 0.05, 99: 0.2, 99.9: 1.0})
+    """
+
+    def __init__(
+        self,
+        percentiles,  # type: Mapping[float, float]
+        rng=None,  # type: None | random.Random
+    ):
+        # type: (...) -> None
+        Delay.__init__(self, rng)
+        if not percentiles:
+            raise ValueError("Percentiles are empty")
+        points = sorted(percentiles.items())
+        prev_value = 0.0
+        for pct, value in points:
+            if not 0 <= pct <= 100:  # noqa: PLR2004
+                raise ValueError("Invalid percentile: {}".format(pct))
+            if value < prev_value:
+                raise ValueError("Delays must not decrease with percentile")
+            prev_value = value
+        self._pcts = [item[0] for item in points]
+        self._values = [item[1] for item in points]
+
+    def sample(self):
+        # type: () -> float
+        pct = self.rng.random() * 100
+        idx = bisect_right(self._pcts, pct)
+        if idx == 0:
+            return self._values[0]
+        if idx == len(self._pcts):
+            return self._values[-1]
+        low_pct, high_pct = self._pcts[idx - 1], self._pcts[idx]
+        low, high = self._values[idx - 1], self._values[idx]
+        return low + (high - low) * (pct - low_pct) / (high_pct - low_pct)
+
+
+def resolve_delay(
+    sleep,  # type: None | float | Delay
+):
+    # type: (...) -> float
+    """Return delay in seconds for value of Response.sleep attribute."""
+    if sleep is None:
+        return 0.0
+    if isinstance(sleep, Delay):
+        return sleep.sample()
+    return sleep
@@ -0,0 +1,332 @@
+# from __future__ import annotations
+
+import re
+from collections import deque
+from threading import Lock
+from typing import Any, Pattern, cast
+
+# pylint: disable=import-error,unused-import
+from six.moves.collections_abc import Iterable, Mapping
+
+# pylint: enable=import-error,unused-import
+from six.moves.urllib.parse import parse_qsl
+
+from .error import NoResponseError
+
+__all__ = ["ResponseDispatcher"]
+# Flags of path regular expression which could be applied to its group
+# in combined regular expression
+SCOPED_FLAGS = [
+    (re.IGNORECASE, "i"),
+    (re.MULTILINE, "m"),
+    (re.DOTALL, "s"),
+    (re.VERBOSE, "x"),
+]  # type: list[tuple[int, str]]
+
+
+class ResponseItem(object):
+    __slots__ = ["args", "count", "headers", "response"]
+
+    def __init__(
+        self,
+        response,  # type: Any
+        count,  # type: int
+        headers=None,  # type: None | Mapping[str, str]
+        args=None,  # type: None | Mapping[str, str]
+    ):
+        # type: (...) -> None
+        self.response = response
+        # -1 means the response is never exhausted
+        self.count = count
+        # Lower-cased header names
+        self.headers = (
+            {key.lower(): val for key, val in headers.items()} if headers else None
+        )
+        self.args = dict(args) if args else None
+
+
+class RequestInfo(object):
+    """Request properties used to select response.
+
+    Header and query arguments mappings are built only if some response
+    is filtered by them.
+    """
+
+    __slots__ = ["_args", "_headers", "_raw_headers", "method", "path", "query"]
+
+    def __init__(
+        self,
+        method,  # type: str
+        target,  # type: str
+        headers,  # type: None | Iterable[tuple[str, str]]
+    ):
+        # type: (...) -> None
+        self.method = method
+        self.path, _, self.query = target.partition("?")
+        self._raw_headers = headers
+        self._headers = None  # type: None | dict[str, str]
+        self._args = None  # type: None | dict[str, str]
+
+    @property
+    def headers(self):
+        # type: () -> dict[str, str]
+        if self._headers is None:
+            self._headers = {
+                key.lower(): val for key, val in (self._raw_headers or [])
+            }
+        return self._headers
+
+    @property
+    def args(self):
+        # type: () -> dict[str, str]
+        if self._args is None:
+            self._args = dict(parse_qsl(self.query))
+        return self._args
+
+
+class Route(object):
+    __slots__ = ["filtered", "queues"]
+
+    def __init__(self):
+        # type: () -> None
+        # HTTP method -> queue, the None key is for any method
+        self.queues = {}  # type: dict[None | str, deque[ResponseItem]]
+        # Same for responses with headers or args conditions
+        self.filtered = {}  # type: dict[None | str, deque[ResponseItem]]
+
+    def add(
+        self,
+        method,  # type: None | str
+        items,  # type: list[ResponseItem]
+    ):
+        # type: (...) -> None
+        if items and (items[0].headers or items[0].args):
+            self.filtered.setdefault(method, deque()).extend(items)
+        else:
+            self.queues.setdefault(method, deque()).extend(items)
+
+    def take(
+        self,
+        info,  # type: RequestInfo
+    ):
+        # type: (...) -> None | Any
+        for key in (info.method, None):
+            queue = self.filtered.get(key)
+            if queue:
+                for idx, item in enumerate(queue):
+                    if item_matches(item, info):
+                        return consume_item(queue, idx)
+            queue = self.queues.get(key)
+            if queue:
+                return consume_item(queue, 0)
+        return None
+
+
+def consume_item(
+    queue,  # type: deque[ResponseItem]
+    idx,  # type: int
+):
+    # type: (...) -> Any
+    item = queue[idx]
+    if item.count != -1:
+        item.count -= 1
+        if item.count < 1:
+            del queue[idx]
+    return item.response
+
+
+def item_matches(
+    item,  # type: ResponseItem
+    info,  # type: RequestInfo
+):
+    # type: (...) -> bool
+    if item.headers:
+        req_headers = info.headers
+        for key, val in item.headers.items():
+            if req_headers.get(key) != val:
+                return False
+    if item.args:
+        req_args = info.args
+        for key, val in item.args.items():
+            if req_args.get(key) != val:
+                return False
+    return True
+
+
+def scope_flags(
+    regex,  # type: Pattern[str]
+):
+    # type: (...) -> str
+    """Return the pattern with flags of regex applied to it inline.
+
+    Raises:
+        re.error: the regex has flags which could not be scoped
+    """
+    flags = regex.flags & ~re.UNICODE
+    letters = ""
+    for flag, letter in SCOPED_FLAGS:
+        if flags & flag:
+            letters += letter
+            flags &= ~flag
+    if flags:
+        raise re.error("Flags could not be scoped: {}".format(flags))
+    return "(?{}:{})".format(letters, regex.pattern) if letters else regex.pattern
+
+
+class ResponseDispatcher(object):
+    """Thread-safe storage of responses scheduled by TestServer.add_response().
+
+    Responses are grouped into routes: routes for exact paths stored in dict,
+    routes for path regular expressions and the default route for any path.
+    Each route contains FIFO queues, one queue per HTTP method plus
+    the queue of responses for any method. Responses with headers or args
+    conditions are checked before responses without conditions.
+
+    All path regular expressions are compiled into one regular expression
+    so the route is found with single match operation.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._lock = Lock()
+        self._default = Route()
+        self._exact = {}  # type: dict[str, Route]
+        self._patterns = []  # type: list[tuple[Pattern[str], Route]]
+        # Combined regexp and map of its outer group indexes to pattern indexes
+        self._combined = None  # type: None | Pattern[str]
+        self._group_index = {}  # type: dict[int, int]
+        self._combined_outdated = False
+
+    def _get_route(
+        self,
+        path=None,  # type: None | str
+        path_regex=None,  # type: None | str | Pattern[str]
+    ):
+        # type: (...) -> Route
+        if path is not None:
+            return self._exact.setdefault(path, Route())
+        if path_regex is not None:
+            regex = re.compile(path_regex)
+            for item_regex, route in self._patterns:
+                if item_regex == regex:
+                    return route
+            route = Route()
+            self._patterns.append((regex, route))
+            self._combined_outdated = True
+            return route
+        return self._default
+
+    def _compile_patterns(self):
+        # type: () -> None
+        self._combined_outdated = False
+        parts = []
+        self._group_index = {}
+        group = 1
+        try:
+            for idx, (regex, _route) in enumerate(self._patterns):
+                parts.append("({})".format(scope_flags(regex)))
+                self._group_index[group] = idx
+                group += regex.groups + 1
+            self._combined = re.compile("|".join(parts))
+        except re.error:
+            # Patterns could not be combined e.g. due to duplicate group names,
+            # numeric back references or flags which could not be scoped
+            self._combined = None
+            self._group_index = {}
+
+    def _find_pattern_index(
+        self,
+        path,  # type: str
+    ):
+        # type: (...) -> None | int
+        if self._combined_outdated:
+            self._compile_patterns()
+        if self._combined is not None:
+            match = self._combined.match(path)
+            if match is None:
+                return None
+            return self._group_index[cast(int, match.lastindex)]
+        for idx, (regex, _route) in enumerate(self._patterns):
+            if regex.match(path):
+                return idx
+        return None
+
+    def add(
+        self,
+        response,  # type: Any
+        count=1,  # type: int
+        method=None,  # type: None | str
+        path=None,  # type: None | str
+        path_regex=None,  # type: None | str | Pattern[str]
+        headers=None,  # type: None | Mapping[str, str]
+        args=None,  # type: None | Mapping[str, str]
+    ):
+        # type: (...) -> None
+        self.extend([response], count, method, path, path_regex, headers, args)
+
+    def extend(
+        self,
+        responses,  # type: Iterable[Any]
+        count=1,  # type: int
+        method=None,  # type: None | str
+        path=None,  # type: None | str
+        path_regex=None,  # type: None | str | Pattern[str]
+        headers=None,  # type: None | Mapping[str, str]
+        args=None,  # type: None | Mapping[str, str]
+    ):
+        # type: (...) -> None
+        items = [ResponseItem(resp, count, headers, args) for resp in responses]
+        with self._lock:
+            self._get_route(path, path_regex).add(method, items)
+
+    def get(
+        self,
+        method,  # type: str
+        target="/",  # type: str
+        headers=None,  # type: None | Iterable[tuple[str, str]]
+    ):
+        # type: (...) -> Any
+        """Take next response for given request.
+
+        Args:
+            method: lower-cased HTTP method
+            target: request path with optional query string
+            headers: request headers as sequence of (name, value) pairs
+
+        Raises:
+            NoResponseError: if no response is available
+        """
+        info = RequestInfo(method, target, headers)
+        with self._lock:
+            route = self._exact.get(info.path)
+            if route is not None:
+                resp = route.take(info)
+                if resp is not None:
+                    return resp
+            if self._patterns:
+                resp = self._take_from_patterns(info)
+                if resp is not None:
+                    return resp
+            resp = self._default.take(info)
+            if resp is not None:
+                return resp
+        raise NoResponseError("No response available")
+
+    def _take_from_patterns(
+        self,
+        info,  # type: RequestInfo
+    ):
+        # type: (...) -> None | Any
+        first_idx = self._find_pattern_index(info.path)
+        if first_idx is None:
+            return None
+        resp = self._patterns[first_idx][1].take(info)
+        if resp is not None:
+            return resp
+        # First matching route has no suitable response, check other routes
+        for regex, route in self._patterns[first_idx + 1 :]:
+            if regex.match(info.path):
+                resp = route.take(info)
+                if resp is not None:
+                    return resp
+        return None
@@ -0,0 +1,163 @@
+# from __future__ import annotations
+
+import mmap
+import os
+import socket
+from typing import IO, Union, cast
+
+import six
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Iterator
+
+# pylint: enable=import-error
+from .body import READ_CHUNK_SIZE
+
+__all__ = ["FileBody"]
+# pylint: disable=consider-alternative-union-syntax
+FileSource = Union[str, IO[bytes]]
+# pylint: enable=consider-alternative-union-syntax
+
+
+def get_file_size(
+    fobj,  # type: IO[bytes]
+):
+    # type: (...) -> int
+    try:
+        return os.fstat(fobj.fileno()).st_size
+    except (OSError, ValueError, AttributeError):
+        # File object is not backed by OS file
+        pos = fobj.tell()
+        fobj.seek(0, 2)
+        size = fobj.tell()
+        fobj.seek(pos)
+        return size
+
+
+class FileBody(object):
+    """Response body which is sent from file.
+
+    The file is sent with sendfile system call if the platform supports it,
+    otherwise the file is mapped into memory and sent by chunks.
+
+    The source could be a path or a binary file object. A file specified
+    by path is opened for each response so many clients could download
+    it in parallel.
+    """
+
+    __slots__ = ["_file", "_owned", "length", "offset", "source"]
+
+    def __init__(
+        self,
+        source,  # type: FileSource
+        offset=0,  # type: int
+        length=None,  # type: None | int
+    ):
+        # type: (...) -> None
+        if offset < 0:
+            raise ValueError("File offset must not be negative")
+        if length is not None and length < 0:
+            raise ValueError("File length must not be negative")
+        self.source = source
+        self.offset = offset
+        self.length = length
+        self._file = None  # type: None | IO[bytes]
+        self._owned = False
+
+    def open(self):
+        # type: () -> int
+        """Open the file and calculate size of body.
+
+        Returns:
+            Number of bytes to send.
+        """
+        if isinstance(self.source, six.string_types):
+            # pylint: disable=consider-using-with
+            self._file = open(self.source, "rb")  # noqa: SIM115, PTH123
+            # pylint: enable=consider-using-with
+            self._owned = True
+        else:
+            self._file = cast(IO[bytes], self.source)
+        file_size = get_file_size(self._file)
+        if self.offset > file_size:
+            raise ValueError("File offset is beyond the end of file")
+        available = file_size - self.offset
+        if self.length is None:
+            self.length = available
+        elif self.length > available:
+            raise ValueError("File length is beyond the end of file")
+        return self.length
+
+    @property
+    def file(self):
+        # type: () -> IO[bytes]
+        if self._file is None:
+            raise ValueError("File body is not opened")
+        return self._file
+
+    def close(self):
+        # type: () -> None
+        if self._owned and self._file is not None:
+            self._file.close()
+        self._file = None
+
+    def sendfile(
+        self,
+        sock,  # type: socket.socket
+        start=0,  # type: int
+        count=None,  # type: None | int
+    ):
+        # type: (...) -> None
+        """Send the body or its part to socket.
+
+        Args:
+            sock: socket to send data to
+            start: position of the part relative to start of the body
+            count: size of the part, by default the body is sent till its end
+        """
+        if count is None:
+            count = (self.length or 0) - start
+        if count and hasattr(sock, "sendfile"):
+            # Falls back to send() if os.sendfile could not be used
+            sock.sendfile(self.file, self.offset + start, count)
+        else:
+            for chunk in self.iter_chunks(start=start, count=count):
+                sock.sendall(chunk)
+
+    def iter_chunks(
+        self,
+        chunk_size=READ_CHUNK_SIZE,  # type: int
+        start=0,  # type: int
+        count=None,  # type: None | int
+    ):
+        # type: (...) -> Iterator[bytes]
+        """Iterate over body data mapping the file into memory if possible.
+
+        The start and count arguments select the part of the body like
+        in sendfile() method.
+        """
+        if count is None:
+            count = (self.length or 0) - start
+        begin = self.offset + start
+        end = begin + count
+        if begin == end:
+            return
+        try:
+            mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError, AttributeError):  # noqa: UP024
+            # File object is not backed by OS file or could not be mapped
+            fobj = self.file
+            fobj.seek(begin)
+            remaining = count
+            while remaining > 0:
+                chunk = fobj.read(min(remaining, chunk_size))
+                if not chunk:
+                    raise ValueError("File has been truncated while sending it")
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            try:
+                for pos in range(begin, end, chunk_size):
+                    yield mapped[pos : min(pos + chunk_size, end)]
+            finally:
+                mapped.close()
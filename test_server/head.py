@@ -0,0 +1,137 @@
+# from __future__ import annotations
+
+from io import BufferedIOBase
+
+from .body import MAX_LINE_SIZE
+from .structure import HttpHeaderStorage
+
+__all__ = [
+    "BadRequestError",
+    "HeaderTooLargeError",
+    "header_value",
+    "parse_header_block",
+    "parse_request_head",
+    "parse_request_line",
+    "read_header_block",
+]
+MAX_HEADERS = 100  # type: int
+MAX_VERSION_COMPONENT_SIZE = 10  # type: int
+
+
+class BadRequestError(Exception):
+    """Request head is malformed, the status is sent in response."""
+
+    status = 400
+
+
+class HeaderTooLargeError(BadRequestError):
+    status = 431
+
+
+class VersionNotSupportedError(BadRequestError):
+    status = 505
+
+
+def parse_http_version(
+    version,  # type: str
+):
+    # type: (...) -> tuple[int, int]
+    """Parse HTTP version like BaseHTTPRequestHandler.parse_request does."""
+    error = BadRequestError("Bad request version ({!r})".format(version))
+    if not version.startswith("HTTP/"):
+        raise error
+    components = version[5:].split(".")
+    if len(components) != 2 or any(  # noqa: PLR2004
+        not comp.isdigit() or len(comp) > MAX_VERSION_COMPONENT_SIZE
+        for comp in components
+    ):
+        raise error
+    major, minor = int(components[0]), int(components[1])
+    if major >= 2:  # noqa: PLR2004
+        raise VersionNotSupportedError("Invalid HTTP version ({})".format(version))
+    return major, minor
+
+
+def parse_request_line(
+    line,  # type: str
+):
+    # type: (...) -> tuple[str, str, str]
+    """Parse request line.
+
+    Returns:
+        Tuple of method, request target and HTTP version.
+    """
+    words = line.split()
+    if len(words) != 3:  # noqa: PLR2004
+        raise BadRequestError("Bad request syntax ({!r})".format(line))
+    parse_http_version(words[2])
+    return words[0], words[1], words[2]
+
+
+def parse_header_block(
+    block,  # type: bytes
+):
+    # type: (...) -> HttpHeaderStorage
+    """Parse header lines into storage which keeps all values of each header.
+
+    Folded header lines are obsolete (RFC 9112) and they are rejected.
+    """
+    headers = HttpHeaderStorage()
+    for line in block.decode("iso-8859-1").split("\n"):
+        if not line or line == "\r":
+            continue
+        key, sep, val = line.partition(":")
+        if not sep or not key or key[0] in " \t":
+            raise BadRequestError("Bad header line: {!r}".format(line))
+        headers.add(key.rstrip(), val.strip())
+    return headers
+
+
+def parse_request_head(
+    head,  # type: bytes
+):
+    # type: (...) -> tuple[str, str, str, HttpHeaderStorage, bytes]
+    """Parse request line and headers.
+
+    Returns:
+        Tuple of method, request target, HTTP version, headers and raw
+        header block.
+    """
+    line, _sep, block = head.partition(b"\n")
+    method, target, version = parse_request_line(line.decode("iso-8859-1").rstrip("\r"))
+    # Strip the empty line which ends the head
+    if block.endswith(b"\r\n"):
+        block = block[:-2]
+    elif block.endswith(b"\n"):
+        block = block[:-1]
+    return method, target, version, parse_header_block(block), block
+
+
+def read_header_block(
+    rfile,  # type: BufferedIOBase
+):
+    # type: (...) -> bytes
+    """Read header lines up to the empty line which ends the request head.
+
+    Returns:
+        Header lines as they have been received, without the empty line.
+    """
+    lines = []  # type: list[bytes]
+    while True:
+        line = rfile.readline(MAX_LINE_SIZE + 1)
+        if len(line) > MAX_LINE_SIZE:
+            raise HeaderTooLargeError("Header line is too long")
+        if line in {b"\r\n", b"\n", b""}:
+            return b"".join(lines)
+        lines.append(line)
+        if len(lines) > MAX_HEADERS:
+            raise HeaderTooLargeError("Too many headers")
+
+
+def header_value(
+    headers,  # type: HttpHeaderStorage
+    key,  # type: str
+    default="",  # type: str
+):
+    # type: (...) -> str
+    return headers.get(key) if key in headers else default
@@ -0,0 +1,307 @@
+"""Incremental parser of multipart/form-data request bodies.
+
+The stored request body is fed to the parser in chunks when files of
+the request are accessed for the first time. Parts are reported via callbacks,
+content of parts is passed to callbacks in chunks too, so the body spooled
+to disk is never loaded into memory as whole.
+
+The result of MultipartFormParser is compatible with parse_multipart_form()
+from test_server.multipart module including the stripping of line breaks
+at the start of a part content.
+"""
+
+# from __future__ import annotations
+
+from email.utils import decode_rfc2231
+from typing import Any
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Callable, Mapping
+
+# pylint: enable=import-error
+from six.moves.urllib.parse import unquote
+
+from .body import RequestBody
+from .multipart import parse_content_header
+
+__all__ = ["MultipartFormParser", "MultipartParser"]
+DEFAULT_PART_LIMIT = 1000  # type: int
+MAX_PART_HEAD_SIZE = 16 * 1024  # type: int
+STATE_PREAMBLE = 0  # type: int
+STATE_DELIMITER_END = 1  # type: int
+STATE_HEADERS = 2  # type: int
+STATE_BODY = 3  # type: int
+STATE_EPILOGUE = 4  # type: int
+
+
+def parse_part_headers(
+    head,  # type: bytes
+):
+    # type: (...) -> list[tuple[str, str]]
+    headers = []
+    for line in head.split(b"\r\n"):
+        if line:
+            key, _, val = line.decode("utf-8").partition(":")
+            headers.append((key.strip().lower(), val.strip()))
+    return headers
+
+
+class MultipartParser(object):  # pylint: disable=too-many-instance-attributes
+    """Push-style parser of multipart body.
+
+    Callbacks:
+        on_part_begin: called with list of (lower-cased name, value) headers
+        on_part_data: called with chunks of part content
+        on_part_end: called when part content is complete
+
+    Part which is not terminated with a delimiter is not reported as ended.
+    """
+
+    def __init__(
+        self,
+        boundary,  # type: bytes
+        on_part_begin,  # type: Callable[[list[tuple[str, str]]], None]
+        on_part_data,  # type: Callable[[bytes], None]
+        on_part_end,  # type: Callable[[], None]
+        part_limit=DEFAULT_PART_LIMIT,  # type: int
+    ):
+        # type: (...) -> None
+        if not boundary:
+            raise ValueError("Multipart boundary is empty")
+        self._delimiter = b"\r\n--" + boundary
+        self._on_part_begin = on_part_begin
+        self._on_part_data = on_part_data
+        self._on_part_end = on_part_end
+        self._part_limit = part_limit
+        self._num_parts = 0
+        self._state = STATE_PREAMBLE
+        # First delimiter could be at the very start of body, without line break
+        self._buf = b"\r\n"
+        self._strip_newlines = False
+
+    def feed(
+        self,
+        data,  # type: bytes
+    ):
+        # type: (...) -> None
+        if self._state == STATE_EPILOGUE:
+            return
+        self._buf += data
+        while self._process_buffer():
+            pass
+
+    def close(self):
+        # type: () -> bool
+        """Finish parsing.
+
+        Returns:
+            True if the body has been terminated with closing delimiter.
+        """
+        complete = self._state == STATE_EPILOGUE
+        self._state = STATE_EPILOGUE
+        self._buf = b""
+        return complete
+
+    def _emit_data(
+        self,
+        data,  # type: bytes
+    ):
+        # type: (...) -> None
+        if self._strip_newlines:
+            data = data.lstrip(b"\r\n")
+            if not data:
+                return
+            self._strip_newlines = False
+        self._on_part_data(data)
+
+    def _process_buffer(self):
+        # type: () -> bool
+        """Process data in buffer according to current state.
+
+        Returns:
+            True if processing could continue, False if more data is required.
+        """
+        if self._state == STATE_BODY:
+            return self._process_body()
+        if self._state == STATE_PREAMBLE:
+            return self._process_preamble()
+        if self._state == STATE_DELIMITER_END:
+            return self._process_delimiter_end()
+        if self._state == STATE_HEADERS:
+            return self._process_headers()
+        return False
+
+    def _process_body(self):
+        # type: () -> bool
+        delim = self._delimiter
+        idx = self._buf.find(delim)
+        if idx == -1:
+            # Tail of buffer could be the start of delimiter
+            safe_len = len(self._buf) - len(delim) + 1
+            if safe_len > 0:
+                self._emit_data(self._buf[:safe_len])
+                self._buf = self._buf[safe_len:]
+            return False
+        if idx:
+            self._emit_data(self._buf[:idx])
+        self._on_part_end()
+        self._buf = self._buf[idx + len(delim) :]
+        self._state = STATE_DELIMITER_END
+        return True
+
+    def _process_preamble(self):
+        # type: () -> bool
+        delim = self._delimiter
+        idx = self._buf.find(delim)
+        if idx == -1:
+            self._buf = self._buf[-len(delim) + 1 :]
+            return False
+        self._buf = self._buf[idx + len(delim) :]
+        self._state = STATE_DELIMITER_END
+        return True
+
+    def _process_delimiter_end(self):
+        # type: () -> bool
+        if self._buf[:2] == b"--":
+            self._state = STATE_EPILOGUE
+            self._buf = b""
+            return False
+        idx = self._buf.find(b"\r\n")
+        if idx == -1:
+            if len(self._buf) > MAX_PART_HEAD_SIZE:
+                raise ValueError("Invalid multipart delimiter line")
+            return False
+        self._buf = self._buf[idx + 2 :]
+        self._state = STATE_HEADERS
+        return True
+
+    def _process_headers(self):
+        # type: () -> bool
+        if self._buf.startswith(b"\r\n"):
+            head, self._buf = b"", self._buf[2:]
+        else:
+            idx = self._buf.find(b"\r\n\r\n")
+            if idx == -1:
+                if len(self._buf) > MAX_PART_HEAD_SIZE:
+                    raise ValueError("Multipart part headers are too long")
+                return False
+            head, self._buf = self._buf[:idx], self._buf[idx + 4 :]
+        self._num_parts += 1
+        if self._num_parts > self._part_limit:
+            raise ValueError(
+                "Number of multipart components exceeds the allowed limit"
+                " of {}".format(self._part_limit)
+            )
+        self._on_part_begin(parse_part_headers(head))
+        self._state = STATE_BODY
+        self._strip_newlines = True
+        return True
+
+
+class UploadedPart(dict):  # type: ignore[type-arg]
+    """Description of form field or file.
+
+    Content of file stored on disk is read on each access to "content" key.
+    """
+
+    def __missing__(
+        self,
+        key,  # type: str
+    ):
+        # type: (...) -> Any
+        if key == "content":
+            return self["body"].getvalue()
+        raise KeyError(key)
+
+
+class MultipartFormParser(object):
+    """Collect form fields and files from incrementally parsed multipart body.
+
+    Content of each file is written into RequestBody which is moved to disk
+    once it exceeds spool threshold.
+    """
+
+    def __init__(
+        self,
+        boundary,  # type: bytes
+        spool_threshold=None,  # type: None | int
+        part_limit=DEFAULT_PART_LIMIT,  # type: int
+    ):
+        # type: (...) -> None
+        self._spool_threshold = spool_threshold
+        self._parser = MultipartParser(
+            boundary,
+            self._on_part_begin,
+            self._on_part_data,
+            self._on_part_end,
+            part_limit=part_limit,
+        )
+        self._fields = {}  # type: dict[str, list[Mapping[str, Any]]]
+        self._part = None  # type: None | UploadedPart
+        self._charset = "utf-8"
+        self._sink = RequestBody()
+
+    def feed(
+        self,
+        data,  # type: bytes
+    ):
+        # type: (...) -> None
+        self._parser.feed(data)
+
+    def close(self):
+        # type: () -> dict[str, list[Mapping[str, Any]]]
+        """Finish parsing and return fields grouped by name."""
+        self._parser.close()
+        return self._fields
+
+    def _on_part_begin(
+        self,
+        headers,  # type: list[tuple[str, str]]
+    ):
+        # type: (...) -> None
+        name = None
+        filename = None
+        content_type = None
+        self._charset = "utf-8"
+        for key, val in headers:
+            value, options = parse_content_header(val)
+            if key == "content-disposition":
+                name = options.get("name")
+                filename = options.get("filename")
+                filename_with_asterisk = options.get("filename*")
+                if filename is None and filename_with_asterisk:
+                    encoding, _, raw = decode_rfc2231(filename_with_asterisk)
+                    filename = unquote(raw, encoding=encoding or self._charset)
+            elif key == "content-type":
+                content_type = value
+                self._charset = options.get("charset", "utf-8")
+        if filename:
+            self._sink = RequestBody.create_spooled(self._spool_threshold)
+        else:
+            self._sink = RequestBody()
+        self._part = UploadedPart(
+            name=name,
+            filename=filename,
+            content_type=(content_type or "text/plain") if filename else None,
+            body=self._sink,
+        )
+
+    def _on_part_data(
+        self,
+        data,  # type: bytes
+    ):
+        # type: (...) -> None
+        self._sink.write(data)
+
+    def _on_part_end(self):
+        # type: () -> None
+        part = self._part
+        self._part = None
+        if part is None or not part["name"]:
+            return
+        if part["filename"]:
+            if self._sink.in_memory:
+                part["content"] = self._sink.getvalue()
+        else:
+            part["content"] = self._sink.getvalue().decode(self._charset)
+        self._fields.setdefault(part["name"], []).append(part)
@@ -0,0 +1,210 @@
+"""Pool of started test servers which are leased to tests.
+
+Tests which run in parallel threads could not share single TestServer
+because response script and request log of the server are global. The pool
+starts several servers once and leases each of them to one test at a time.
+The server is reset when it is returned to the pool, that is much faster than
+starting new server for each test.
+
+Usage:
+    pool = TestServerPool(size=4)
+    with pool.lease() as server:
+        server.add_response(Response(data=b"abc"))
+        ...
+    pool.stop()
+"""
+
+# from __future__ import annotations
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition, Thread
+from typing import Any
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Iterator
+
+# pylint: enable=import-error
+from .error import TestServerError, WaitTimeoutError
+from .server import TestServer
+
+__all__ = ["TestServerPool"]
+
+
+class TestServerPool(object):  # pylint: disable=too-many-instance-attributes
+    """Fixed number of started servers leased to one user at a time.
+
+    Servers are started in background threads on first acquire() call.
+
+    Args:
+        size: number of servers
+        **server_kwargs: arguments of TestServer constructor
+    """
+
+    __test__ = False  # for pytest ignore this class
+
+    # fmt: off
+    def __init__(
+        self,
+        size=4,  # type: int
+        **server_kwargs  # type: Any
+    ):
+    # fmt: on
+        # type: (...) -> None
+        if size < 1:
+            raise TestServerError("Size of server pool must be positive")
+        self.size = size
+        self._server_kwargs = server_kwargs
+        self._cond = Condition()
+        self._servers = []  # type: list[TestServer]
+        self._free = deque()  # type: deque[TestServer]
+        # Leased servers and times they have been leased at
+        self._leased = {}  # type: dict[int, float]
+        self._start_error = None  # type: None | BaseException
+        self._started = False
+        self._stopped = False
+        self._created_time = 0.0
+        self._num_acquired = 0
+        self._num_waited = 0
+        self._wait_time = 0.0
+        self._busy_time = 0.0
+        self._max_leased = 0
+
+    def _start_servers(self):
+        # type: () -> None
+        """Start servers in background threads, must be called with lock."""
+        self._started = True
+        self._created_time = time.time()
+        for _ in range(self.size):
+            th = Thread(target=self._start_server, name="TestServerPoolStarter")
+            th.daemon = True
+            th.start()
+
+    def _start_server(self):
+        # type: () -> None
+        server = TestServer(**self._server_kwargs)
+        try:
+            server.start()
+        except BaseException as ex:  # pylint: disable=broad-exception-caught
+            with self._cond:
+                self._start_error = ex
+                self._cond.notify_all()
+            return
+        with self._cond:
+            if self._stopped:
+                server.stop()
+                return
+            self._servers.append(server)
+            self._free.append(server)
+            self._cond.notify()
+
+    def acquire(
+        self,
+        timeout=None,  # type: None | float
+    ):
+        # type: (...) -> TestServer
+        """Take free server from the pool, wait until one is available.
+
+        Raises:
+            WaitTimeoutError: no server has been released in timeout seconds
+            TestServerError: pool is stopped or server could not be started
+        """
+        start = time.time()
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            if not self._started:
+                self._start_servers()
+            waited = False
+            while not self._free:
+                if self._stopped:
+                    raise TestServerError("Server pool is stopped")
+                if self._start_error is not None:
+                    raise TestServerError(
+                        "Could not start server: {}".format(self._start_error)
+                    )
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise WaitTimeoutError("No free server in the pool")
+                waited = True
+                self._cond.wait(remaining)
+            server = self._free.pop()
+            now = time.time()
+            self._leased[id(server)] = now
+            self._num_acquired += 1
+            if waited:
+                self._num_waited += 1
+                self._wait_time += now - start
+            self._max_leased = max(self._max_leased, len(self._leased))
+            return server
+
+    def release(
+        self,
+        server,  # type: TestServer
+    ):
+        # type: (...) -> None
+        """Reset the server and return it to the pool."""
+        with self._cond:
+            if id(server) not in self._leased:
+                raise TestServerError("Server is not leased from the pool")
+        server.reset()
+        with self._cond:
+            self._busy_time += time.time() - self._leased.pop(id(server))
+            if self._stopped:
+                server.stop()
+                return
+            self._free.append(server)
+            self._cond.notify()
+
+    @contextmanager
+    def lease(
+        self,
+        timeout=None,  # type: None | float
+    ):
+        # type: (...) -> Iterator[TestServer]
+        """Acquire the server and release it when the block is finished."""
+        server = self.acquire(timeout)
+        try:
+            yield server
+        finally:
+            self.release(server)
+
+    def stats(self):
+        # type: () -> dict[str, Any]
+        """Return usage counters of the pool.
+
+        Keys are: size, started (number of servers started), leased (number
+        of servers leased now), max_leased, acquired (total number of leases),
+        waited (number of leases which waited for free server), wait_time
+        (total seconds spent waiting) and utilization (part of servers time
+        spent leased since the pool has been started).
+        """
+        with self._cond:
+            now = time.time()
+            busy_time = self._busy_time + sum(
+                now - leased_time for leased_time in self._leased.values()
+            )
+            capacity = (now - self._created_time) * self.size
+            return {
+                "size": self.size,
+                "started": len(self._servers),
+                "leased": len(self._leased),
+                "max_leased": self._max_leased,
+                "acquired": self._num_acquired,
+                "waited": self._num_waited,
+                "wait_time": self._wait_time,
+                "utilization": (
+                    busy_time / capacity if self._started and capacity else 0.0
+                ),
+            }
+
+    def stop(self):
+        # type: () -> None
+        """Stop free servers, leased servers are stopped when released."""
+        with self._cond:
+            self._stopped = True
+            servers = list(self._free)
+            self._free.clear()
+            self._cond.notify_all()
+        for server in servers:
+            server.stop()
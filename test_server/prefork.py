@@ -0,0 +1,217 @@
+"""Worker processes which share the listening port.
+
+Each worker is forked from the process which runs TestServer. The worker
+runs its own server listening on the same port with SO_REUSEPORT option,
+the kernel distributes connections between workers. Workers talk
+to the parent process through the pipe: they ask it for responses and report
+processed requests, so the parent keeps the response script and
+the request log.
+"""
+
+# from __future__ import annotations
+
+import logging
+import os
+import signal
+import socket
+import time
+from multiprocessing import Pipe
+from threading import Event, Lock, Thread
+from typing import Any
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Callable
+
+# pylint: enable=import-error
+from .error import InternalError
+
+__all__ = ["ParentChannel", "WorkerProcess", "is_prefork_supported", "reserve_port"]
+LOG = logging.getLogger()
+# How often the worker checks that the parent process is alive
+PARENT_CHECK_INTERVAL = 0.5  # type: float
+
+
+def is_prefork_supported():
+    # type: () -> bool
+    return hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")
+
+
+def set_reuse_port(
+    sock,  # type: socket.socket
+):
+    # type: (...) -> None
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+
+def reserve_port(
+    address,  # type: str
+    port,  # type: int
+):
+    # type: (...) -> socket.socket
+    """Bind socket which holds the port while workers are running.
+
+    The socket does not listen so connections are accepted only by workers.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    set_reuse_port(sock)
+    sock.bind((address, port))
+    return sock
+
+
+class ParentChannel(object):
+    """Connection of worker process to the parent process.
+
+    Messages are tuples of (reply expected, kind, arguments...).
+    The channel could be used by many threads.
+    """
+
+    def __init__(
+        self,
+        conn,  # type: Any
+    ):
+        # type: (...) -> None
+        self._conn = conn
+        self._lock = Lock()
+
+    def call(
+        self,
+        msg,  # type: tuple[Any, ...]
+    ):
+        # type: (...) -> Any
+        """Send message of (kind, arguments...) and return the reply of the parent.
+
+        Error raised by the parent while handling the message is raised again.
+        """
+        with self._lock:
+            self._conn.send((True,) + msg)  # noqa: RUF005
+            status, value = self._conn.recv()
+        if status == "error":
+            raise value
+        return value
+
+    def send(
+        self,
+        msg,  # type: tuple[Any, ...]
+    ):
+        # type: (...) -> None
+        """Send message which does not need reply."""
+        with self._lock:
+            self._conn.send((False,) + msg)  # noqa: RUF005
+
+
+class WorkerProcess(object):
+    """Forked worker process and the thread handling its messages in the parent.
+
+    Args:
+        target: function which is called in the worker with ParentChannel
+            argument, it must start the server and return
+        handler: function which handles messages of the worker in the parent,
+            it accepts the tuple of (kind, arguments...) and returns the reply
+        name: name of the thread handling messages
+    """
+
+    def __init__(
+        self,
+        target,  # type: Callable[[ParentChannel], None]
+        handler,  # type: Callable[[tuple[Any, ...]], Any]
+        name="TestServerWorkerProcess",  # type: str
+    ):
+        # type: (...) -> None
+        parent_pid = os.getpid()
+        parent_conn, child_conn = Pipe()
+        pid = os.fork()
+        if pid == 0:
+            parent_conn.close()
+            run_worker(target, ParentChannel(child_conn), parent_pid)
+        child_conn.close()
+        self.pid = pid
+        self.handler = handler
+        self.started = Event()
+        self._conn = parent_conn
+        self._thread = Thread(target=self._serve, name=name)
+        self._thread.daemon = True
+
+    def start(self):
+        # type: () -> None
+        """Start handling messages of the worker."""
+        self._thread.start()
+
+    def _serve(self):
+        # type: () -> None
+        while True:
+            try:
+                msg = self._conn.recv()
+            except (EOFError, EnvironmentError):  # noqa: UP024
+                # The worker has exited
+                return
+            need_reply, kind = msg[0], msg[1]
+            if kind == "started":
+                self.started.set()
+                continue
+            try:
+                reply = ("ok", self.handler(msg[1:]))
+            except Exception as ex:
+                if not need_reply:
+                    LOG.exception("Failed to handle message of worker process")
+                    continue
+                reply = ("error", ex)
+            if need_reply:
+                self._send_reply(reply)
+
+    def _send_reply(
+        self,
+        reply,  # type: tuple[str, Any]
+    ):
+        # type: (...) -> None
+        try:
+            self._conn.send(reply)
+        except EnvironmentError:  # noqa: UP024
+            pass
+        except Exception as ex:  # noqa: BLE001
+            # The reply could not be pickled
+            self._conn.send(
+                (
+                    "error",
+                    InternalError(
+                        "Could not pass data to worker process: {}".format(ex)
+                    ),
+                )
+            )
+
+    def stop(self):
+        # type: () -> None
+        """Terminate the worker and wait until it exits."""
+        try:  # noqa: SIM105
+            os.kill(self.pid, signal.SIGTERM)
+        except EnvironmentError:  # noqa: UP024
+            pass
+        os.waitpid(self.pid, 0)
+        if self._thread.ident is not None:
+            self._thread.join()
+        self._conn.close()
+
+
+def run_worker(
+    target,  # type: Callable[[ParentChannel], None]
+    channel,  # type: ParentChannel
+    parent_pid,  # type: int
+):
+    # type: (...) -> None
+    """Run the worker in forked process, the function never returns."""
+    code = 0
+    try:
+        try:  # noqa: SIM105
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        except ValueError:
+            # Not the main thread
+            pass
+        target(channel)
+        channel.send(("started",))
+        while os.getppid() == parent_pid:
+            time.sleep(PARENT_CHECK_INTERVAL)
+    except BaseException:  # pylint: disable=broad-exception-caught
+        LOG.exception("Worker process failed")
+        code = 1
+    finally:
+        os._exit(code)  # pylint: disable=protected-access
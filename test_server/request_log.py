@@ -0,0 +1,104 @@
+# from __future__ import annotations
+
+from collections import deque
+from typing import Any
+
+__all__ = ["RequestLog"]
+VALID_RETENTION_MODES = ["last", "first"]  # type: list[str]
+
+
+def request_size(
+    req,  # type: Any
+):
+    # type: (...) -> int
+    """Estimate memory used by request in bytes: body plus headers."""
+    body_size = req.body_size  # type: int
+    return body_size + sum(len(key) + len(val) for key, val in req.headers.items())
+
+
+class RequestLog(object):
+    """Log of processed requests with optional limits.
+
+    If number of logged requests or their total size exceeds the limits then
+    the log keeps either last (ring buffer) or first requests. The most recent
+    request is always kept in the "last" mode. Dropped requests are counted.
+
+    The log is not thread-safe, the owner must serialize access to it.
+    """
+
+    def __init__(
+        self,
+        max_requests=None,  # type: None | int
+        max_bytes=None,  # type: None | int
+        retention="last",  # type: str
+    ):
+        # type: (...) -> None
+        if retention not in VALID_RETENTION_MODES:
+            raise ValueError("Invalid retention mode: {}".format(retention))
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.retention = retention
+        # Items are (sequence number, size, request)
+        self._items = deque()  # type: deque[tuple[int, int, Any]]
+        self.num_logged = 0
+        self.num_dropped = 0
+        self.size = 0
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._items)
+
+    def _is_full(
+        self,
+        extra_size,  # type: int
+    ):
+        # type: (...) -> bool
+        return (
+            self.max_requests is not None and len(self._items) >= self.max_requests
+        ) or (self.max_bytes is not None and self.size + extra_size > self.max_bytes)
+
+    def append(
+        self,
+        req,  # type: Any
+    ):
+        # type: (...) -> None
+        self.num_logged += 1
+        size = request_size(req) if self.max_bytes is not None else 0
+        if self.retention == "first":
+            if self._is_full(size):
+                self.num_dropped += 1
+                return
+        else:
+            while self._items and self._is_full(size):
+                _seq, old_size, _req = self._items.popleft()
+                self.size -= old_size
+                self.num_dropped += 1
+        self._items.append((self.num_logged, size, req))
+        self.size += size
+
+    def last(self):
+        # type: () -> Any
+        """Return the most recent logged request.
+
+        Raises:
+            IndexError: if the log is empty
+        """
+        return self._items[-1][2]
+
+    def requests(self):
+        # type: () -> list[Any]
+        return [item[2] for item in self._items]
+
+    def since(
+        self,
+        seq,  # type: int
+    ):
+        # type: (...) -> list[tuple[int, Any]]
+        """Return requests logged after given sequence number, oldest first."""
+        ret = []
+        for item_seq, _size, req in reversed(self._items):
+            if item_seq <= seq:
+                break
+            ret.append((item_seq, req))
+        ret.reverse()
+        return ret
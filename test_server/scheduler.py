@@ -0,0 +1,100 @@
+# from __future__ import annotations
+
+import heapq
+import logging
+import time
+from threading import Condition, Thread, current_thread
+from typing import Callable, Tuple
+
+__all__ = ["DelayScheduler"]
+LOG = logging.getLogger()
+# Deadline, sequence number, task and cancel callback
+# pylint: disable=deprecated-typing-alias
+ScheduledTask = Tuple[float, int, Callable[[], None], Callable[[], None]]
+# pylint: enable=deprecated-typing-alias
+
+
+class DelayScheduler(object):
+    """Run tasks after delays using single timer thread.
+
+    Tasks are stored in the heap ordered by deadline. Tasks are run
+    in the timer thread so they must not block, usually a task hands work
+    over to other threads.
+    """
+
+    def __init__(
+        self,
+        name="TestServerScheduler",  # type: str
+    ):
+        # type: (...) -> None
+        self._cond = Condition()
+        self._heap = []  # type: list[ScheduledTask]
+        self._seq = 0
+        self._closed = False
+        self._thread = Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self):
+        # type: () -> int
+        with self._cond:
+            return len(self._heap)
+
+    def schedule(
+        self,
+        delay,  # type: float
+        task,  # type: Callable[[], None]
+        cancel,  # type: Callable[[], None]
+    ):
+        # type: (...) -> None
+        """Run the task after delay.
+
+        Args:
+            delay: delay in seconds
+            task: function without arguments
+            cancel: function which is called instead of task if the scheduler
+                is shut down before the task is run
+        """
+        with self._cond:
+            if not self._closed:
+                self._seq += 1
+                heapq.heappush(
+                    self._heap, (time.time() + delay, self._seq, task, cancel)
+                )
+                self._cond.notify()
+                return
+        cancel()
+
+    def _run(self):
+        # type: () -> None
+        while True:
+            with self._cond:
+                while not self._closed and (
+                    not self._heap or self._heap[0][0] > time.time()
+                ):
+                    self._cond.wait(
+                        self._heap[0][0] - time.time() if self._heap else None
+                    )
+                if self._closed:
+                    return
+                task = heapq.heappop(self._heap)[2]
+            try:
+                task()
+            except Exception:
+                LOG.exception("Unexpected error in scheduled task")
+
+    def shutdown(self):
+        # type: () -> None
+        """Stop the timer thread and cancel pending tasks."""
+        with self._cond:
+            self._closed = True
+            items = self._heap
+            self._heap = []
+            self._cond.notify()
+        for item in items:
+            try:
+                item[3]()
+            except Exception:  # noqa: PERF203
+                LOG.exception("Unexpected error in cancel callback")
+        if current_thread() is not self._thread:
+            self._thread.join()
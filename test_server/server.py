@@ -1,25 +1,38 @@
+# pylint: disable=too-many-lines
 # from __future__ import annotations
 
+import errno
 import logging
+import pickle
+import select
+import socket
 import time
-from collections import defaultdict
 from email.message import Message
 from pprint import pprint  # pylint: disable=unused-import
-from threading import Event, Thread
-from typing import Any, cast
+from threading import Condition, Event, Thread
+from typing import Any, Pattern, cast  # pylint: disable=unused-import
 
 import six
 from six.moves.BaseHTTPServer import BaseHTTPRequestHandler
 
 # pylint: disable=import-error
-from six.moves.collections_abc import Callable, Mapping, MutableMapping
+from six.moves.collections_abc import Callable, Iterable, Mapping
 
 # pylint: enable=import-error
 from six.moves.http_cookies import SimpleCookie
 from six.moves.socketserver import BaseRequestHandler, TCPServer, ThreadingMixIn
 from six.moves.urllib.parse import parse_qsl, urljoin
 
+from .body import (
+    DEFAULT_SPOOL_THRESHOLD,
+    RequestBody,
+    is_chunked,
+    read_body,
+    read_chunked_body,
+)
 from .const import TEST_SERVER_PACKAGE_VERSION
+from .delay import Delay, resolve_delay  # pylint: disable=unused-import
+from .dispatch import ResponseDispatcher
 from .error import (
     InternalError,
     NoResponseError,
@@ -27,12 +40,57 @@ from .error import (
     TestServerError,
     WaitTimeoutError,
 )
-from .multipart import parse_content_header, parse_multipart_form
+from .file_body import FileBody, FileSource  # pylint: disable=unused-import
+from .head import (
+    BadRequestError,
+    header_value,
+    parse_header_block,
+    parse_request_line,
+    read_header_block,
+)
+from .multipart import parse_content_header
+from .multipart_parser import MultipartFormParser
+from .prefork import (
+    ParentChannel,
+    WorkerProcess,
+    is_prefork_supported,
+    reserve_port,
+    set_reuse_port,
+)
+from .request_log import VALID_RETENTION_MODES, RequestLog
+from .scheduler import DelayScheduler
+from .stats import RequestStats, monotonic, phase_durations
+from .stream import iter_stream_body, setup_stream_framing
 from .structure import HttpHeaderStorage, HttpHeaderStream
+from .throttle import (  # pylint: disable=unused-import
+    Throttle,
+    TokenBucket,
+    create_throttle,
+)
+from .worker import WorkerPool
 
-__all__ = ["Request", "Response", "TestServer", "WaitTimeoutError"]  # type: list[str]
+__all__ = [
+    "Namespace",
+    "Request",
+    "Response",
+    "TestServer",
+    "WaitTimeoutError",
+]  # type: list[str]
 LOG = logging.getLogger()
 INTERNAL_ERROR_RESPONSE_STATUS = 555  # type: int
+VALID_PROTOCOL_VERSIONS = ["HTTP/1.0", "HTTP/1.1"]  # type: list[str]
+VALID_ENGINES = ["threading", "asyncio"]  # type: list[str]
+VALID_OVERFLOW_MODES = ["block", "reject"]  # type: list[str]
+DEFAULT_KEEP_ALIVE_TIMEOUT = 5.0  # type: float
+DEFAULT_KEEP_ALIVE_MAX_REQUESTS = 100  # type: int
+LISTEN_BACKLOG = 1024  # type: int
+# Larger bodies are not copied into one buffer with response head
+MAX_COALESCED_BODY_SIZE = 64 * 1024  # type: int
+CONNECTION_CLOSE_HEADER = b"Connection: close\r\n"  # type: bytes
+# Seconds to wait until worker processes start listening
+WORKER_START_TIMEOUT = 5.0  # type: float
+# Seconds to wait for connections being processed when server is stopped
+DEFAULT_STOP_TIMEOUT = 1.0  # type: float
 
 
 class HandlerResult(object):
@@ -42,7 +100,7 @@ class HandlerResult(object):
         self,
         status=None,  # type: None | int
         headers=None,  # type: None | HttpHeaderStorage
-        data=None,  # type: None | bytes
+        data=None,  # type: None | bytes | Iterable[Any] | FileBody
     ):
         # type: (...) -> None
         self.status = status if status is not None else 200
@@ -50,54 +108,465 @@ class HandlerResult(object):
         self.data = data if data else b""
 
 
-class Response(object):
-    def __init__(
+class Response(object):  # pylint: disable=too-many-instance-attributes
+    def __init__(  # noqa: PLR0913, PLR0917 # pylint: disable=too-many-arguments
         self,
         callback=None,  # type: None | Callable[..., Mapping[str, Any]]
         raw_callback=None,  # type: None | Callable[..., bytes]
-        data=None,  # type: None | bytes | str
+        data=None,  # type: None | bytes | str | Iterable[bytes | str]
         headers=None,  # type: None | HttpHeaderStream
-        sleep=None,  # type: None | float
+        sleep=None,  # type: None | float | Delay
         status=None,  # type: None | int
+        size=None,  # type: None | int
+        file=None,  # type: None | FileSource
+        offset=0,  # type: int
+        length=None,  # type: None | int
+        rate_limit_bps=None,  # type: None | float
+        burst=None,  # type: None | int
     ):
         # type: (...) -> None
         self.callback = callback
         self.raw_callback = raw_callback
+        # Iterable data is streamed to client without loading it into memory
         self.data = b"" if data is None else data
         self.headers = HttpHeaderStorage(headers)
         self.sleep = sleep
         self.status = 200 if status is None else status
+        # Size of streamed data, it is sent in Content-Length header
+        self.size = size
+        # Path or file object which is sent instead of data
+        self.file = file
+        self.offset = offset
+        self.length = length
+        # Response data is sent with this rate in bytes per second,
+        # burst is the number of bytes which could be sent at once
+        self.rate_limit_bps = rate_limit_bps
+        self.burst = burst
+        self._prepared = None  # type: None | PreparedResponse
+
+    def __setattr__(
+        self,
+        name,  # type: str
+        value,  # type: Any
+    ):
+        # type: (...) -> None
+        # Serialized response does not match changed attributes
+        if name != "_prepared":
+            object.__setattr__(self, "_prepared", None)
+        object.__setattr__(self, name, value)
 
+    def prepare(
+        self,
+        port,  # type: None | int
+        protocol_version,  # type: str
+    ):
+        # type: (...) -> None | PreparedResponse
+        """Return serialized status line, headers and body of static response.
+
+        The result is cached so the response is serialized once however many
+        times it is sent. The cache is dropped when attributes or headers
+        of the response are changed. Responses built by callbacks, or sent
+        from iterables or files are not static, None is returned for them.
+        """
+        if (
+            self.callback
+            or self.raw_callback
+            or self.file is not None
+            or not isinstance(self.data, (bytes, six.text_type))
+        ):
+            return None
+        prepared = self._prepared
+        if (
+            prepared is None
+            or prepared.port != port
+            or prepared.protocol_version != protocol_version
+            or prepared.headers_revision != self.headers.revision
+        ):
+            prepared = PreparedResponse(self, port, protocol_version)
+            self._prepared = prepared
+        return prepared
+
+
+class PreparedResponse(object):
+    """Static response serialized for sending.
+
+    The head contains status line and headers without terminating empty line
+    so Connection header could be appended to it.
+    """
+
+    __slots__ = [
+        "body",
+        "connection",
+        "head",
+        "headers_revision",
+        "port",
+        "protocol_version",
+        "status",
+    ]
 
-class Request(object):  # pylint: disable=too-many-instance-attributes
     def __init__(
         self,
-        args,  # type: Mapping[str, Any]
-        client_ip,  # type: str
-        cookies,  # type: SimpleCookie
-        data,  # type: bytes
-        files,  # type: Mapping[str, Any]
-        headers,  # type: HttpHeaderStream
-        method,  # type: str
-        path,  # type: str
+        resp,  # type: Response
+        port,  # type: None | int
+        protocol_version,  # type: str
+    ):
+        # type: (...) -> None
+        # Revision of response headers the response has been serialized from
+        self.headers_revision = resp.headers.revision
+        result = HandlerResult()
+        build_handler_result(resp, result)
+        add_required_response_headers(result.headers, port)
+        body = cast(bytes, result.data)
+        if "content-length" not in result.headers:
+            result.headers.set("Content-Length", str(len(body)))
+        self.port = port
+        self.protocol_version = protocol_version
+        self.status = result.status
+        self.body = body
+        # Lower-cased value of Connection header set by user
+        self.connection = (
+            result.headers.get("connection").lower()
+            if "connection" in result.headers
+            else None
+        )  # type: None | str
+        self.head = serialize_response_head(
+            protocol_version, result.status, result.headers
+        )
+
+
+class Request(object):  # pylint: disable=too-many-instance-attributes
+    """Request received by test server.
+
+    The args, cookies, files and headers attributes which are not passed
+    to constructor are computed on first access from query string,
+    headers and body of the request.
+    """
+
+    def __init__(  # noqa: PLR0913, PLR0917 # pylint: disable=too-many-arguments
+        self,
+        args=None,  # type: None | Mapping[str, Any]
+        client_ip="",  # type: str
+        cookies=None,  # type: None | SimpleCookie
+        data=b"",  # type: bytes | RequestBody
+        files=None,  # type: None | Mapping[str, Any]
+        headers=None,  # type: None | HttpHeaderStream | HttpHeaderStorage
+        method="GET",  # type: str
+        path="/",  # type: str
+        trailers=None,  # type: None | HttpHeaderStream
+        query_string="",  # type: str
+        spool_threshold=None,  # type: None | int
+        timings=None,  # type: None | dict[str, float]
+        generation=None,  # type: None | int
+        raw_headers=b"",  # type: bytes
     ):
         # type: (...) -> None
-        self.args = args
+        self._args = args
         self.client_ip = client_ip
-        self.cookies = cookies
-        self.data = data
-        self.files = files
-        self.headers = HttpHeaderStorage(headers)
+        self._cookies = cookies
+        self.body = (
+            data if isinstance(data, RequestBody) else RequestBody(data)
+        )  # type: RequestBody
+        self._files = files
+        self._header_data = None  # type: None | HttpHeaderStream
+        self._headers = None  # type: None | HttpHeaderStorage
+        if isinstance(headers, HttpHeaderStorage):
+            # Headers parsed by server are used without copying
+            self._headers = headers
+        else:
+            self._header_data = headers
+        # Header lines as they have been received, without request line
+        self.raw_headers = raw_headers
         self.method = method
         self.path = path
+        self._raw_trailers = trailers
+        self._trailers = None  # type: None | HttpHeaderStorage
+        self.query_string = query_string
+        self.spool_threshold = spool_threshold
+        # Monotonic timestamps of request processing phases, see stats.TIMESTAMPS.
+        # Server adds timestamps of response phases after request is logged.
+        self.timings = {} if timings is None else timings  # type: dict[str, float]
+        # Generation of server state the request has been received in,
+        # see TestServer.reset()
+        self.generation = generation  # type: None | int
+
+    @property
+    def args(self):
+        # type: () -> Mapping[str, Any]
+        if self._args is None:
+            self._args = dict(parse_qsl(self.query_string))
+        return self._args
+
+    @args.setter
+    def args(
+        self,
+        value,  # type: Mapping[str, Any]
+    ):
+        # type: (...) -> None
+        self._args = value
+
+    @property
+    def cookies(self):
+        # type: () -> SimpleCookie
+        if self._cookies is None:
+            headers = self.headers
+            # Client could send cookies in multiple headers
+            self._cookies = SimpleCookie(
+                "; ".join(headers.getlist("cookie")) if "cookie" in headers else ""
+            )
+        return self._cookies
+
+    @cookies.setter
+    def cookies(
+        self,
+        value,  # type: SimpleCookie
+    ):
+        # type: (...) -> None
+        self._cookies = value
+
+    @property
+    def files(self):
+        # type: () -> Mapping[str, Any]
+        """Return files and fields of multipart form parsed from body."""
+        if self._files is None:
+            headers = self.headers
+            self._files = process_multipart_files(
+                self.body,
+                headers.get("content-type") if "content-type" in headers else "",
+                self.spool_threshold,
+            )
+        return self._files
+
+    @files.setter
+    def files(
+        self,
+        value,  # type: Mapping[str, Any]
+    ):
+        # type: (...) -> None
+        self._files = value
+
+    @property
+    def headers(self):
+        # type: () -> HttpHeaderStorage
+        if self._headers is None:
+            self._headers = HttpHeaderStorage(self._header_data)
+        return self._headers
+
+    @headers.setter
+    def headers(
+        self,
+        value,  # type: HttpHeaderStream
+    ):
+        # type: (...) -> None
+        self._headers = HttpHeaderStorage(value)
+
+    @property
+    def durations(self):
+        # type: () -> dict[str, float]
+        """Return durations in seconds of request processing phases."""
+        return phase_durations(self.timings)
+
+    @property
+    def trailers(self):
+        # type: () -> HttpHeaderStorage
+        """Return trailer headers of body sent with chunked transfer encoding."""
+        if self._trailers is None:
+            self._trailers = HttpHeaderStorage(self._raw_trailers)
+        return self._trailers
+
+    @property
+    def data(self):
+        # type: () -> bytes
+        """Return body of request.
+
+        Body stored in temporary file is read from disk on each access,
+        use self.body to process it in chunks.
+        """
+        return self.body.getvalue()
+
+    @data.setter
+    def data(
+        self,
+        value,  # type: bytes
+    ):
+        # type: (...) -> None
+        self.body = RequestBody(value)
+
+    @property
+    def body_size(self):
+        # type: () -> int
+        return self.body.size
+
+
+def request_fields(
+    req,  # type: Request
+):
+    # type: (...) -> dict[str, Any]
+    """Return Request constructor arguments to pass the request to other process."""
+    return {
+        "client_ip": req.client_ip,
+        "data": req.body.getvalue(),
+        "headers": list(req.headers.items()),
+        "method": req.method,
+        "path": req.path,
+        "query_string": req.query_string,
+        "spool_threshold": req.spool_threshold,
+        "timings": dict(req.timings),
+        "trailers": list(req.trailers.items()),
+        "generation": req.generation,
+        "raw_headers": req.raw_headers,
+    }
+
+
+def shutdown_socket(
+    sock,  # type: socket.socket
+    how,  # type: int
+):
+    # type: (...) -> None
+    try:  # noqa: SIM105
+        sock.shutdown(how)
+    except socket.error:  # noqa: UP024
+        # socket is already closed by other side
+        pass
+
+
+def create_multipart_parser(
+    content_type,  # type: str
+    spool_threshold=None,  # type: None | int
+):
+    # type: (...) -> None | MultipartFormParser
+    """Create parser for body with given content type if it is multipart form."""
+    if not content_type.startswith("multipart/form-data;"):
+        return None
+    _content_type, options = parse_content_header(content_type)
+    boundary = options.get("boundary", "").encode()
+    if not boundary:
+        return None
+    return MultipartFormParser(boundary, spool_threshold=spool_threshold)
+
+
+def process_multipart_files(
+    body,  # type: RequestBody
+    content_type,  # type: str
+    spool_threshold=None,  # type: None | int
+):
+    # type: (...) -> Mapping[str, list[Mapping[str, Any]]]
+    """Parse files and fields from already received body."""
+    parser = create_multipart_parser(content_type, spool_threshold)
+    if parser is None:
+        return {}
+    for chunk in body.iter_chunks():
+        parser.feed(chunk)
+    return parser.close()
+
+
+def process_callback_result(
+    cb_res,  # type: Mapping[str, Any]
+    result,  # type: HandlerResult
+):
+    # type: (...) -> None
+    if not isinstance(cb_res, dict):
+        raise InternalError("Callback response is not a dict")
+    if cb_res.get("type") != "response":
+        raise InternalError(
+            'Callback response has invalid "type" key: {}'.format(
+                cb_res.get("type", "key-not-specified")
+            )
+        )
+    for key in cb_res:
+        if key not in ("type", "status", "headers", "data"):
+            raise InternalError(
+                "Callback response contains invalid key: {}".format(key)
+            )
+    if "status" in cb_res:
+        result.status = cb_res["status"]
+    if "headers" in cb_res:
+        result.headers.extend(cb_res["headers"])
+    if "data" in cb_res:
+        if isinstance(cb_res["data"], bytes) or is_iterable_data(cb_res["data"]):
+            result.data = cb_res["data"]
+        else:
+            raise InternalError(
+                'Callback repsponse field "data" must be bytes or iterable'
+            )
+
+
+def is_iterable_data(
+    data,  # type: Any
+):
+    # type: (...) -> bool
+    """Check if data is iterable which produces chunks of response body."""
+    return not isinstance(data, (bytes, six.text_type)) and hasattr(data, "__iter__")
+
+
+def build_handler_result(
+    resp,  # type: Response
+    result,  # type: HandlerResult
+):
+    # type: (...) -> None
+    """Fill result with status, headers and data of non-raw response."""
+    if resp.callback:
+        process_callback_result(resp.callback(), result)
+    else:
+        result.status = resp.status
+        result.headers.extend(resp.headers.items())
+        if resp.file is not None:
+            result.data = FileBody(resp.file, resp.offset, resp.length)
+        elif isinstance(resp.data, bytes):
+            result.data = resp.data
+        elif isinstance(resp.data, six.text_type):
+            result.data = resp.data.encode("utf-8")
+        elif is_iterable_data(resp.data):
+            result.data = resp.data
+            if resp.size is not None and "content-length" not in result.headers:
+                result.headers.set("Content-Length", str(resp.size))
+        else:
+            raise InternalError(
+                'Response parameter "data" must be either str or bytes'
+                " or iterable of them"
+            )
+
+
+def add_required_response_headers(
+    headers,  # type: HttpHeaderStorage
+    port,  # type: None | int
+):
+    # type: (...) -> None
+    headers.set("Listen-Port", str(port))
+    if "content-type" not in headers:
+        headers.set("Content-Type", "text/html; charset=utf-8")
+    if "server" not in headers:
+        headers.set("Server", "TestServer/{}".format(TEST_SERVER_PACKAGE_VERSION))
+
+
+def serialize_response_head(
+    protocol_version,  # type: str
+    status,  # type: int
+    headers,  # type: HttpHeaderStorage
+):
+    # type: (...) -> bytes
+    """Serialize status line and headers without terminating empty line."""
+    message = (
+        BaseHTTPRequestHandler.responses[status][0]
+        if status in BaseHTTPRequestHandler.responses
+        else ""
+    )  # type: Any
+    lines = ["{} {:d} {}\r\n".format(protocol_version, status, message)]
+    lines.extend("{}: {}\r\n".format(key, val) for key, val in headers.items())
+    return "".join(lines).encode("latin-1", "strict")
 
 
 VALID_METHODS = ["get", "post", "put", "delete", "options", "patch"]  # type: list[str]
 
 
-class ThreadingTCPServer(ThreadingMixIn, TCPServer):
+class ThreadingTCPServer(ThreadingMixIn, TCPServer):  # pylint: disable=too-many-instance-attributes
     allow_reuse_address = True  # type: bool
+    # Many concurrent clients could connect at once
+    request_queue_size = LISTEN_BACKLOG  # type: int
     started = False  # type: bool
+    # Handler threads are not joined without limit on server_close(),
+    # stop() waits for them with timeout
+    daemon_threads = True  # type: bool
+    block_on_close = False  # type: bool
 
     # fmt: off
     def __init__(
@@ -111,84 +580,426 @@ class ThreadingTCPServer(ThreadingMixIn, TCPServer):
     ):
     # fmt: on
         # type: (...) -> None
-        TCPServer.__init__(self, server_address, request_handler_class, **kwargs)
         self.test_server = test_server
+        # The state is created before the socket is bound because
+        # server_close() is called if binding fails
+        self._connections = set()  # type: set[socket.socket]
+        # Connections which are closed after delayed response is sent
+        self._detached = set()  # type: set[socket.socket]
+        # Notified when connection is closed
+        self._connections_lock = Condition()
+        self._scheduler = None  # type: None | DelayScheduler
+        # Writing to this socket pair wakes up serve_forever() loop
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._stop_serving = False
+        self._serving_done = Event()
+        self._serving_done.set()
+        TCPServer.__init__(self, server_address, request_handler_class, **kwargs)
         self.test_server.server_started.set()
 
+    def server_bind(self):
+        # type: () -> None
+        if self.test_server.workers:
+            # Port is shared by worker processes
+            set_reuse_port(self.socket)
+        TCPServer.server_bind(self)
+
+    def register_connection(self, conn):
+        # type: (socket.socket) -> None
+        with self._connections_lock:
+            self._connections.add(conn)
+
+    def unregister_connection(self, conn):
+        # type: (socket.socket) -> None
+        with self._connections_lock:
+            self._connections.discard(conn)
+            self._connections_lock.notify_all()
+
+    def serve_forever(
+        self,
+        poll_interval=None,  # type: None | float # noqa: ARG002 # pylint: disable=W0613
+    ):
+        # type: (...) -> None
+        """Handle requests until shutdown() is called.
+
+        Unlike socketserver implementation the loop does not poll
+        the shutdown flag, shutdown() wakes it up immediately.
+        """
+        self._serving_done.clear()
+        try:
+            while not self._stop_serving:
+                try:
+                    readable = select.select(
+                        [self.socket, self._wakeup_recv], [], []
+                    )[0]
+                except select.error as ex:  # noqa: UP024
+                    if ex.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if self._stop_serving:
+                    break
+                if self.socket in readable:
+                    self._handle_request_noblock()  # type: ignore[attr-defined]
+        finally:
+            self._serving_done.set()
+
+    def shutdown(self):
+        # type: () -> None
+        """Stop serve_forever() loop and wait until it exits."""
+        self._stop_serving = True
+        try:  # noqa: SIM105
+            self._wakeup_send.send(b"x")
+        except socket.error:  # noqa: UP024
+            pass
+        self._serving_done.wait()
+
+    def drain(
+        self,
+        timeout,  # type: float
+    ):
+        # type: (...) -> None
+        """Wait until connections are closed, then abort remaining ones."""
+        deadline = time.time() + timeout
+        with self._connections_lock:
+            while self._connections:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._connections_lock.wait(remaining)
+            conns = list(self._connections)
+        for conn in conns:
+            shutdown_socket(conn, socket.SHUT_RDWR)
+
+    def stop(
+        self,
+        timeout,  # type: float
+    ):
+        # type: (...) -> None
+        self.shutdown()
+        self.server_close()
+        self.drain(timeout)
+
+    def get_scheduler(self):
+        # type: () -> DelayScheduler
+        with self._connections_lock:
+            if self._scheduler is None:
+                self._scheduler = DelayScheduler()
+            return self._scheduler
+
+    def detach_request(self, request):
+        # type: (socket.socket) -> None
+        """Keep connection open after handler thread has finished with it."""
+        with self._connections_lock:
+            self._detached.add(request)
+
+    def shutdown_request(self, request):
+        # type: (Any) -> None
+        with self._connections_lock:
+            if request in self._detached:
+                # Handler thread is done, the connection will be closed
+                # by the code which sends delayed response
+                self._detached.discard(request)
+                return
+        TCPServer.shutdown_request(self, request)
+
+    def run_deferred(
+        self,
+        task,  # type: Callable[[], None]
+        request,  # type: socket.socket # noqa: ARG002 # pylint: disable=W0613
+        cancel,  # type: Callable[[], None] # noqa: ARG002 # pylint: disable=W0613
+    ):
+        # type: (...) -> None
+        """Run task which continues processing of detached connection.
+
+        Args:
+            task: function which sends the response
+            request: the detached connection
+            cancel: function which closes the connection if the task
+                could not be run
+        """
+        th = Thread(target=task)
+        th.daemon = True
+        th.start()
+
+    def server_close(self):
+        # type: () -> None
+        """Close listening socket and stop reading from persistent connections.
+
+        Idle keep-alive connections would otherwise hold handler threads
+        until the keep-alive timeout expires.
+        """
+        TCPServer.server_close(self)
+        self._wakeup_recv.close()
+        self._wakeup_send.close()
+        with self._connections_lock:
+            conns = list(self._connections)
+            scheduler = self._scheduler
+        for conn in conns:
+            shutdown_socket(conn, socket.SHUT_RD)
+        if scheduler:
+            # Close connections which wait for delayed responses
+            scheduler.shutdown()
+
+
+class PoolingTCPServer(ThreadingTCPServer):
+    """Server which handles connections in fixed number of threads.
+
+    Accepted connections wait for free worker in the queue. If the queue is full
+    then the server either waits for free slot or rejects the connection with
+    503 status. Note that persistent connection occupies the worker until it
+    is closed.
+    """
+
+    # fmt: off
+    def __init__(
+        self,
+        server_address,  # type: tuple[str, int]
+        # pylint: disable=line-too-long
+        request_handler_class,  # type: Callable[[Any, Any, ThreadingTCPServer], BaseRequestHandler]
+        # pylint: enable=line-too-long
+        test_server,  # type: TestServer
+        **kwargs # type: Any
+    ):
+    # fmt: on
+        # type: (...) -> None
+        # Worker threads are stopped by server_close() if binding fails
+        self.worker_pool = WorkerPool(
+            cast(int, test_server.max_workers),
+            queue_size=test_server.max_queued_connections,
+        )
+        ThreadingTCPServer.__init__(
+            self, server_address, request_handler_class, test_server, **kwargs
+        )
+
+    def process_request(self, request, client_address):
+        # type: (Any, Any) -> None
+        def task():
+            # type: () -> None
+            self.process_request_thread(request, client_address)
+
+        def cancel():
+            # type: () -> None
+            self.shutdown_request(request)
+
+        block = self.test_server.overflow == "block"
+        if not self.worker_pool.submit(task, block=block, cancel=cancel):
+            self.reject_request(request)
+
+    def run_deferred(
+        self,
+        task,  # type: Callable[[], None]
+        request,  # type: socket.socket
+        cancel,  # type: Callable[[], None]
+    ):
+        # type: (...) -> None
+        # Scheduler thread must not wait for free slot in the queue,
+        # delayed responses to other connections would wait behind it
+        if not self.worker_pool.submit(task, block=False, cancel=cancel):
+            if not self.worker_pool.is_closed():
+                self.send_overloaded_response(request)
+            cancel()
+
+    def reject_request(self, request):
+        # type: (Any) -> None
+        self.send_overloaded_response(request)
+        self.shutdown_request(request)
+
+    def send_overloaded_response(self, request):
+        # type: (Any) -> None
+        self.test_server.count_rejected_connection()
+        body = b"Server is overloaded"
+        try:  # noqa: SIM105
+            request.sendall(
+                b"HTTP/1.0 503 Service Unavailable\r\n"
+                b"Content-Type: text/plain\r\n"
+                b"Connection: close\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+        except socket.error:  # noqa: UP024
+            pass
+
+    def shutdown(self):
+        # type: () -> None
+        # Unblock accepting loop which could wait for free slot in the queue
+        self.worker_pool.close()
+        ThreadingTCPServer.shutdown(self)
+
+    def server_close(self):
+        # type: () -> None
+        ThreadingTCPServer.server_close(self)
+        self.worker_pool.shutdown()
+
+
+class TestServerHandler(BaseHTTPRequestHandler):  # pylint: disable=too-many-instance-attributes
+    # Response is written at once, there is nothing to wait for
+    disable_nagle_algorithm = True
 
-class TestServerHandler(BaseHTTPRequestHandler):
     def __init__(self, request, client_address, server):
         # type: (Any, Any, ThreadingTCPServer) -> None
+        # Base constructor processes the whole connection, so the state
+        # which is changed by handler methods is declared before it
+        self.close_connection = True  # type: bool
+        self.request_processed = False  # type: bool
+        # Response is sent later by another thread
+        self.detached = False  # type: bool
+        self.throttle = None  # type: None | Throttle
         BaseHTTPRequestHandler.__init__(self, request, client_address, server)
         # This assignment is only to ceclare type of self.server attribute
         self.server = server  # type: ThreadingTCPServer
 
+    def setup(self):
+        # type: () -> None
+        test_srv = self.server.test_server
+        # pylint: disable=attribute-defined-outside-init
+        self.protocol_version = test_srv.protocol_version
+        self.num_conn_requests = 0  # type: int
+        self.connected_at = monotonic()  # type: float
+        # Timestamps of current request processing phases
+        self.timings = {}  # type: dict[str, float]
+        # Namespace or the server which current request is routed to
+        self.scope = test_srv  # type: RequestScope
+        # Generation of scope state current request has been received in
+        self.generation = None  # type: None | int
+        # Request line which is read by BaseHTTPRequestHandler.handle_one_request
+        self.raw_requestline = b""  # type: bytes
+        # Headers of current request and their lines as received
+        self.request_headers = HttpHeaderStorage()  # type: HttpHeaderStorage
+        self.raw_headers = b""  # type: bytes
+        # pylint: enable=attribute-defined-outside-init
+        BaseHTTPRequestHandler.setup(self)
+        self.server.register_connection(self.connection)
+
+    def finish(self):
+        # type: () -> None
+        if self.detached:
+            return
+        self.server.unregister_connection(self.connection)
+        BaseHTTPRequestHandler.finish(self)
+
+    def handle_one_request(self):
+        # type: () -> None
+        # Keep-alive timeout limits only the wait for next request
+        # of persistent connection, reading the request and sending
+        # the response are not limited
+        if self.num_conn_requests:
+            self.connection.settimeout(self.server.test_server.keep_alive_timeout)
+        BaseHTTPRequestHandler.handle_one_request(self)
+
+    def parse_request(self):
+        # type: () -> bool
+        # Request line has just been read
+        if self.num_conn_requests:
+            self.connection.settimeout(None)
+        # pylint: disable=attribute-defined-outside-init
+        self.timings = {"received": monotonic()}
+        # pylint: enable=attribute-defined-outside-init
+        if not self.num_conn_requests:
+            self.timings["connected"] = self.connected_at
+        result = self._parse_request_head()
+        if result:
+            # pylint: disable=attribute-defined-outside-init
+            self.scope, self.path = self.server.test_server.route_request(
+                header_value(self.request_headers, "Host"), self.path
+            )
+            self.generation = self.scope.generation
+            # pylint: enable=attribute-defined-outside-init
+        self.timings["parsed"] = monotonic()
+        return result
+
+    def _parse_request_head(self):
+        # type: () -> bool
+        """Parse request line and headers.
+
+        Follows the logic of BaseHTTPRequestHandler.parse_request but
+        the header block is parsed once straight into HttpHeaderStorage
+        which keeps all values of repeated headers. HTTP/0.9 requests
+        are not supported.
+        """
+        # pylint: disable=attribute-defined-outside-init
+        self.command = ""
+        self.request_version = self.default_request_version
+        self.close_connection = True
+        self.requestline = self.raw_requestline.decode("iso-8859-1").rstrip("\r\n")
+        words = self.requestline.split()
+        if not words:
+            return False
+        if len(words) >= 3:  # noqa: PLR2004
+            # Error response to unsupported version must have a status line
+            self.request_version = words[-1]
+        try:
+            self.command, path, self.request_version = parse_request_line(
+                self.requestline
+            )
+            if (
+                self.request_version == "HTTP/1.1"
+                and self.protocol_version == "HTTP/1.1"
+            ):
+                self.close_connection = False
+            # Do not let the path look like network-path reference
+            self.path = "/" + path.lstrip("/") if path.startswith("//") else path
+            self.raw_headers = read_header_block(self.rfile)
+            self.request_headers = parse_header_block(self.raw_headers)
+        except BadRequestError as ex:
+            self.send_error(ex.status, str(ex))
+            return False
+        # Compatible with BaseHTTPRequestHandler interface
+        self.headers = cast(Any, self.request_headers)
+        # pylint: enable=attribute-defined-outside-init
+        conn_type = header_value(self.request_headers, "Connection").lower()
+        if conn_type == "close":
+            self.close_connection = True
+        elif conn_type == "keep-alive" and self.protocol_version == "HTTP/1.1":
+            self.close_connection = False
+        if (
+            header_value(self.request_headers, "Expect").lower() == "100-continue"
+            and self.protocol_version == "HTTP/1.1"
+            and self.request_version == "HTTP/1.1"
+        ):
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        return True
+
     def process_multipart_files(
         self,
         request_data,  # type: bytes
         headers,  # type: Message
     ):
         # type: (...) -> Mapping[str, list[Mapping[str, Any]]]
-        if not headers.get("Content-Type", "").startswith("multipart/form-data;"):
-            return {}
-        _content_type, options = parse_content_header(headers["Content-Type"])
-        files = parse_multipart_form(request_data, options.get("boundary", "").encode())
-        ret = {}  # type: MutableMapping[str, list[Mapping[str, Any]]]
-        for field_key, items in files.items():
-            for item in items:
-                if isinstance(item, dict):
-                    ret.setdefault(field_key, []).append(
-                        {
-                            "name": field_key,
-                            "content_type": item["content_type"],
-                            "filename": item["filename"],
-                            "content": item["content"],
-                        }
-                    )
-                elif isinstance(item, six.text_type):
-                    ret.setdefault(field_key, []).append(
-                        {
-                            "name": field_key,
-                            "content_type": None,
-                            "filename": None,
-                            "content": item,
-                        }
-                    )
-                else:
-                    raise TypeError(
-                        "Unexpected type {} of item returned"
-                        "from parse_multipart_form()".format(type(item))
-                    )
-        return ret
+        return process_multipart_files(
+            RequestBody(request_data), headers.get("Content-Type", "")
+        )
 
     def _read_request_data(self):
-        # type: () -> bytes
-        content_len = int(self.headers.get("Content-Length", "0"))  # type: int
-        return self.rfile.read(content_len)
-
-    def _parse_qs_args(self):
-        # type: () -> Mapping[str, Any]
-        try:
-            qs = self.path.split("?")[1]
-        except IndexError:
-            qs = ""
-        return dict(parse_qsl(qs))
+        # type: () -> tuple[RequestBody, list[tuple[str, str]]]
+        spool_threshold = self.server.test_server.spool_threshold
+        headers = self.request_headers
+        if is_chunked(header_value(headers, "Transfer-Encoding")):
+            return read_chunked_body(self.rfile, spool_threshold)
+        content_len = int(header_value(headers, "Content-Length", "0"))  # type: int
+        body = read_body(self.rfile, content_len, spool_threshold)
+        return body, []
 
     def _collect_request_data(
         self,
         method,  # type: str
     ):
         # type: (...) -> Request
-        req_data = self._read_request_data()
+        # Query string, cookies, headers and multipart form are parsed
+        # only if they are accessed
+        body, trailers = self._read_request_data()
+        self.timings["body_read"] = monotonic()
+        path, _sep, query_string = self.path.partition("?")
         return Request(
-            args=self._parse_qs_args(),
             client_ip=self.client_address[0],
-            path=self.path.split("?")[0],
-            data=req_data,
+            path=path,
+            data=body,
             method=method.upper(),
-            cookies=SimpleCookie(self.headers.get("Cookie", "")),
-            files=self.process_multipart_files(req_data, self.headers),
-            headers=dict(self.headers),
+            headers=self.request_headers,
+            raw_headers=self.raw_headers,
+            trailers=trailers,
+            query_string=query_string,
+            spool_threshold=self.server.test_server.spool_threshold,
+            timings=self.timings,
+            generation=self.generation,
         )
 
     def process_callback_result(
@@ -197,106 +1008,295 @@ class TestServerHandler(BaseHTTPRequestHandler):
         result,  # type: HandlerResult
     ):
         # type: (...) -> None
-        if not isinstance(cb_res, dict):
-            raise InternalError("Callback response is not a dict")
-        if cb_res.get("type") != "response":
-            raise InternalError(
-                'Callback response has invalid "type" key: {}'.format(
-                    cb_res.get("type", "key-not-specified")
-                )
-            )
-        for key in cb_res:
-            if key not in ("type", "status", "headers", "data"):
-                raise InternalError(
-                    "Callback response contains invalid key: {}".format(key)
-                )
-        if "status" in cb_res:
-            result.status = cb_res["status"]
-        if "headers" in cb_res:
-            result.headers.extend(cb_res["headers"])
-        if "data" in cb_res:
-            if isinstance(cb_res["data"], bytes):
-                result.data = cb_res["data"]
-            else:
-                raise InternalError('Callback repsponse field "data" must be bytes')
+        process_callback_result(cb_res, result)
 
-    def _add_required_response_headers(
-        self,
-        headers,  # type: HttpHeaderStorage
-    ):
-        # type: (...) -> None
-        port = self.server.test_server.port
-        headers.set("Listen-Port", str(port))
-        if "content-type" not in headers:
-            headers.set("Content-Type", "text/html; charset=utf-8")
-        if "server" not in headers:
-            headers.set("Server", "TestServer/{}".format(TEST_SERVER_PACKAGE_VERSION))
+    def _check_keep_alive_limit(self):
+        # type: () -> None
+        self.num_conn_requests += 1
+        max_requests = self.server.test_server.keep_alive_max_requests
+        if max_requests is not None and self.num_conn_requests >= max_requests:
+            self.close_connection = True
+
+    def _mark_request_processed(self):
+        # type: () -> None
+        # With known Content-Length client does not wait for connection close
+        # so the request is counted before the last bytes of response are sent
+        if not self.request_processed:
+            self.request_processed = True
+            self.scope.mark_request_processed(self.generation)
 
     def _request_handler(self):
         # type: () -> None
+        self.request_processed = False
+        scope = self.scope
+        timings = self.timings
         try:
-            test_srv = self.server.test_server
+            self._check_keep_alive_limit()
             method = self.command.lower()
-            resp = test_srv.get_response(method)
-            if resp.sleep:
-                time.sleep(resp.sleep)
-            test_srv.add_request(self._collect_request_data(method))
-            result = HandlerResult()
-            if resp.raw_callback:
-                data = resp.raw_callback()
-                if isinstance(data, bytes):
-                    self.write_raw_response_data(data)
-                    return
-                raise InternalError(  # noqa: TRY301
-                    "Raw callback must return bytes data"
-                )
-            if resp.callback:
-                self.process_callback_result(resp.callback(), result)
-            else:
-                result.status = resp.status
-                result.headers.extend(resp.headers.items())
-                if isinstance(resp.data, bytes):
-                    result.data = resp.data
-                elif isinstance(resp.data, six.text_type):
-                    result.data = resp.data.encode("utf-8")
-                else:
-                    raise InternalError(  # noqa: TRY301
-                        'Response parameter "data" must be either str or bytes'
-                    )
-            self._write_response_data(result.status, result.headers, result.data)
+            # pylint: disable=attribute-defined-outside-init
+            self.generation, resp = scope.select_response(
+                method, self.path, self.request_headers.items(), self.generation
+            )
+            # pylint: enable=attribute-defined-outside-init
+            timings["dispatched"] = monotonic()
+            delay = resolve_delay(resp.sleep)
+            if delay > 0 and self.close_connection:
+                # Do not hold the thread while waiting, the connection
+                # is not reused so its processing could be finished
+                # by another thread
+                self._defer_response(delay, resp, method)
+                return
+            if delay > 0:
+                time.sleep(delay)
+            timings["delayed"] = monotonic()
+            scope.add_request(self._collect_request_data(method))
+            self._send_response(resp)
+            timings["sent"] = monotonic()
         except Exception as ex:
             LOG.exception("Unexpected error happend in test server request handler")
+            self._handle_error(ex)
+        finally:
+            if not self.detached:
+                self._mark_request_processed()
+                scope.record_timings(
+                    self.path.partition("?")[0], timings, self.generation
+                )
+
+    def _send_response(
+        self,
+        resp,  # type: Response
+    ):
+        # type: (...) -> None
+        self.throttle = create_throttle(
+            resp.rate_limit_bps, resp.burst, self.server.test_server.bandwidth_bucket
+        )
+        prepared = resp.prepare(self.server.test_server.port, self.protocol_version)
+        if prepared is not None:
+            self.timings["built"] = monotonic()
+            self._write_prepared_response(prepared)
+            return
+        if resp.raw_callback:
+            data = resp.raw_callback()
+            if not isinstance(data, bytes):
+                raise InternalError("Raw callback must return bytes data")
+            self.timings["built"] = monotonic()
+            # Framing of raw response is unknown so the connection
+            # could not be reused for next request
+            self.close_connection = True
+            self.write_raw_response_data(data)
+            return
+        result = HandlerResult()
+        build_handler_result(resp, result)
+        self.timings["built"] = monotonic()
+        self._write_response_data(result.status, result.headers, result.data)
+
+    def _handle_error(
+        self,
+        ex,  # type: Exception
+    ):
+        # type: (...) -> None
+        # Request body might be not read, the connection is out of sync
+        self.close_connection = True
+        # Error could happen while streaming body after response head
+        # has been sent, in such case just close the connection
+        if not self.request_processed:
             self._write_response_data(
                 INTERNAL_ERROR_RESPONSE_STATUS,
                 HttpHeaderStorage(),
                 str(ex).encode("utf-8"),
             )
+
+    def _defer_response(
+        self,
+        delay,  # type: float
+        resp,  # type: Response
+        method,  # type: str
+    ):
+        # type: (...) -> None
+        """Send response after delay without blocking current thread.
+
+        Request body is read after the delay like in the case of response
+        which is sent without deferring.
+        """
+
+        def send():
+            # type: () -> None
+            timings = self.timings
+            timings["delayed"] = monotonic()
+            try:
+                self.scope.add_request(self._collect_request_data(method))
+                self._send_response(resp)
+                timings["sent"] = monotonic()
+            except Exception as ex:
+                LOG.exception("Unexpected error happend while sending delayed response")
+                try:
+                    self._handle_error(ex)
+                except Exception:
+                    LOG.exception("Could not send error response")
+            finally:
+                self._mark_request_processed()
+                self.scope.record_timings(
+                    self.path.partition("?")[0], timings, self.generation
+                )
+                self._close_detached()
+
+        def resume():
+            # type: () -> None
+            self.server.run_deferred(send, self.connection, self._close_detached)
+
+        self.detached = True
+        self.server.detach_request(self.connection)
+        self.server.get_scheduler().schedule(delay, resume, self._close_detached)
+
+    def _close_detached(self):
+        # type: () -> None
+        self.detached = False
+        try:
+            self.finish()
         finally:
-            test_srv.num_req_processed += 1
+            self.server.shutdown_request(self.connection)
 
     def _write_response_data(self, status, headers, data):
-        # type: (int, HttpHeaderStorage, six.binary_type) -> None
-        self._add_required_response_headers(headers)
-        self.send_response(status)
-        for key, val in headers.items():
-            self.send_header(key, val)
-        self.end_headers()
-        self.wfile.write(data)
+        # type: (int, HttpHeaderStorage, bytes | Iterable[Any] | FileBody) -> None
+        add_required_response_headers(headers, self.server.test_server.port)
+        if isinstance(data, FileBody):
+            self._write_file_response(status, headers, data)
+            return
+        if isinstance(data, bytes):
+            if "content-length" not in headers:
+                headers.set("Content-Length", str(len(data)))
+            self._write_response_head(status, headers, data)
+            return
+        chunked, stream_size, close = setup_stream_framing(
+            headers,
+            chunked_allowed=(
+                self.protocol_version == "HTTP/1.1"
+                and self.request_version != "HTTP/1.0"
+            ),
+        )
+        if close:
+            self.close_connection = True
+        stream = iter_stream_body(data, chunked, stream_size)
+        self._write_response_head(status, headers)
+        # Socket writes block while client is reading previous data
+        for piece in stream:
+            self._write_body(piece)
 
-    def write_raw_response_data(
+    def _write_body(
         self,
         data,  # type: bytes
     ):
         # type: (...) -> None
-        self.wfile.write(data)
-        # pylint: disable=attribute-defined-outside-init
-        self._headers_buffer = []  # type: list[str]
+        if self.throttle is None:
+            self.wfile.write(data)
+            return
+        for wait, start, end in self.throttle.iter_spans(len(data)):
+            if wait > 0:
+                time.sleep(wait)
+            self.wfile.write(data[start:end])
 
-    # https://github.com/python/cpython/blob/main/Lib/http/server.py
-    def send_response(
+    def _write_file_response(
         self,
-        code,  # type: int
-        message=None,  # type: None | str
+        status,  # type: int
+        headers,  # type: HttpHeaderStorage
+        body,  # type: FileBody
+    ):
+        # type: (...) -> None
+        size = body.open()
+        try:
+            if "content-length" not in headers:
+                headers.set("Content-Length", str(size))
+            self._write_response_head(status, headers)
+            if self.throttle is None:
+                body.sendfile(self.connection)
+                return
+            for wait, start, end in self.throttle.iter_spans(size):
+                if wait > 0:
+                    time.sleep(wait)
+                body.sendfile(self.connection, start, end - start)
+        finally:
+            body.close()
+
+    def _write_response_head(
+        self,
+        status,  # type: int
+        headers,  # type: HttpHeaderStorage
+        body=b"",  # type: bytes
+    ):
+        # type: (...) -> None
+        """Write status line, headers and optional body."""
+        self._write_head_and_body(
+            status,
+            serialize_response_head(self.protocol_version, status, headers),
+            headers.get("connection").lower() if "connection" in headers else None,
+            body,
+        )
+
+    def _write_prepared_response(
+        self,
+        prepared,  # type: PreparedResponse
+    ):
+        # type: (...) -> None
+        self._write_head_and_body(
+            prepared.status, prepared.head, prepared.connection, prepared.body
+        )
+
+    def _write_head_and_body(
+        self,
+        status,  # type: int
+        head,  # type: bytes
+        connection,  # type: None | str
+        body,  # type: bytes
+    ):
+        # type: (...) -> None
+        """Write the response with single system call if it is possible.
+
+        Args:
+            status: response status
+            head: serialized status line and headers
+            connection: lower-cased value of Connection header in the head
+            body: response body
+        """
+        # Same logic as in BaseHTTPRequestHandler.send_header
+        if connection == "close":
+            self.close_connection = True
+        elif connection == "keep-alive":
+            self.close_connection = False
+        elif self.protocol_version == "HTTP/1.1" and self.close_connection:
+            head += CONNECTION_CLOSE_HEADER
+        self.log_request(status)
+        self._mark_request_processed()
+        if self.throttle is None and len(body) <= MAX_COALESCED_BODY_SIZE:
+            self.wfile.write(b"".join((head, b"\r\n", body)))
+        else:
+            self.wfile.write(head + b"\r\n")
+            if body:
+                self._write_body(body)
+
+    def write_raw_response_data(
+        self,
+        data,  # type: bytes
+    ):
+        # type: (...) -> None
+        self._mark_request_processed()
+        self._write_body(data)
+        # pylint: disable=attribute-defined-outside-init
+        self._headers_buffer = []  # type: list[str]
+
+    def log_request(
+        self,
+        code="-",  # type: int | str
+        size="-",  # type: int | str
+    ):
+        # type: (...) -> None
+        if self.server.test_server.access_log:
+            BaseHTTPRequestHandler.log_request(self, code, size)
+
+    # https://github.com/python/cpython/blob/main/Lib/http/server.py
+    def send_response(
+        self,
+        code,  # type: int
+        message=None,  # type: None | str
     ):
         # type: (...) -> None
         """Do not send Server and Date headers.
@@ -325,39 +1325,593 @@ class TestServerHandler(BaseHTTPRequestHandler):
     do_PATCH = _request_handler  # noqa: N815
 
 
-class TestServer(object):  # pylint: disable=too-many-instance-attributes
+class RequestScope(object):  # pylint: disable=too-many-instance-attributes
+    """Responses, request log, counters and stats of requests.
+
+    TestServer is the scope of requests which are not routed to any of its
+    namespaces, each Namespace is a separate scope.
+    """
+
+    def __init__(
+        self,
+        max_logged_requests=None,  # type: None | int
+        max_logged_bytes=None,  # type: None | int
+        log_retention="last",  # type: str
+    ):
+        # type: (...) -> None
+        if log_retention not in VALID_RETENTION_MODES:
+            raise TestServerError("Invalid log retention: {}".format(log_retention))
+        self._log_options = {
+            "max_requests": max_logged_requests,
+            "max_bytes": max_logged_bytes,
+            "retention": log_retention,
+        }  # type: dict[str, Any]
+        # Guards request log and counters, notified when request is processed
+        self._cond = Condition()  # type: Condition
+        # Incremented by reset(), requests received in previous generation
+        # are not logged and counted
+        self.generation = 0  # type: None | int
+        self.num_req_processed = 0  # type: int
+        self.num_req_stale = 0  # type: int
+
+    # Set by subclasses, used to serialize responses in advance
+    port = None  # type: None | int
+    protocol_version = "HTTP/1.0"  # type: str
+
+    def add_request(
+        self,
+        req,  # type: Request
+    ):
+        # type: (...) -> None
+        """Add request to the log unless it is received before last reset."""
+        with self._cond:
+            if not self._is_stale(req.generation):
+                self._request_log.append(req)
+
+    def mark_request_processed(
+        self,
+        generation=None,  # type: None | int
+    ):
+        # type: (...) -> None
+        """Count processed request and wake up threads waiting for it.
+
+        Requests received before last reset are counted in num_req_stale.
+        """
+        with self._cond:
+            if self._is_stale(generation):
+                self.num_req_stale += 1
+                return
+            self.num_req_processed += 1
+            self._cond.notify_all()
+
+    def record_timings(
+        self,
+        path,  # type: str
+        timings,  # type: Mapping[str, float]
+        generation=None,  # type: None | int
+    ):
+        # type: (...) -> None
+        """Add durations of request processing phases to stats."""
+        with self._cond:
+            if self._is_stale(generation):
+                return
+            stats = self._stats
+        stats.add(path, timings)
+
+    def _is_stale(
+        self,
+        generation,  # type: None | int
+    ):
+        # type: (...) -> bool
+        """Check if request has been received before last reset.
+
+        Must be called with acquired self._cond lock.
+        """
+        return generation is not None and generation != self.generation
+
+    def stats(self):
+        # type: () -> dict[str, Any]
+        """Return histograms of request processing phase durations.
+
+        Durations are in seconds. The result is a dict with "phases" key
+        containing histograms of all requests and "paths" key containing
+        histograms of requests grouped by path. Each histogram is a dict
+        with count, p50, p99 and max keys.
+
+        See stats.PHASES for the list of phases.
+        """
+        return self._stats.summary()
+
+    def reset(self):
+        # type: () -> None
+        """Drop responses, request log and counters.
+
+        New state replaces the old one and the generation is incremented.
+        Requests which are still processed by the server since before the reset
+        could not get responses added after it and are not logged or counted.
+        """
+        with self._cond:
+            self.generation = cast(int, self.generation) + 1
+            self.num_req_processed = 0
+            self.num_req_stale = 0
+            # pylint: disable=attribute-defined-outside-init
+            self._request_log = RequestLog(**self._log_options)  # type: RequestLog
+            self._dispatcher = ResponseDispatcher()  # type: ResponseDispatcher
+            self._stats = RequestStats()  # type: RequestStats
+            # pylint: enable=attribute-defined-outside-init
+
+    def _wait_condition(
+        self,
+        check,  # type: Callable[[], bool]
+        timeout,  # type: None | float
+        error_msg,  # type: str
+    ):
+        # type: (...) -> None
+        """Wait until check() returns True.
+
+        The check function is called with acquired self._cond lock
+        each time a request is processed.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while not check():
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise WaitTimeoutError(error_msg)
+                    self._cond.wait(remaining)
+
+    def wait_request(
+        self,
+        timeout,  # type: float
+    ):
+        # type: (...) -> None
+        """Wait until at least one request is processed."""
+        self.wait_requests(1, timeout)
+
+    def wait_requests(
+        self,
+        count,  # type: int
+        timeout,  # type: None | float
+    ):
+        # type: (...) -> None
+        """Wait until number of processed requests reaches the count.
+
+        Raises:
+            WaitTimeoutError: if requests are not processed in timeout seconds
+        """
+        self._wait_condition(
+            lambda: self.num_req_processed >= count,
+            timeout,
+            "{} request(s) not processed in {} seconds".format(count, timeout),
+        )
+
+    def wait_for(
+        self,
+        predicate=None,  # type: None | Callable[[Request], bool]
+        timeout=None,  # type: None | float
+        path=None,  # type: None | str
+        method=None,  # type: None | str
+    ):
+        # type: (...) -> Request
+        """Wait for processed request matching all given conditions.
+
+        Requests processed before the call are checked too.
+
+        Args:
+            predicate: function which accepts Request and returns bool
+            timeout: number of seconds to wait, None means wait forever
+            path: required path of request
+            method: required HTTP method of request, case insensitive
+
+        Returns:
+            The earliest matching request.
+
+        Raises:
+            WaitTimeoutError: if no matching request processed in timeout seconds
+        """
+        found = []  # type: list[Request]
+        # Sequence number of last checked request
+        checked = [0]
+
+        def match(req):
+            # type: (Request) -> bool
+            return (
+                (path is None or req.path == path)
+                and (method is None or req.method == method.upper())
+                and (predicate is None or predicate(req))
+            )
+
+        def check():
+            # type: () -> bool
+            for seq, req in self._request_log.since(checked[0]):
+                checked[0] = seq
+                if match(req):
+                    found.append(req)
+                    return True
+            return False
+
+        self._wait_condition(
+            check,
+            timeout,
+            "No matching request processed in {} seconds".format(timeout),
+        )
+        return found[0]
+
+    def request_is_done(self):
+        # type: () -> bool
+        return self.num_req_processed > 0
+
+    def get_request(self):
+        # type: () -> Request
+        try:
+            with self._cond:
+                return cast(Request, self._request_log.last())
+        except IndexError:
+            # TODO: from ex
+            raise RequestNotProcessedError("Request has not been processed")
+
+    def get_requests(self):
+        # type: () -> list[Request]
+        """Return requests kept in the request log, oldest first."""
+        with self._cond:
+            return self._request_log.requests()
+
+    @property
+    def num_req_logged(self):
+        # type: () -> int
+        """Number of requests passed to the request log, including dropped ones."""
+        return self._request_log.num_logged
+
+    @property
+    def num_req_dropped(self):
+        # type: () -> int
+        """Number of requests dropped from the request log due to its limits."""
+        return self._request_log.num_dropped
+
+    @property
+    def request(self):
+        # type: () -> Request
+        return self.get_request()
+
+    def add_response(
+        self,
+        resp,  # type: Response
+        count=1,  # type: int
+        method=None,  # type: None | str
+        path=None,  # type: None | str
+        path_regex=None,  # type: None | str | Pattern[str]
+        headers=None,  # type: None | Mapping[str, str]
+        args=None,  # type: None | Mapping[str, str]
+    ):
+        # type: (...) -> None
+        """Schedule the response to be served count times.
+
+        Args:
+            resp: the response
+            count: how many times to serve the response, -1 means forever
+            method: serve only requests with this HTTP method
+            path: serve only requests with exactly this path
+            path_regex: serve only requests which path matches the regular
+                expression, the match is anchored at the start of the path
+            headers: serve only requests having all these headers with same values
+            args: serve only requests having all these query string arguments
+
+        The response for exact path has priority over responses for path regular
+        expressions which in turn have priority over responses for any path.
+        Among responses for same path and method, ones with headers or args
+        conditions are checked first.
+
+        Raises:
+            TestServerError: worker processes are running and the response
+                could not be pickled to be passed to them
+        """
+        self._validate_response_args(count, method, path, path_regex)
+        self._prepare_response(resp)
+        self._share_responses([resp])
+        self._dispatcher.add(resp, count, method, path, path_regex, headers, args)
+
+    def add_responses(
+        self,
+        resps,  # type: Iterable[Response]
+        count=1,  # type: int
+        method=None,  # type: None | str
+        path=None,  # type: None | str
+        path_regex=None,  # type: None | str | Pattern[str]
+        headers=None,  # type: None | Mapping[str, str]
+        args=None,  # type: None | Mapping[str, str]
+    ):
+        # type: (...) -> None
+        """Add multiple responses at once.
+
+        Each response is served count times, in the order of given sequence.
+        Other arguments are same as of add_response().
+        """
+        self._validate_response_args(count, method, path, path_regex)
+        resps = list(resps)
+        for resp in resps:
+            self._prepare_response(resp)
+        self._share_responses(resps)
+        self._dispatcher.extend(resps, count, method, path, path_regex, headers, args)
+
+    def _prepare_response(
+        self,
+        resp,  # type: Response
+    ):
+        # type: (...) -> None
+        """Serialize static response in advance if the server port is known."""
+        if self.port is None:
+            return
+        try:  # noqa: SIM105
+            resp.prepare(self.port, self.protocol_version)
+        except ValueError:
+            # The error is reported to client when the response is served
+            pass
+
+    def _share_responses(
+        self,
+        resps,  # type: list[Response]
+    ):
+        # type: (...) -> None
+        """Make responses available to other processes, no-op by default."""
+
+    def _validate_response_args(
+        self,
+        count,  # type: int
+        method,  # type: None | str
+        path,  # type: None | str
+        path_regex,  # type: None | str | Pattern[str]
+    ):
+        # type: (...) -> None
+        assert method is None or isinstance(method, str)
+        assert count < 0 or count > 0
+        if method and method not in VALID_METHODS:
+            raise TestServerError("Invalid method: {}".format(method))
+        if path is not None and path_regex is not None:
+            raise TestServerError("Options path and path_regex are mutually exclusive")
+
+    def get_response(
+        self,
+        method,  # type: str
+        target="/",  # type: str
+        headers=None,  # type: None | Iterable[tuple[str, str]]
+    ):
+        # type: (...) -> Response
+        return self.select_response(method, target, headers)[1]
+
+    def select_response(
+        self,
+        method,  # type: str
+        target="/",  # type: str
+        headers=None,  # type: None | Iterable[tuple[str, str]]
+        generation=None,  # type: None | int
+    ):
+        # type: (...) -> tuple[None | int, Response]
+        """Find response to request received in given generation of server state.
+
+        Returns:
+            Tuple of (generation, response), the generation is the current one
+            if None is passed.
+
+        Raises:
+            NoResponseError: the request has been received before last reset
+                or there is no response matching the request
+        """
+        with self._cond:
+            if self._is_stale(generation):
+                raise NoResponseError(
+                    "Request has been received before the server was reset"
+                )
+            generation = self.generation
+            dispatcher = self._dispatcher
+        return generation, cast(Response, dispatcher.get(method, target, headers))
+
+
+class Namespace(RequestScope):
+    """Isolated scope of requests served by TestServer.
+
+    Namespace is created by TestServer.namespace(). It has its own responses,
+    request log, counters and stats, so tests which run in parallel could
+    use single server without interfering with each other.
+    """
+
     __test__ = False  # for pytest ignore this class
 
     def __init__(
+        self,
+        server,  # type: TestServer
+        prefix=None,  # type: None | str
+        host=None,  # type: None | str
+    ):
+        # type: (...) -> None
+        RequestScope.__init__(self)
+        # Limits of request log are same as of the server
+        self._log_options = server._log_options  # noqa: SLF001 # pylint: disable=protected-access
+        self.server = server
+        self.prefix = prefix
+        self.host = host
+        self.port = server.port
+        self.protocol_version = server.protocol_version
+        self.reset()
+
+    def get_url(
+        self,
+        path="",  # type: str
+        port=None,  # type: None | int
+    ):
+        # type: (...) -> str
+        """Build URL of the path in the namespace.
+
+        URL of namespace routed by host contains that host name, it must
+        be resolved to the server address by HTTP client.
+        """
+        if self.prefix is not None:
+            return self.server.get_url(self.prefix + "/" + path.lstrip("/"), port)
+        if port is None:
+            port = cast(int, self.server.port)
+        return urljoin("http://{}:{:d}".format(self.host, port), path)
+
+    def remove(self):
+        # type: () -> None
+        """Stop routing requests to the namespace."""
+        self.server.remove_namespace(self)
+
+
+class TestServer(RequestScope):  # pylint: disable=too-many-instance-attributes
+    __test__ = False  # for pytest ignore this class
+
+    def __init__(  # noqa: PLR0913, PLR0917 # pylint: disable=too-many-arguments,too-many-locals
         self,
         address="127.0.0.1",  # type: str
         port=0,  # type: int
+        protocol_version="HTTP/1.0",  # type: str
+        keep_alive_timeout=DEFAULT_KEEP_ALIVE_TIMEOUT,  # type: None | float
+        keep_alive_max_requests=DEFAULT_KEEP_ALIVE_MAX_REQUESTS,  # type: None | int
+        engine="threading",  # type: str
+        max_workers=None,  # type: None | int
+        max_queued_connections=None,  # type: None | int
+        overflow="block",  # type: str
+        max_logged_requests=None,  # type: None | int
+        max_logged_bytes=None,  # type: None | int
+        log_retention="last",  # type: str
+        spool_threshold=DEFAULT_SPOOL_THRESHOLD,  # type: None | int
+        bandwidth_limit_bps=None,  # type: None | float
+        workers=None,  # type: None | int
+        access_log=True,  # type: bool
     ):
         # type: (...) -> None
+        """Configure HTTP server.
+
+        Args:
+            address: interface to listen on
+            port: port to listen on, zero means any free port
+            protocol_version: "HTTP/1.0" closes connection after each response,
+                "HTTP/1.1" keeps connections open for subsequent requests
+            keep_alive_timeout: seconds an idle persistent connection is kept open
+            keep_alive_max_requests: number of requests served by one persistent
+                connection before it is closed, None means no limit
+            engine: "threading" handles each connection in separate thread,
+                "asyncio" handles all connections in single event loop (python 3)
+            max_workers: number of threads handling connections, None means
+                new thread for each connection (threading engine only)
+            max_queued_connections: number of accepted connections waiting
+                for free worker, None means no limit
+            overflow: what to do with new connection when the queue is full:
+                "block" waits for free slot, "reject" responds with 503 status
+            max_logged_requests: number of requests kept in the request log,
+                None means no limit
+            max_logged_bytes: total size of requests bodies and headers
+                kept in the request log, None means no limit
+            log_retention: which requests to keep when the log is full:
+                "last" keeps most recent requests, "first" keeps earliest ones
+            spool_threshold: request bodies larger than this number of bytes
+                are stored in temporary files, None means always keep in memory
+            bandwidth_limit_bps: limit of total rate of sending response data
+                to all clients in bytes per second, None means no limit
+            workers: number of forked processes which handle connections,
+                they listen on the same port using SO_REUSEPORT option.
+                None means connections are handled in the current process.
+                Responses added after start() or reset() are pickled to be
+                passed to workers, so they could not use local callbacks
+            access_log: write line about each request to stderr
+                (threading engine only)
+        """
+        if protocol_version not in VALID_PROTOCOL_VERSIONS:
+            raise TestServerError(
+                "Invalid protocol version: {}".format(protocol_version)
+            )
+        if engine not in VALID_ENGINES:
+            raise TestServerError("Invalid engine: {}".format(engine))
+        if engine == "asyncio" and six.PY2:
+            raise TestServerError("The asyncio engine requires python 3")
+        if overflow not in VALID_OVERFLOW_MODES:
+            raise TestServerError("Invalid overflow mode: {}".format(overflow))
+        if workers is not None:
+            if workers < 1:
+                raise TestServerError("Number of workers must be positive")
+            if not is_prefork_supported():
+                raise TestServerError(
+                    "Worker processes require fork() and SO_REUSEPORT support"
+                )
+        RequestScope.__init__(
+            self,
+            max_logged_requests=max_logged_requests,
+            max_logged_bytes=max_logged_bytes,
+            log_retention=log_retention,
+        )
+        self.workers = workers  # type: None | int
+        self.access_log = access_log  # type: bool
+        # Worker processes, used in the parent process
+        self._worker_procs = []  # type: list[WorkerProcess]
+        # Socket which holds the port shared by worker processes
+        self._port_socket = None  # type: None | socket.socket
+        # Connection to the parent process, used in worker process
+        self._channel = None  # type: None | ParentChannel
+        # Responses which could be served by workers, keys are their ids.
+        # The workers get copy of it when they are forked, the responses
+        # added later are passed to workers on demand
+        self._worker_responses = {}  # type: dict[int, Response]
+        # Generation of parent process state the local copy of responses
+        # belongs to, used in worker process
+        self._response_generation = 0  # type: None | int
+        self._num_namespaces = 0  # type: int
+        self.engine = engine  # type: str
+        self.max_workers = max_workers  # type: None | int
+        self.max_queued_connections = max_queued_connections  # type: None | int
+        self.overflow = overflow  # type: str
+        self.spool_threshold = spool_threshold  # type: None | int
+        try:
+            self.bandwidth_bucket = (
+                TokenBucket(bandwidth_limit_bps) if bandwidth_limit_bps else None
+            )  # type: None | TokenBucket
+        except ValueError as ex:
+            raise TestServerError(str(ex))
+        self.num_conn_rejected = 0  # type: int
+        self.protocol_version = protocol_version  # type: str
+        self.keep_alive_timeout = keep_alive_timeout  # type: None | float
+        self.keep_alive_max_requests = keep_alive_max_requests  # type: None | int
         self.server_started = Event()  # type: Event
-        self._requests = []  # type: list[Request]
-        self._responses = defaultdict(
-            list
-        )  # type: MutableMapping[None | str, list[MutableMapping[str, Any]]]
         self.port = None  # type: None | int
         self._config_port = port  # type: int
         self.address = address  # type: str
         self._thread = None  # type: None | Thread
-        self._server = None  # type: None | ThreadingTCPServer
+        # ThreadingTCPServer or AsyncioServer
+        self._server = None  # type: Any
         self._started = Event()  # type: Event
-        self.num_req_processed = 0  # type: int
         self.reset()
 
-    def _thread_server(self):
-        # type: () -> None
-        """Ask HTTP server start processing requests.
+    def _create_server(self):
+        # type: () -> Any
+        """Create HTTP server which socket is already bound and listening.
 
-        This function is supposed to be run in separate thread.
+        Connections made after this function returns wait in the listen
+        backlog until the server thread starts accepting them.
         """
-        self._server = ThreadingTCPServer(
+        if self.engine == "asyncio":
+            # pylint: disable=import-outside-toplevel,cyclic-import
+            from .asyncio_engine import AsyncioServer  # noqa: PLC0415
+
+            return AsyncioServer((self.address, self._config_port), test_server=self)
+        server_cls = (
+            ThreadingTCPServer if self.max_workers is None else PoolingTCPServer
+        )
+        return server_cls(
             (self.address, self._config_port), TestServerHandler, test_server=self
         )
-        self._server.serve_forever(poll_interval=0.1)
+
+    def _start_server(
+        self,
+        daemon,  # type: bool
+    ):
+        # type: (...) -> None
+        """Bind the server socket and start processing requests in new thread."""
+        self._server = self._create_server()
+        self.port = self._server.socket.getsockname()[1]
+        self._thread = Thread(target=self._server.serve_forever)
+        self._thread.daemon = daemon
+        self._thread.start()
 
     # ****************
     # Public Interface
@@ -368,14 +1922,162 @@ class TestServer(object):  # pylint: disable=too-many-instance-attributes
         req,  # type: Request
     ):
         # type: (...) -> None
-        self._requests.append(req)
+        if self._channel is not None:
+            self._channel.send(("request", request_fields(req)))
+            return
+        RequestScope.add_request(self, req)
+
+    def mark_request_processed(
+        self,
+        generation=None,  # type: None | int
+    ):
+        # type: (...) -> None
+        if self._channel is not None:
+            # Wait until parent process has counted the request so it is
+            # already counted when client gets the response
+            self._channel.call(("processed", generation))
+            return
+        RequestScope.mark_request_processed(self, generation)
+
+    def record_timings(
+        self,
+        path,  # type: str
+        timings,  # type: Mapping[str, float]
+        generation=None,  # type: None | int
+    ):
+        # type: (...) -> None
+        if self._channel is not None:
+            self._channel.send(("timings", path, dict(timings), generation))
+            return
+        RequestScope.record_timings(self, path, timings, generation)
+
+    def select_response(
+        self,
+        method,  # type: str
+        target="/",  # type: str
+        headers=None,  # type: None | Iterable[tuple[str, str]]
+        generation=None,  # type: None | int
+    ):
+        # type: (...) -> tuple[None | int, Response]
+        if self._channel is not None:
+            return self._get_worker_response(method, target, headers)
+        return RequestScope.select_response(self, method, target, headers, generation)
 
     def reset(self):
         # type: () -> None
-        self.num_req_processed = 0
-        # self._requests.clear()
-        del self._requests[:]
-        self._responses.clear()
+        """Drop responses, request log, counters and namespaces."""
+        with self._cond:
+            RequestScope.reset(self)
+            self.num_conn_rejected = 0
+            self._worker_responses = {}
+            # pylint: disable=attribute-defined-outside-init
+            # Namespaces routed by Host header and by first segment of path
+            self._host_namespaces = {}  # type: dict[str, Namespace]
+            self._prefix_namespaces = {}  # type: dict[str, Namespace]
+            # pylint: enable=attribute-defined-outside-init
+
+    def namespace(
+        self,
+        prefix=None,  # type: None | str
+        host=None,  # type: None | str
+    ):
+        # type: (...) -> Namespace
+        """Create the namespace which has its own responses and request log.
+
+        Requests are routed to the namespace by Host header or by the first
+        segment of the path. If neither host nor prefix is given then
+        unique prefix is generated.
+
+        Args:
+            prefix: path prefix of the namespace, e.g. "/api", it is removed
+                from the path of routed request
+            host: host name which requests to the namespace are sent to,
+                it is compared with Host header without port
+
+        Raises:
+            TestServerError: invalid or already used prefix or host
+        """
+        if self.workers:
+            raise TestServerError("Namespaces are not supported with worker processes")
+        if prefix is not None and host is not None:
+            raise TestServerError("Options prefix and host are mutually exclusive")
+        if prefix is not None and (
+            not prefix.startswith("/") or not prefix[1:] or "/" in prefix[1:]
+        ):
+            raise TestServerError(
+                "Prefix must be single path segment like /name: {}".format(prefix)
+            )
+        with self._cond:
+            self._num_namespaces += 1
+            if prefix is None and host is None:
+                prefix = "/ns-{}".format(self._num_namespaces)
+            if host is not None:
+                host = host.lower()
+            if (prefix is not None and prefix in self._prefix_namespaces) or (
+                host is not None and host in self._host_namespaces
+            ):
+                raise TestServerError("Namespace {} exists".format(prefix or host))
+            nspace = Namespace(self, prefix, host)
+            if host is not None:
+                self._host_namespaces[host] = nspace
+            else:
+                self._prefix_namespaces[cast(str, prefix)] = nspace
+        return nspace
+
+    def remove_namespace(
+        self,
+        nspace,  # type: Namespace
+    ):
+        # type: (...) -> None
+        """Stop routing requests to the namespace."""
+        with self._cond:
+            if nspace.host is not None:
+                self._host_namespaces.pop(nspace.host, None)
+            elif nspace.prefix is not None:
+                self._prefix_namespaces.pop(nspace.prefix, None)
+
+    def route_request(
+        self,
+        host,  # type: None | str
+        target,  # type: str
+    ):
+        # type: (...) -> tuple[RequestScope, str]
+        """Find the scope which handles the request.
+
+        Args:
+            host: value of Host header
+            target: request target, path with query string
+
+        Returns:
+            Tuple of (namespace or the server itself, request target relative
+            to the namespace).
+        """
+        if host and self._host_namespaces:
+            name, sep, port = host.rpartition(":")
+            nspace = self._host_namespaces.get(
+                (name if sep and port.isdigit() else host).lower()
+            )
+            if nspace is not None:
+                return nspace, target
+        if self._prefix_namespaces and target.startswith("/"):
+            end = len(target)
+            for sep in "/?":
+                idx = target.find(sep, 1)
+                if idx != -1:
+                    end = min(end, idx)
+            nspace = self._prefix_namespaces.get(target[:end])
+            if nspace is not None:
+                rest = target[end:]
+                return nspace, rest if rest.startswith("/") else "/" + rest
+        return self, target
+
+    def count_rejected_connection(self):
+        # type: () -> None
+        if self._channel is not None:
+            self._channel.send(("rejected",))
+            return
+        with self._cond:
+            self.num_conn_rejected += 1
 
     def start(
         self,
@@ -383,27 +2085,112 @@ class TestServer(object):  # pylint: disable=too-many-instance-attributes
     ):
         # type: (...) -> None
         """Start the HTTP server."""
-        self._thread = Thread(
-            target=self._thread_server,
-        )
-        self._thread.daemon = daemon
-        self._thread.start()
-        self.wait_server_started()
-        self.port = cast(ThreadingTCPServer, self._server).socket.getsockname()[1]
+        if self.workers:
+            self._start_workers()
+            return
+        self._start_server(daemon)
+
+    def _start_workers(self):
+        # type: () -> None
+        self._port_socket = reserve_port(self.address, self._config_port)
+        self.port = self._port_socket.getsockname()[1]
+        try:
+            # All processes are forked before threads handling their
+            # messages are started
+            for idx in range(cast(int, self.workers)):
+                self._worker_procs.append(
+                    WorkerProcess(
+                        self._run_worker,
+                        self._handle_worker_message,
+                        name="TestServerWorkerProcess-{}".format(idx),
+                    )
+                )
+            for proc in self._worker_procs:
+                proc.start()
+            for proc in self._worker_procs:
+                if not proc.started.wait(WORKER_START_TIMEOUT):
+                    raise TestServerError(  # noqa: TRY301
+                        "Worker process has not started"
+                    )
+        except BaseException:
+            self._stop_workers()
+            raise
+        self.server_started.set()
+
+    def _stop_workers(self):
+        # type: () -> None
+        for proc in self._worker_procs:
+            proc.stop()
+        self._worker_procs = []
+        if self._port_socket is not None:
+            self._port_socket.close()
+            self._port_socket = None
+
+    def _run_worker(
+        self,
+        channel,  # type: ParentChannel
+    ):
+        # type: (...) -> None
+        """Start the server in worker process."""
+        self._channel = channel
+        self._worker_procs = []
+        if self._port_socket is not None:
+            self._port_socket.close()
+            self._port_socket = None
+        self._config_port = cast(int, self.port)
+        self._response_generation = self.generation
+        # The parent process assigns generation to requests which workers receive
+        self.generation = None
+        self._start_server(daemon=True)
+
+    def _handle_worker_message(
+        self,
+        msg,  # type: tuple[Any, ...]
+    ):
+        # type: (...) -> Any
+        """Handle message of worker process in the parent process."""
+        kind = msg[0]
+        if kind == "response":
+            generation, resp = self.select_response(*msg[1:])
+            with self._cond:
+                self._worker_responses[id(resp)] = resp
+                return generation, id(resp)
+        if kind == "fetch":
+            with self._cond:
+                if msg[1] not in self._worker_responses:
+                    raise NoResponseError("Response has been removed by reset")
+                return self._worker_responses[msg[1]]
+        if kind == "request":
+            self.add_request(Request(**msg[1]))
+        elif kind == "processed":
+            self.mark_request_processed(msg[1])
+        elif kind == "rejected":
+            self.count_rejected_connection()
+        elif kind == "timings":
+            self.record_timings(msg[1], msg[2], msg[3])
+        else:
+            raise InternalError("Invalid message of worker: {}".format(kind))
+        return None
 
     def wait_server_started(self):
         # type: () -> None
-        # I could not foind another way
-        # to handle multiple socket issues
-        # other than taking some sleep
-        time.sleep(0.01)
         self.server_started.wait()
 
-    def stop(self):
-        # type: () -> None
+    def stop(
+        self,
+        timeout=DEFAULT_STOP_TIMEOUT,  # type: float
+    ):
+        # type: (...) -> None
+        """Stop the HTTP server.
+
+        Args:
+            timeout: number of seconds to wait for requests being processed,
+                connections which are still open after that are closed
+        """
+        if self._worker_procs:
+            self._stop_workers()
         if self._server:
-            self._server.shutdown()
-            self._server.server_close()
+            self._server.stop(timeout)
 
     def get_url(
         self,
@@ -416,78 +2203,57 @@ class TestServer(object):  # pylint: disable=too-many-instance-attributes
             port = cast(int, self.port)
         return urljoin("http://{}:{:d}".format(self.address, port), path)
 
-    def wait_request(
+    def _share_responses(
         self,
-        timeout,  # type: float
+        resps,  # type: list[Response]
     ):
         # type: (...) -> None
-        """Stupid implementation that eats CPU."""
-        start = time.time()  # type: float
-        while True:
-            if self.num_req_processed:
-                break
-            time.sleep(0.01)
-            if time.time() - start > timeout:
-                raise WaitTimeoutError(
-                    "No request processed in {} seconds".format(timeout)
-                )
-
-    def request_is_done(self):
-        # type: () -> bool
-        return self.num_req_processed > 0
-
-    def get_request(self):
-        # type: () -> Request
-        try:
-            return self._requests[-1]
-        except IndexError:
-            # TODO: from ex
-            raise RequestNotProcessedError("Request has not been processed")
+        """Make responses available to worker processes.
 
-    @property
-    def request(self):
-        # type: () -> Request
-        return self.get_request()
+        Workers forked later get copy of the responses, the responses added
+        when workers are running are pickled to be passed to them.
 
-    def add_response(
-        self,
-        resp,  # type: Response
-        count=1,  # type: int
-        method=None,  # type: None | str
-    ):
-        # type: (...) -> None
-        assert method is None or isinstance(method, str)
-        assert count < 0 or count > 0
-        if method and method not in VALID_METHODS:
-            raise TestServerError("Invalid method: {}".format(method))
-        self._responses[method].append(
-            {
-                "count": count,
-                "response": resp,
-            },
-        )
+        Raises:
+            TestServerError: the response could not be pickled
+        """
+        if self.workers:
+            if self._worker_procs:
+                for resp in resps:
+                    try:
+                        pickle.dumps(resp, pickle.HIGHEST_PROTOCOL)
+                    except Exception as ex:  # noqa: BLE001, PERF203
+                        raise TestServerError(
+                            "Response could not be passed to running worker"
+                            " processes, add it before start(): {}".format(ex)
+                        )
+            with self._cond:
+                for resp in resps:
+                    self._worker_responses[id(resp)] = resp
 
-    def get_response(
+    def _get_worker_response(
         self,
         method,  # type: str
+        target,  # type: str
+        headers,  # type: None | Iterable[tuple[str, str]]
     ):
-        # type: (...) -> Response
-        while True:
-            item = None
-            scope = None
-            try:
-                scope = self._responses[method]
-                item = scope[0]
-            except IndexError:
-                try:
-                    scope = self._responses[None]
-                    item = scope[0]
-                except IndexError:
-                    # TODO: from ex
-                    raise NoResponseError("No response available")
-            if item["count"] == -1:
-                return cast(Response, item["response"])
-            item["count"] -= 1
-            if item["count"] < 1:
-                scope.pop(0)
-            return cast(Response, item["response"])
+        # type: (...) -> tuple[None | int, Response]
+        """Ask the parent process for response and find it in local copy.
+
+        Returns:
+            Tuple of (generation of parent process state, response).
+        """
+        channel = cast(ParentChannel, self._channel)
+        generation, key = channel.call(
+            ("response", method, target, list(headers or []))
+        )
+        with self._cond:
+            if generation != self._response_generation:
+                self._worker_responses = {}
+                self._response_generation = generation
+            resp = self._worker_responses.get(key)
+        if resp is None:
+            resp = cast(Response, channel.call(("fetch", key)))
+            with self._cond:
+                if generation == self._response_generation:
+                    self._worker_responses[key] = resp
+        return generation, resp
@@ -0,0 +1,158 @@
+# from __future__ import annotations
+
+import math
+import time
+from threading import Lock
+from typing import Any
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Mapping
+
+# pylint: enable=import-error
+
+__all__ = ["Histogram", "RequestStats", "monotonic", "phase_durations"]
+# Python 2 does not have monotonic clock
+monotonic = getattr(time, "monotonic", time.time)
+# Timestamps recorded while request is processed, in order of their appearance.
+# The "connected" timestamp is recorded only for first request of connection.
+TIMESTAMPS = [
+    "connected",
+    "received",
+    "parsed",
+    "dispatched",
+    "delayed",
+    "body_read",
+    "built",
+    "sent",
+]  # type: list[str]
+# Phases of request processing: (name, start timestamp, end timestamp)
+PHASES = [
+    # Waiting for request line after connection is accepted
+    ("accept", "connected", "received"),
+    # Parsing request line and headers
+    ("parse", "received", "parsed"),
+    # Selecting response
+    ("dispatch", "parsed", "dispatched"),
+    # Delay configured by Response.sleep
+    ("delay", "dispatched", "delayed"),
+    # Reading request body
+    ("body", "delayed", "body_read"),
+    # Running callback and building response
+    ("callback", "body_read", "built"),
+    # Writing response
+    ("write", "built", "sent"),
+    ("total", "received", "sent"),
+]  # type: list[tuple[str, str, str]]
+# Histogram bucket boundaries grow by this factor, it is the precision
+# of reported percentiles
+HISTOGRAM_GROWTH = 1.05  # type: float
+HISTOGRAM_MIN_VALUE = 1e-6  # type: float
+# Stats of other paths are accumulated together
+MAX_STATS_PATHS = 1000  # type: int
+OTHER_PATHS_KEY = "*"  # type: str
+
+
+def phase_durations(
+    timings,  # type: Mapping[str, float]
+):
+    # type: (...) -> dict[str, float]
+    """Return durations in seconds of phases which timestamps are known."""
+    return {
+        name: timings[end] - timings[start]
+        for name, start, end in PHASES
+        if start in timings and end in timings
+    }
+
+
+class Histogram(object):
+    """Histogram with logarithmic buckets.
+
+    Memory does not depend on number of values, percentiles are
+    approximated by upper bound of bucket with 5% precision.
+    """
+
+    __slots__ = ["_buckets", "count", "max"]
+
+    def __init__(self):
+        # type: () -> None
+        self._buckets = {}  # type: dict[int, int]
+        self.count = 0
+        self.max = 0.0
+
+    def add(
+        self,
+        value,  # type: float
+    ):
+        # type: (...) -> None
+        idx = (
+            int(math.log(value / HISTOGRAM_MIN_VALUE, HISTOGRAM_GROWTH))
+            if value > HISTOGRAM_MIN_VALUE
+            else 0
+        )
+        self._buckets[idx] = self._buckets.get(idx, 0) + 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def percentile(
+        self,
+        pct,  # type: float
+    ):
+        # type: (...) -> float
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(pct * self.count / 100.0)))  # noqa: RUF046
+        total = 0
+        for idx in sorted(self._buckets):
+            total += self._buckets[idx]
+            if total >= rank:
+                return min(
+                    HISTOGRAM_MIN_VALUE * HISTOGRAM_GROWTH ** (idx + 1), self.max
+                )
+        return self.max
+
+    def summary(self):
+        # type: () -> dict[str, Any]
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class RequestStats(object):
+    """Thread-safe histograms of request phase durations, total and per path."""
+
+    def __init__(self):
+        # type: () -> None
+        self._lock = Lock()
+        self._phases = {}  # type: dict[str, Histogram]
+        self._paths = {}  # type: dict[str, dict[str, Histogram]]
+
+    def add(
+        self,
+        path,  # type: str
+        timings,  # type: Mapping[str, float]
+    ):
+        # type: (...) -> None
+        durations = phase_durations(timings)
+        with self._lock:
+            if path not in self._paths and len(self._paths) >= MAX_STATS_PATHS:
+                path = OTHER_PATHS_KEY
+            path_phases = self._paths.setdefault(path, {})
+            for name, value in durations.items():
+                self._phases.setdefault(name, Histogram()).add(value)
+                path_phases.setdefault(name, Histogram()).add(value)
+
+    def summary(self):
+        # type: () -> dict[str, Any]
+        with self._lock:
+            return {
+                "phases": {
+                    name: hist.summary() for name, hist in self._phases.items()
+                },
+                "paths": {
+                    path: {name: hist.summary() for name, hist in phases.items()}
+                    for path, phases in self._paths.items()
+                },
+            }
@@ -0,0 +1,79 @@
+# from __future__ import annotations
+
+from typing import Any
+
+import six
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Iterable, Iterator
+
+# pylint: enable=import-error
+from .body import is_chunked
+from .error import InternalError
+from .structure import HttpHeaderStorage
+
+__all__ = ["iter_stream_body", "setup_stream_framing"]
+CHUNKED_BODY_END = b"0\r\n\r\n"  # type: bytes
+
+
+def setup_stream_framing(
+    headers,  # type: HttpHeaderStorage
+    chunked_allowed,  # type: bool
+):
+    # type: (...) -> tuple[bool, None | int, bool]
+    """Choose how the end of streamed response body is indicated to client.
+
+    Content-Length header set by user is respected. Otherwise the body is sent
+    with chunked transfer encoding if client supports it or it is delimited
+    by closing the connection.
+
+    Returns:
+        Tuple of (chunked, size, close).
+    """
+    if "content-length" in headers:
+        return False, int(headers.get("content-length")), False
+    if "transfer-encoding" in headers:
+        chunked = chunked_allowed and is_chunked(headers.get("transfer-encoding"))
+        return chunked, None, not chunked
+    if chunked_allowed:
+        headers.set("Transfer-Encoding", "chunked")
+        return True, None, False
+    return False, None, True
+
+
+def iter_stream_body(
+    data,  # type: Iterable[Any]
+    chunked,  # type: bool
+    size=None,  # type: None | int
+):
+    # type: (...) -> Iterator[bytes]
+    """Convert chunks produced by data iterable into pieces to send to socket.
+
+    Chunks could be bytes or str, str chunks are encoded with UTF-8.
+
+    Raises:
+        InternalError: if the data does not match the expected size
+    """
+    total = 0
+    for item in data:
+        if isinstance(item, six.text_type):
+            chunk = item.encode("utf-8")
+        elif isinstance(item, bytes):
+            chunk = item
+        else:
+            raise InternalError("Response stream must produce str or bytes chunks")
+        if not chunk:
+            continue
+        total += len(chunk)
+        if size is not None and total > size:
+            raise InternalError("Response stream produced more data than expected")
+        if chunked:
+            yield b"".join(
+                ("{:x}\r\n".format(len(chunk)).encode("ascii"), chunk, b"\r\n")
+            )
+        else:
+            yield chunk
+    if size is not None and total < size:
+        raise InternalError("Response stream produced less data than expected")
+    if chunked:
+        yield CHUNKED_BODY_END
@@ -1,5 +1,6 @@
 # from __future__ import annotations
 
+import sys
 import typing
 from collections import OrderedDict
 from pprint import pprint  # pylint: disable=unused-import
@@ -11,6 +12,8 @@ from six.moves.collections_abc import Iterator, MutableMapping
 # pylint: enable=import-error
 
 __all__ = ["HttpHeaderStorage"]
+# Plain dict keeps insertion order since python 3.7 and is faster to create
+OrderedMapping = dict if sys.version_info >= (3, 7) else OrderedDict
 
 
 # pylint: disable=deprecated-typing-alias,consider-alternative-union-syntax,invalid-name
@@ -26,15 +29,25 @@ class HttpHeaderStorage(object):
 
     The storage maps string keys to one or multiple string values.
     Keys are case insensitive though the original case is stored.
+    Values of same key are listed together in the order of first
+    appearance of the key.
     """
 
+    __slots__ = ["_charset", "_count", "_keys", "_revision", "_values"]
+
     def __init__(
         self,
         data=None,  # type: None | HttpHeaderStream
         charset="utf-8",  # type: str
     ):
         # type: (...) -> None
-        self._store = OrderedDict()  # type: MutableMapping[str, list[str]]
+        # Lower-cased key -> original key and lower-cased key -> values
+        self._keys = OrderedMapping()  # type: MutableMapping[str, str]
+        self._values = OrderedMapping()  # type: MutableMapping[str, list[str]]
+        # Total number of values
+        self._count = 0
+        # Incremented on each change
+        self._revision = 0
         self._charset = charset
         if data is not None:
             self.extend(data)
@@ -43,25 +56,42 @@ class HttpHeaderStorage(object):
 
     def set(self, key, value):
         # type: (str, str) -> None
+        lkey = key.lower()
+        old = self._values.get(lkey)
+        if old is not None:
+            self._count -= len(old)
         # Store original case of key
-        self._store[key.lower()] = [key, value]
+        self._keys[lkey] = key
+        self._values[lkey] = [value]
+        self._count += 1
+        self._revision += 1
 
     def get(self, key):
         # type: (str) -> str
-        return self._store[key.lower()][1]
+        return self._values[key.lower()][0]
 
     def getlist(self, key):
         # type: (str) -> list[str]
-        return self._store[key.lower()][1:]
+        return list(self._values[key.lower()])
 
     def remove(self, key):
         # type: (str) -> None
-        del self._store[key.lower()]
+        lkey = key.lower()
+        self._count -= len(self._values.pop(lkey))
+        del self._keys[lkey]
+        self._revision += 1
 
     def add(self, key, value):
         # type: (str, str) -> None
-        box = self._store.setdefault(key.lower(), [key])
-        box.append(value)
+        lkey = key.lower()
+        vals = self._values.get(lkey)
+        if vals is None:
+            self._keys[lkey] = key
+            self._values[lkey] = [value]
+        else:
+            vals.append(value)
+        self._count += 1
+        self._revision += 1
 
     def extend(self, data):
         # type: (HttpHeaderStream) -> None
@@ -77,23 +107,31 @@ class HttpHeaderStorage(object):
 
     def __contains__(self, key):
         # type: (str) -> bool
-        return key.lower() in self._store
+        return key.lower() in self._values
 
     def count_keys(self):
         # type: () -> int
-        return len(self._store.keys())
+        return len(self._values)
 
     def count_items(self):
         # type: () ->  int
-        return sum(1 for _ in self.items())
+        return self._count
+
+    @property
+    def revision(self):
+        # type: () -> int
+        """Return the number of changes made to the storage."""
+        return self._revision
 
     def items(self):
         # type: () -> Iterator[tuple[str, Any]]
-        for items in self._store.values():
-            original_key = items[0]
-            for idx, item in enumerate(items):
-                if idx > 0:
-                    yield original_key, item
+        keys = self._keys
+        if self._count == len(keys):
+            # Each key has single value
+            return iter([(keys[lkey], vals[0]) for lkey, vals in self._values.items()])
+        return iter(
+            [(keys[lkey], val) for lkey, vals in self._values.items() for val in vals]
+        )
 
     def __repr__(self):
         # type: () -> str
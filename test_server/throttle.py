@@ -0,0 +1,114 @@
+# from __future__ import annotations
+
+import time
+from threading import Lock
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Iterator
+
+# pylint: enable=import-error
+
+__all__ = ["Throttle", "TokenBucket"]
+# Max size of data sent at once by throttled writer
+THROTTLE_CHUNK_SIZE = 16 * 1024  # type: int
+# Default burst is the amount of data which could be sent in this time
+DEFAULT_BURST_TIME = 0.05  # type: float
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket which limits data rate.
+
+    Tokens are reserved in advance: the bucket may go into debt and the caller
+    waits for the time returned by reserve(). This way the same bucket could be
+    used by threads and by asyncio tasks, and one bucket could be shared
+    by many connections.
+    """
+
+    def __init__(
+        self,
+        rate,  # type: float
+        burst=None,  # type: None | int
+    ):
+        # type: (...) -> None
+        if rate <= 0:
+            raise ValueError("Rate limit must be positive")
+        if burst is not None and burst < 1:
+            raise ValueError("Burst must be positive")
+        self.rate = rate
+        self.burst = (
+            burst if burst is not None else max(1, int(rate * DEFAULT_BURST_TIME))
+        )  # type: int
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._lock = Lock()
+
+    def reserve(
+        self,
+        amount,  # type: int
+    ):
+        # type: (...) -> float
+        """Take tokens for sending given number of bytes.
+
+        Returns:
+            Number of seconds to wait before the data could be sent.
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class Throttle(object):
+    """Pacing of one response by its own bucket and by the server-wide bucket."""
+
+    def __init__(
+        self,
+        buckets,  # type: list[TokenBucket]
+    ):
+        # type: (...) -> None
+        self.buckets = buckets
+        self.chunk_size = max(
+            1, min([THROTTLE_CHUNK_SIZE] + [bucket.burst for bucket in buckets])
+        )  # type: int
+
+    def reserve(
+        self,
+        amount,  # type: int
+    ):
+        # type: (...) -> float
+        return max(bucket.reserve(amount) for bucket in self.buckets)
+
+    def iter_spans(
+        self,
+        length,  # type: int
+    ):
+        # type: (...) -> Iterator[tuple[float, int, int]]
+        """Split data of given length into chunks.
+
+        Yields:
+            Tuples of (seconds to wait, chunk start, chunk end).
+        """
+        for start in range(0, length, self.chunk_size):
+            end = min(start + self.chunk_size, length)
+            yield self.reserve(end - start), start, end
+
+
+def create_throttle(
+    rate_limit_bps,  # type: None | float
+    burst,  # type: None | int
+    shared_bucket,  # type: None | TokenBucket
+):
+    # type: (...) -> None | Throttle
+    """Create throttle for response or return None if it is not limited."""
+    buckets = []
+    if rate_limit_bps is not None:
+        buckets.append(TokenBucket(rate_limit_bps, burst))
+    if shared_bucket is not None:
+        buckets.append(shared_bucket)
+    return Throttle(buckets) if buckets else None
@@ -0,0 +1,125 @@
+# from __future__ import annotations
+
+import logging
+from threading import Event, Thread
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Callable
+from six.moves.queue import Empty, Full, Queue
+
+# pylint: enable=import-error
+
+__all__ = ["WorkerPool"]
+LOG = logging.getLogger()
+SUBMIT_CHECK_INTERVAL = 0.1  # type: float
+
+
+class WorkerPool(object):
+    """Fixed set of threads which run submitted tasks.
+
+    Tasks waiting for free worker are stored in the queue of limited size.
+    """
+
+    def __init__(
+        self,
+        num_workers,  # type: int
+        queue_size=None,  # type: None | int
+        name="TestServerWorker",  # type: str
+    ):
+        # type: (...) -> None
+        if num_workers < 1:
+            raise ValueError("Number of workers must be positive")
+        self.num_workers = num_workers
+        # Tasks with callbacks which are called if the task is dropped
+        self._queue = Queue(
+            queue_size or 0
+        )  # type: Queue[None | tuple[Callable[[], None], None | Callable[[], None]]]
+        self._closed = Event()
+        self._threads = []  # type: list[Thread]
+        for idx in range(num_workers):
+            th = Thread(target=self._worker, name="{}-{}".format(name, idx))
+            th.daemon = True
+            th.start()
+            self._threads.append(th)
+
+    def _worker(self):
+        # type: () -> None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                # Pass the stop signal to the next worker, the slot taken
+                # by this one is free so the queue is not full
+                self._queue.put(None)
+                break
+            try:
+                item[0]()
+            except Exception:
+                LOG.exception("Unexpected error in worker pool task")
+
+    def submit(
+        self,
+        task,  # type: Callable[[], None]
+        block=True,  # type: bool
+        cancel=None,  # type: None | Callable[[], None]
+    ):
+        # type: (...) -> bool
+        """Put the task into queue.
+
+        Args:
+            task: function without arguments
+            block: wait for free slot in the queue if it is full
+            cancel: function which is called instead of the task if the pool
+                is shut down before the task is started
+
+        Returns:
+            False if the task has not been queued because the queue is full
+            or the pool is closed.
+        """
+        while not self._closed.is_set():
+            try:
+                self._queue.put((task, cancel), block, SUBMIT_CHECK_INTERVAL)
+            except Full:  # noqa: PERF203
+                if not block:
+                    return False
+            else:
+                return True
+        return False
+
+    def close(self):
+        # type: () -> None
+        """Reject new tasks and unblock threads waiting in submit()."""
+        self._closed.set()
+
+    def is_closed(self):
+        # type: () -> bool
+        return self._closed.is_set()
+
+    def shutdown(self):
+        # type: () -> None
+        """Stop workers after they have done current tasks.
+
+        Queued tasks which have not been started are dropped. The method
+        does not wait for workers.
+        """
+        self.close()
+        while True:
+            self._drop_queued_tasks()
+            try:
+                self._queue.put_nowait(None)
+            except Full:
+                # Task of submit() call started before close() took the slot
+                continue
+            break
+
+    def _drop_queued_tasks(self):
+        # type: () -> None
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                return
+            if item is not None and item[1] is not None:
+                try:
+                    item[1]()
+                except Exception:
+                    LOG.exception("Unexpected error in worker pool cancel callback")
@@ -0,0 +1,349 @@
+# from __future__ import annotations
+
+import socket
+import time
+from threading import Thread
+from typing import Any, cast
+
+import pytest
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Iterator
+
+# pylint: enable=import-error
+from six.moves.http_client import HTTPConnection
+
+from test_server import Response, TestServer
+from test_server.server import INTERNAL_ERROR_RESPONSE_STATUS
+
+from .util import (  # pylint: disable=unused-import
+    CHUNKED_REQUEST,
+    check_stop_closes_connection,
+    fixture_data_file,
+    read_until_closed,
+    wait_recorded_requests,
+)
+
+NETWORK_TIMEOUT = 1
+
+
+@pytest.fixture(name="server")
+def fixture_server():
+    # type: () -> Iterator[TestServer]
+    srv = TestServer(engine="asyncio", protocol_version="HTTP/1.1")
+    srv.start()
+    yield srv
+    srv.stop()
+
+
+def connect(server):
+    # type: (TestServer) -> HTTPConnection
+    return HTTPConnection(server.address, server.port, timeout=NETWORK_TIMEOUT)
+
+
+def test_get(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"zorro", headers=[("foo", "bar")]))
+    conn = connect(server)
+    conn.request("GET", "/path?key=val", headers={"Cookie": "a=b"})
+    res = conn.getresponse()
+    assert res.read() == b"zorro"
+    assert res.getheader("foo") == "bar"
+    req = server.get_request()
+    assert req.method == "GET"
+    assert req.path == "/path"
+    assert req.args["key"] == "val"
+    assert req.cookies["a"].value == "b"
+    assert server.request_is_done()
+
+
+def test_request_duplicate_headers(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"abc"))
+    raw_headers = (
+        b"Host: localhost\r\n"
+        b"X-Forwarded-For: 1.1.1.1\r\n"
+        b"Cookie: foo=1\r\n"
+        b"X-Forwarded-For: 2.2.2.2\r\n"
+        b"Cookie: bar=2\r\n"
+    )
+    sock = socket.create_connection((server.address, cast(int, server.port)))
+    sock.settimeout(NETWORK_TIMEOUT)
+    sock.sendall(b"GET / HTTP/1.0\r\n" + raw_headers + b"\r\n")
+    assert sock.recv(1024).endswith(b"abc")
+    sock.close()
+    req = server.get_request()
+    assert req.headers.getlist("x-forwarded-for") == ["1.1.1.1", "2.2.2.2"]
+    assert req.cookies["foo"].value == "1"
+    assert req.cookies["bar"].value == "2"
+    assert req.raw_headers == raw_headers
+
+
+def test_unsupported_http_version(server):
+    # type: (TestServer) -> None
+    sock = socket.create_connection((server.address, cast(int, server.port)))
+    sock.settimeout(NETWORK_TIMEOUT)
+    sock.sendall(b"GET / HTTP/2.0\r\n\r\n")
+    assert sock.recv(1024).startswith(b"HTTP/1.1 505 ")
+    sock.close()
+
+
+def test_post_keep_alive(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"abc"), count=-1)
+    conn = connect(server)
+    sock = None
+    for idx in range(3):
+        conn.request("POST", "/", body="data-{}".format(idx).encode())
+        assert conn.getresponse().read() == b"abc"
+        assert server.get_request().data == "data-{}".format(idx).encode()
+        if sock is None:
+            sock = conn.sock
+        assert conn.sock is sock
+
+
+def test_no_response(server):
+    # type: (TestServer) -> None
+    conn = connect(server)
+    conn.request("GET", "/")
+    res = conn.getresponse()
+    assert res.status == INTERNAL_ERROR_RESPONSE_STATUS
+    assert b"No response" in res.read()
+
+
+def test_callback(server):
+    # type: (TestServer) -> None
+    server.add_response(
+        Response(callback=lambda: {"type": "response", "status": 201, "data": b"x"})
+    )
+    conn = connect(server)
+    conn.request("GET", "/")
+    res = conn.getresponse()
+    assert res.status == 201  # noqa: PLR2004
+    assert res.read() == b"x"
+
+
+def test_sleep_does_not_block_other_requests(server):
+    # type: (TestServer) -> None
+    delay = 0.5
+    server.add_response(Response(sleep=delay), count=-1)
+
+    def worker():
+        # type: () -> None
+        conn = connect(server)
+        conn.request("GET", "/")
+        conn.getresponse().read()
+
+    start = time.time()
+    threads = [Thread(target=worker) for _ in range(10)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert time.time() - start < delay * 3
+
+
+def test_many_concurrent_connections(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"ok"), count=-1)
+    socks = []
+    for _ in range(200):
+        sock = socket.create_connection((server.address, cast(int, server.port)))
+        sock.settimeout(NETWORK_TIMEOUT)
+        socks.append(sock)
+    for sock in socks:
+        sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+    for sock in socks:
+        data = read_until_closed(sock)
+        assert data.endswith(b"\r\n\r\nok")
+        sock.close()
+    assert server.num_req_processed == 200  # noqa: PLR2004
+
+
+def test_start_stop_cycles():
+    # type: () -> None
+    for _ in range(5):
+        server = TestServer(engine="asyncio")
+        server.start()
+        try:
+            server.add_response(Response(data=b"abc"))
+            conn = connect(server)
+            conn.request("GET", "/")
+            assert conn.getresponse().read() == b"abc"
+        finally:
+            server.stop()
+
+
+def test_chunked_request_body(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"abc"), count=2)
+    sock = socket.create_connection((server.address, cast(int, server.port)))
+    sock.settimeout(NETWORK_TIMEOUT)
+    sock.sendall(CHUNKED_REQUEST + b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    data = b""
+    while data.count(b"abc") < 2:  # noqa: PLR2004
+        data += sock.recv(1024)
+    req = server.get_requests()[0]
+    assert req.data == b"foo-bar"
+    assert req.trailers.get("x-sum") == "1"
+    assert server.get_request().method == "GET"
+    sock.close()
+
+
+def test_stream_response_keep_alive_no_nagle_delay(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=[b"foo", b"bar"]), count=-1)
+    conn = connect(server)
+    start = time.time()
+    for _ in range(5):
+        conn.request("GET", "/")
+        assert conn.getresponse().read() == b"foobar"
+    # Small writes wait for delayed ACK (about 40ms) unless TCP_NODELAY is set
+    assert time.time() - start < 0.15  # noqa: PLR2004
+    conn.close()
+
+
+def test_stream_response(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=(b"x" * 1000 for _ in range(1000))))
+    server.add_response(Response(data=iter([b"foo", b"bar"]), size=6))
+    conn = connect(server)
+    conn.request("GET", "/")
+    res = conn.getresponse()
+    assert res.getheader("transfer-encoding") == "chunked"
+    assert res.read() == b"x" * 1000000
+    conn.request("GET", "/")
+    res = conn.getresponse()
+    assert res.getheader("content-length") == "6"
+    assert res.read() == b"foobar"
+
+
+def test_file_response(server, data_file, tmpdir):
+    # type: (TestServer, Any, Any) -> None
+    data = data_file.read_binary()
+    server.add_response(Response(file=str(data_file)))
+    server.add_response(Response(file=str(data_file), offset=10, length=5))
+    server.add_response(Response(file=str(tmpdir.join("missing.bin"))))
+    conn = connect(server)
+    conn.request("GET", "/")
+    assert conn.getresponse().read() == data
+    conn.request("GET", "/")
+    assert conn.getresponse().read() == b"01234"
+    conn.request("GET", "/")
+    assert conn.getresponse().status == INTERNAL_ERROR_RESPONSE_STATUS
+
+
+def test_rate_limit(server, tmpdir):
+    # type: (TestServer, Any) -> None
+    path = tmpdir.join("data.bin")
+    data = b"0123456789" * 2000
+    path.write_binary(data)
+    server.add_response(Response(file=str(path), rate_limit_bps=40000, burst=4000))
+    server.add_response(
+        Response(data=iter([data[:10000], data[10000:]]), rate_limit_bps=40000)
+    )
+    conn = connect(server)
+    for _ in range(2):
+        start = time.time()
+        conn.request("GET", "/")
+        assert conn.getresponse().read() == data
+        assert time.time() - start >= 0.35  # noqa: PLR2004
+
+
+def test_worker_processes():
+    # type: () -> None
+    server = TestServer(engine="asyncio", protocol_version="HTTP/1.1", workers=2)
+    server.start()
+    try:
+        server.add_response(Response(data=b"foo"), count=2)
+        for _ in range(2):
+            conn = connect(server)
+            conn.request("GET", "/path?key=val")
+            assert conn.getresponse().read() == b"foo"
+            conn.close()
+        assert server.num_req_processed == 2  # noqa: PLR2004
+        assert server.get_request().args == {"key": "val"}
+    finally:
+        server.stop()
+
+
+def test_request_timings(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"foo"), count=2)
+    conn = connect(server)
+    for _ in range(2):
+        conn.request("GET", "/path")
+        assert conn.getresponse().read() == b"foo"
+    conn.close()
+    req = server.get_request()
+    # Second request of the connection
+    assert "connected" not in req.timings
+    assert req.durations["parse"] >= 0
+    wait_recorded_requests(server, 2, NETWORK_TIMEOUT)
+    stats = server.stats()
+    assert stats["phases"]["accept"]["count"] == 1
+    assert stats["paths"]["/path"]["write"]["count"] == 2  # noqa: PLR2004
+
+
+def test_fast_start_stop():
+    # type: () -> None
+    start = time.time()
+    for _ in range(20):
+        server = TestServer(engine="asyncio")
+        server.start()
+        server.stop()
+    assert time.time() - start < 1
+
+
+def test_stop_idle_connection(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"abc"))
+    conn = connect(server)
+    conn.request("GET", "/")
+    assert conn.getresponse().read() == b"abc"
+    start = time.time()
+    server.stop()
+    assert time.time() - start < 0.5  # noqa: PLR2004
+    conn.close()
+
+
+def test_stop_waits_in_flight_request():
+    # type: () -> None
+    server = TestServer(engine="asyncio")
+    server.start()
+    server.add_response(Response(data=b"abc", sleep=0.2))
+    conn = connect(server)
+    conn.request("GET", "/")
+    time.sleep(0.05)
+    server.stop()
+    # The request is finished within the stop timeout
+    assert conn.getresponse().read() == b"abc"
+
+
+def test_stop_timeout_cancels_request():
+    # type: () -> None
+    server = TestServer(engine="asyncio")
+    server.start()
+    server.add_response(Response(data=b"abc", sleep=2))
+    sock = socket.create_connection((server.address, cast(int, server.port)))
+    sock.settimeout(NETWORK_TIMEOUT)
+    sock.sendall(b"GET / HTTP/1.0\r\nHost: localhost\r\n\r\n")
+    time.sleep(0.05)
+    check_stop_closes_connection(server, sock)
+
+
+def test_namespace(server):
+    # type: (TestServer) -> None
+    nspace = server.namespace(prefix="/ns")
+    nspace.add_response(Response(data=b"ns"))
+    server.add_response(Response(data=b"main"))
+    conn = connect(server)
+    conn.request("GET", "/ns/path?a=1")
+    assert conn.getresponse().read() == b"ns"
+    conn.request("GET", "/path")
+    assert conn.getresponse().read() == b"main"
+    req = nspace.get_request()
+    assert req.path == "/path"
+    assert req.args == {"a": "1"}
+    assert server.get_request().path == "/path"
+    assert nspace.num_req_processed == server.num_req_processed == 1
@@ -0,0 +1,58 @@
+# from __future__ import annotations
+
+import json
+from typing import Any
+
+import pytest
+
+from test_server.bench import main, percentile, run_benchmark
+
+
+def test_percentile():
+    # type: () -> None
+    values = [float(x) for x in range(1, 101)]
+    assert percentile(values, 50) == 50  # noqa: PLR2004
+    assert percentile(values, 99) == 99  # noqa: PLR2004
+    assert percentile(values, 99.9) == 100  # noqa: PLR2004
+    assert percentile([1.0], 50) == 1
+    assert percentile([], 50) == 0
+
+
+@pytest.mark.parametrize("response_type", ["static", "callback", "stream", "file"])
+def test_run_benchmark(response_type):
+    # type: (str) -> None
+    report = run_benchmark(
+        requests=20,
+        concurrency=2,
+        keep_alive=True,
+        body_size=10,
+        response_type=response_type,
+    )
+    assert report["config"]["response_type"] == response_type
+    results = report["results"]
+    assert results["errors"] == 0
+    assert results["rps"] > 0
+    assert 0 < results["p50"] <= results["p99"] <= results["p999"]
+
+
+def test_invalid_response_type():
+    # type: () -> None
+    with pytest.raises(ValueError, match="Invalid response type"):
+        run_benchmark(response_type="foo")
+
+
+def test_main_save_and_compare(tmpdir, capsys):
+    # type: (Any, Any) -> None
+    path = str(tmpdir.join("baseline.json"))
+    assert main(["-n", "20", "-c", "2", "--save", path]) == 0
+    with open(path, "rb") as inp:  # noqa: PTH123
+        baseline = json.loads(inp.read().decode("utf-8"))
+    assert baseline["results"]["errors"] == 0
+    # Impossible throughput of baseline
+    baseline["results"]["rps"] = 1e9
+    with open(path, "wb") as out:  # noqa: PTH123
+        out.write(json.dumps(baseline).encode("utf-8"))
+    args = ["-n", "20", "-c", "2", "--compare", path]
+    assert main(args) == 0
+    assert main(args + ["--max-regression", "50"]) == 1  # noqa: RUF005
+    assert "throughput regression" in capsys.readouterr().out
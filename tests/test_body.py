@@ -0,0 +1,92 @@
+# from __future__ import annotations
+
+from io import BytesIO
+
+import pytest
+
+from test_server.body import RequestBody, is_chunked, read_body, read_chunked_body
+
+
+def test_small_body_in_memory():
+    # type: () -> None
+    body = read_body(BytesIO(b"abcdef"), 3, spool_threshold=10)
+    assert body.in_memory
+    assert body.getvalue() == b"abc"
+    assert body.size == 3  # noqa: PLR2004
+
+
+def test_large_body_spooled():
+    # type: () -> None
+    data = b"x" * 200000
+    body = read_body(BytesIO(data), len(data), spool_threshold=1000)
+    assert not body.in_memory
+    assert body.size == len(data)
+    assert body.getvalue() == data
+    assert b"".join(body.iter_chunks(1000)) == data
+    assert body.open().read(3) == b"xxx"
+    body.close()
+
+
+def test_no_spool_threshold():
+    # type: () -> None
+    data = b"x" * 200000
+    body = read_body(BytesIO(data), len(data), spool_threshold=None)
+    assert body.in_memory
+    assert body.getvalue() == data
+
+
+def test_write_to_memory_body():
+    # type: () -> None
+    body = RequestBody.create_spooled(None)
+    body.write(b"foo")
+    body.write(b"bar")
+    assert body.getvalue() == b"foobar"
+    assert body.size == 6  # noqa: PLR2004
+
+
+def test_read_chunked_body():
+    # type: () -> None
+    rfile = BytesIO(
+        b"3\r\nabc\r\n"
+        b"A;ext=val\r\n0123456789\r\n"
+        b"0\r\nX-Checksum: 123\r\n\r\n"
+        b"GET / HTTP/1.1\r\n"
+    )
+    body, trailers = read_chunked_body(rfile)
+    assert body.getvalue() == b"abc0123456789"
+    assert trailers == [("X-Checksum", "123")]
+    # Data after the body is not consumed
+    assert rfile.read() == b"GET / HTTP/1.1\r\n"
+
+
+def test_read_chunked_body_spooled():
+    # type: () -> None
+    data = b"x" * 5000
+    rfile = BytesIO(b"1388\r\n" + data + b"\r\n0\r\n\r\n")
+    body, trailers = read_chunked_body(rfile, spool_threshold=1000)
+    assert not body.in_memory
+    assert body.getvalue() == data
+    assert not trailers
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b"zz\r\nabc\r\n0\r\n\r\n",
+        b"5\r\nabc",
+        b"3\r\nabcdef\r\n0\r\n\r\n",
+        b"0\r\nbroken trailer\r\n\r\n",
+    ],
+)
+def test_read_chunked_body_invalid(raw):
+    # type: (bytes) -> None
+    with pytest.raises(ValueError, match=r"hunk|trailer"):
+        read_chunked_body(BytesIO(raw))
+
+
+def test_is_chunked():
+    # type: () -> None
+    assert is_chunked("chunked")
+    assert is_chunked("gzip, Chunked")
+    assert not is_chunked("chunked, gzip")
+    assert not is_chunked("")
@@ -0,0 +1,65 @@
+# from __future__ import annotations
+
+import random
+
+import pytest
+
+from test_server.delay import (
+    EmpiricalDelay,
+    FixedDelay,
+    LogNormalDelay,
+    UniformDelay,
+    resolve_delay,
+)
+
+# Not used for cryptographic purposes
+Random = random.Random  # noqa: S311
+
+
+def test_resolve_delay():
+    # type: () -> None
+    assert resolve_delay(None) == 0  # noqa: PLR2004
+    assert resolve_delay(0.5) == 0.5  # noqa: PLR2004
+    assert resolve_delay(FixedDelay(0.3)) == 0.3  # noqa: PLR2004
+
+
+def test_uniform_delay():
+    # type: () -> None
+    delay = UniformDelay(0.1, 0.2, rng=Random(1))
+    samples = [delay.sample() for _ in range(1000)]
+    assert all(0.1 <= x <= 0.2 for x in samples)  # noqa: PLR2004
+
+
+def test_lognormal_delay():
+    # type: () -> None
+    delay = LogNormalDelay(0.01, 1.0, max_delay=0.5, rng=Random(1))
+    samples = sorted(delay.sample() for _ in range(10000))
+    assert 0.008 < samples[5000] < 0.012  # noqa: PLR2004
+    assert samples[-1] <= 0.5  # noqa: PLR2004
+
+
+def test_empirical_delay():
+    # type: () -> None
+    delay = EmpiricalDelay({50.0: 0.01, 99.0: 0.1, 100.0: 1.0}, rng=Random(1))
+    samples = sorted(delay.sample() for _ in range(10000))
+    assert samples[0] == 0.01  # noqa: PLR2004
+    assert 0.01 < samples[7500] < 0.1  # noqa: PLR2004
+    assert samples[-1] <= 1.0
+    assert samples[9950] > 0.1  # noqa: PLR2004
+
+
+def test_empirical_delay_reproducible():
+    # type: () -> None
+    pcts = {0.0: 0.0, 100.0: 1.0}
+    first = EmpiricalDelay(pcts, rng=Random(5))
+    second = EmpiricalDelay(pcts, rng=Random(5))
+    assert [first.sample() for _ in range(10)] == [second.sample() for _ in range(10)]
+
+
+@pytest.mark.parametrize(
+    "pcts", [{}, {101: 0.1}, {50: 0.2, 90: 0.1}], ids=["empty", "range", "order"]
+)
+def test_empirical_delay_invalid(pcts):
+    # type: (dict[float, float]) -> None
+    with pytest.raises(ValueError):  # noqa: PT011
+        EmpiricalDelay(pcts)
@@ -0,0 +1,137 @@
+# from __future__ import annotations
+
+import re
+from threading import Thread
+
+import pytest
+
+from test_server import NoResponseError
+from test_server.dispatch import ResponseDispatcher
+
+
+def test_method_queue_has_priority():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    disp.add("any")
+    disp.add("get", method="get")
+    assert disp.get("get") == "get"
+    assert disp.get("get") == "any"
+    with pytest.raises(NoResponseError):
+        disp.get("get")
+
+
+def test_extend_keeps_order():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    disp.extend(range(1000), count=2)
+    result = [disp.get("get") for _ in range(2000)]
+    assert result == [x for x in range(1000) for _ in range(2)]
+
+
+def test_concurrent_get_consumes_each_response_once():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    num_threads = 8
+    num_items = 10000
+    disp.extend(range(num_items))
+    results = [[] for _ in range(num_threads)]  # type: list[list[int]]
+
+    def worker(out):
+        # type: (list[int]) -> None
+        while True:
+            try:
+                out.append(disp.get("get"))
+            except NoResponseError:  # noqa: PERF203
+                break
+
+    threads = [Thread(target=worker, args=[out]) for out in results]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    consumed = sorted(x for out in results for x in out)
+    assert consumed == list(range(num_items))
+
+
+def test_unlimited_count():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    disp.add("forever", count=-1)
+    for _ in range(10):
+        assert disp.get("post") == "forever"
+
+
+def test_exact_path_route():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    disp.add("default", count=-1)
+    disp.add("foo", path="/foo")
+    assert disp.get("get", "/foo?x=1") == "foo"
+    assert disp.get("get", "/foo") == "default"
+    assert disp.get("get", "/bar") == "default"
+
+
+def test_path_regex_routes():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    disp.add("item", path_regex=r"/item/(\d+)$", count=-1)
+    disp.add("named", path_regex=r"/(?P<name>[a-z]+)/(?P=name)$", count=-1)
+    disp.add("any-item", path_regex=r"/item/", count=-1)
+    assert disp.get("get", "/item/1") == "item"
+    assert disp.get("get", "/foo/foo") == "named"
+    assert disp.get("get", "/item/abc") == "any-item"
+    with pytest.raises(NoResponseError):
+        disp.get("get", "/other")
+
+
+def test_path_regex_fallback_to_next_route():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    disp.add("first", path_regex=r"/a")
+    disp.add("second", path_regex=r"/a.*", count=-1)
+    assert disp.get("get", "/abc") == "first"
+    assert disp.get("get", "/abc") == "second"
+
+
+def test_path_regex_backreference_not_combined():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    disp.add("a", path_regex=r"/(x)\1$", count=-1)
+    disp.add("b", path_regex=r"/(y)\1$", count=-1)
+    assert disp.get("get", "/xx") == "a"
+    assert disp.get("get", "/yy") == "b"
+
+
+def test_path_regex_flags():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    disp.add("abc", path_regex=re.compile("/abc$", re.IGNORECASE), count=-1)
+    disp.add("dotall", path_regex=re.compile("/d.f$", re.DOTALL), count=-1)
+    disp.add("any", path_regex="/[a-z]+$", count=-1)
+    assert disp.get("get", "/ABC") == "abc"
+    assert disp.get("get", "/d\nf") == "dotall"
+    # Flags of the pattern do not apply to other patterns
+    with pytest.raises(NoResponseError):
+        disp.get("get", "/DEF")
+
+
+def test_path_regex_flags_not_scoped():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    disp.add("inline", path_regex="(?i)/def$", count=-1)
+    disp.add("ascii", path_regex=re.compile(r"/\w+$", re.ASCII), count=-1)
+    assert disp.get("get", "/DEF") == "inline"
+    assert disp.get("get", "/xyz") == "ascii"
+    with pytest.raises(NoResponseError):
+        disp.get("get", "/\u00e9")
+
+
+def test_headers_and_args_filters():
+    # type: () -> None
+    disp = ResponseDispatcher()
+    disp.add("json", headers={"Accept": "application/json"})
+    disp.add("page-2", args={"page": "2"})
+    disp.add("default")
+    assert disp.get("get", "/?page=2", [("ACCEPT", "text/html")]) == "page-2"
+    assert disp.get("get", "/", [("accept", "application/json")]) == "json"
+    assert disp.get("get", "/", []) == "default"
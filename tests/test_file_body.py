@@ -0,0 +1,80 @@
+# from __future__ import annotations
+
+import os
+import socket
+from io import BytesIO
+from typing import Any
+
+import pytest
+
+from test_server.file_body import FileBody
+
+DATA = b"0123456789" * 10000
+
+
+@pytest.fixture(name="path")
+def fixture_path(tmpdir):
+    # type: (Any) -> str
+    path = os.path.join(str(tmpdir), "data.bin")  # noqa: PTH118
+    with open(path, "wb") as out:  # noqa: PTH123
+        out.write(DATA)
+    return path
+
+
+def test_open_path(path):
+    # type: (str) -> None
+    body = FileBody(path)
+    assert body.open() == len(DATA)
+    assert b"".join(body.iter_chunks(1000)) == DATA
+    body.close()
+
+
+def test_offset_length(path):
+    # type: (str) -> None
+    body = FileBody(path, offset=5, length=20)
+    assert body.open() == 20  # noqa: PLR2004
+    assert b"".join(body.iter_chunks(3)) == DATA[5:25]
+    body.close()
+
+
+def test_file_object_not_closed():
+    # type: () -> None
+    fobj = BytesIO(DATA)
+    body = FileBody(fobj, offset=10)
+    assert body.open() == len(DATA) - 10
+    assert b"".join(body.iter_chunks(7000)) == DATA[10:]
+    body.close()
+    assert not fobj.closed
+
+
+def test_empty_body(path):
+    # type: (str) -> None
+    body = FileBody(path, offset=len(DATA))
+    assert body.open() == 0
+    assert not list(body.iter_chunks())
+    body.close()
+
+
+@pytest.mark.parametrize(("offset", "length"), [(len(DATA) + 1, None), (10, len(DATA))])
+def test_out_of_file_range(path, offset, length):
+    # type: (str, int, None | int) -> None
+    with pytest.raises(ValueError, match="beyond the end of file"):
+        FileBody(path, offset, length).open()
+
+
+def test_sendfile(path):
+    # type: (str) -> None
+    sock_out, sock_in = socket.socketpair()
+    body = FileBody(path, offset=100)
+    body.open()
+    body.sendfile(sock_out)
+    body.close()
+    sock_out.close()
+    data = b""
+    while True:
+        chunk = sock_in.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    sock_in.close()
+    assert data == DATA[100:]
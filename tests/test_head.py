@@ -0,0 +1,89 @@
+# from __future__ import annotations
+
+from io import BytesIO
+
+import pytest
+
+from test_server.head import (
+    BadRequestError,
+    HeaderTooLargeError,
+    parse_header_block,
+    parse_request_head,
+    parse_request_line,
+    read_header_block,
+)
+
+
+def test_parse_request_head():
+    # type: () -> None
+    head = (
+        b"GET /path?a=b HTTP/1.1\r\n"
+        b"Host: example.com\r\n"
+        b"Cookie: a=1\r\n"
+        b"Cookie: b=2\r\n"
+        b"\r\n"
+    )
+    method, target, version, headers, raw = parse_request_head(head)
+    assert (method, target, version) == ("GET", "/path?a=b", "HTTP/1.1")
+    assert headers.getlist("cookie") == ["a=1", "b=2"]
+    assert raw == b"Host: example.com\r\nCookie: a=1\r\nCookie: b=2\r\n"
+
+
+def test_parse_request_head_without_headers():
+    # type: () -> None
+    _, _, _, headers, raw = parse_request_head(b"GET / HTTP/1.0\r\n\r\n")
+    assert headers.count_items() == 0
+    assert not raw
+
+
+def test_parse_header_block_keeps_order_and_case():
+    # type: () -> None
+    headers = parse_header_block(
+        b"X-Forwarded-For: 1.1.1.1\nFoo:  bar \nx-forwarded-for: 2.2.2.2\n"
+    )
+    assert list(headers.items()) == [
+        ("X-Forwarded-For", "1.1.1.1"),
+        ("X-Forwarded-For", "2.2.2.2"),
+        ("Foo", "bar"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "block", [b"foo\r\n", b": bar\r\n", b"Foo: bar\r\n  folded\r\n"]
+)
+def test_parse_header_block_bad_line(block):
+    # type: (bytes) -> None
+    with pytest.raises(BadRequestError):
+        parse_header_block(block)
+
+
+@pytest.mark.parametrize(
+    ("line", "status"),
+    [
+        ("GET /", 400),
+        ("GET / FTP/1.1", 400),
+        ("GET / HTTP/1.1.1", 400),
+        ("GET / HTTP/x.1", 400),
+        ("GET / HTTP/2.0", 505),
+    ],
+)
+def test_parse_request_line_error(line, status):
+    # type: (str, int) -> None
+    with pytest.raises(BadRequestError) as ex:
+        parse_request_line(line)
+    assert ex.value.status == status
+
+
+def test_read_header_block():
+    # type: () -> None
+    rfile = BytesIO(b"Foo: bar\r\nBaz: 1\r\n\r\nbody")
+    assert read_header_block(rfile) == b"Foo: bar\r\nBaz: 1\r\n"
+    assert rfile.read() == b"body"
+
+
+def test_read_header_block_too_large():
+    # type: () -> None
+    with pytest.raises(HeaderTooLargeError):
+        read_header_block(BytesIO(b"Foo: " + b"x" * 70000 + b"\r\n\r\n"))
+    with pytest.raises(HeaderTooLargeError):
+        read_header_block(BytesIO(b"Foo: bar\r\n" * 101 + b"\r\n"))
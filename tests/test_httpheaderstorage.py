@@ -1,3 +1,5 @@
+import timeit
+
 import pytest
 
 from test_server.structure import HttpHeaderStorage
@@ -72,3 +74,49 @@ def test_count_items():
     obj.add("foo", "bar")
     obj.add("foo", "baz")
     assert obj.count_items() == 2  # noqa: PLR2004
+
+
+def test_count_items_after_set_and_remove():
+    # type: () -> None
+    obj = HttpHeaderStorage([("foo", "1"), ("Foo", "2"), ("bar", "3")])
+    assert obj.count_items() == 3  # noqa: PLR2004
+    obj.set("FOO", "4")
+    assert obj.count_items() == 2  # noqa: PLR2004
+    obj.remove("bar")
+    assert obj.count_items() == 1
+    assert list(obj.items()) == [("FOO", "4")]
+
+
+def test_items_order():
+    # type: () -> None
+    obj = HttpHeaderStorage([("a", "1"), ("B", "2"), ("A", "3")])
+    # Values of same key are listed together
+    assert list(obj.items()) == [("a", "1"), ("a", "3"), ("B", "2")]
+
+
+# Headers of typical request sent by HTTP client
+BENCHMARK_HEADERS = [
+    ("Host", "localhost:8000"),
+    ("User-Agent", "python-urllib3/1.26"),
+    ("Accept", "*/*"),
+    ("Accept-Encoding", "gzip, deflate"),
+    ("Connection", "keep-alive"),
+    ("Content-Type", "application/json"),
+    ("Content-Length", "100"),
+    ("Cookie", "session=abc"),
+]  # type: list[tuple[str, str]]
+
+
+def test_benchmark_build_and_iterate():
+    # type: () -> None
+    def run():
+        # type: () -> None
+        obj = HttpHeaderStorage(BENCHMARK_HEADERS)
+        assert "content-length" in obj
+        assert obj.count_items() == len(BENCHMARK_HEADERS)
+        assert len(list(obj.items())) == len(BENCHMARK_HEADERS)
+
+    elapsed = min(timeit.repeat(run, number=1000, repeat=3))
+    # It takes few milliseconds, the limit is generous so the test catches
+    # only algorithmic regressions, not a noise of loaded machine
+    assert elapsed < 1
@@ -0,0 +1,109 @@
+# coding: utf-8
+# from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+from test_server.multipart import parse_multipart_form
+from test_server.multipart_parser import MultipartFormParser, MultipartParser
+
+BOUNDARY = b"BOUNDARY"
+
+
+def build_body(parts):
+    # type: (list[tuple[bytes, bytes]]) -> bytes
+    chunks = [b"preamble"]
+    for head, content in parts:
+        chunks.extend([b"\r\n--" + BOUNDARY + b"\r\n", head, b"\r\n\r\n", content])
+    chunks.append(b"\r\n--" + BOUNDARY + b"--\r\nepilogue")
+    return b"".join(chunks)
+
+
+def parse(body, chunk_size, spool_threshold=None):
+    # type: (bytes, int, None | int) -> dict[str, Any]
+    parser = MultipartFormParser(BOUNDARY, spool_threshold=spool_threshold)
+    for pos in range(0, len(body), chunk_size):
+        parser.feed(body[pos : pos + chunk_size])
+    return dict(parser.close())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 100000])
+def test_same_result_as_parse_multipart_form(chunk_size):
+    # type: (int) -> None
+    body = build_body(
+        [
+            (b'Content-Disposition: form-data; name="text"', b"hello\r\n--BOUNDAR"),
+            (
+                (
+                    b'Content-Disposition: form-data; name="file"; filename="a.txt"'
+                    b"\r\nContent-Type: application/octet-stream"
+                ),
+                b"\r\n\r\nfile content",
+            ),
+            (b'Content-Disposition: form-data; name="text"', u"привет".encode()),
+        ]
+    )
+    result = parse(body, chunk_size)
+    expected = parse_multipart_form(body, BOUNDARY)
+    assert [x["content"] for x in result["text"]] == expected["text"]
+    assert result["file"][0]["content"] == expected["file"][0]["content"]
+    assert result["file"][0]["filename"] == "a.txt"
+    assert result["file"][0]["content_type"] == "application/octet-stream"
+
+
+def test_large_file_spooled_to_disk():
+    # type: () -> None
+    content = b"0123456789" * 10000
+    body = build_body(
+        [
+            (
+                b'Content-Disposition: form-data; name="file"; filename="big.bin"',
+                content,
+            )
+        ]
+    )
+    result = parse(body, 4096, spool_threshold=1000)
+    item = result["file"][0]
+    assert not item["body"].in_memory
+    assert item["body"].size == len(content)
+    assert item["content"] == content
+
+
+def test_empty_part():
+    # type: () -> None
+    body = build_body([(b'Content-Disposition: form-data; name="empty"', b"")])
+    assert parse(body, 1)["empty"][0]["content"] == ""
+
+
+def test_part_without_closing_delimiter_is_dropped():
+    # type: () -> None
+    body = b"--BOUNDARY\r\nContent-Disposition: form-data; name=x\r\n\r\nabc"
+    assert not parse(body, 5)
+
+
+def test_part_callbacks_get_chunks():
+    # type: () -> None
+    events = []  # type: list[Any]
+    parser = MultipartParser(
+        BOUNDARY,
+        on_part_begin=lambda headers: events.append(("begin", headers)),
+        on_part_data=lambda data: events.append(("data", data)),
+        on_part_end=lambda: events.append(("end",)),
+    )
+    body = build_body([(b"X-Foo: bar", b"a" * 100)])
+    for pos in range(0, len(body), 10):
+        parser.feed(body[pos : pos + 10])
+    assert parser.close()
+    assert events[0] == ("begin", [("x-foo", "bar")])
+    assert b"".join(x[1] for x in events if x[0] == "data") == b"a" * 100
+    assert len([x for x in events if x[0] == "data"]) > 1
+    assert events[-1] == ("end",)
+
+
+def test_part_limit():
+    # type: () -> None
+    body = build_body([(b'Content-Disposition: form-data; name="x"', b"1")] * 3)
+    parser = MultipartFormParser(BOUNDARY, part_limit=2)
+    with pytest.raises(ValueError, match="exceeds the allowed limit"):
+        parser.feed(body)
@@ -0,0 +1,140 @@
+# from __future__ import annotations
+
+from threading import Thread
+
+import pytest
+from six.moves.http_client import HTTPConnection
+
+from test_server import (
+    Response,
+    TestServer,
+    TestServerError,
+    TestServerPool,
+    WaitTimeoutError,
+)
+
+NETWORK_TIMEOUT = 1
+
+
+def get_data(server):
+    # type: (TestServer) -> bytes
+    conn = HTTPConnection(server.address, server.port, timeout=NETWORK_TIMEOUT)
+    try:
+        conn.request("GET", "/")
+        return conn.getresponse().read()
+    finally:
+        conn.close()
+
+
+def test_lease_server():
+    # type: () -> None
+    pool = TestServerPool(size=2)
+    try:
+        with pool.lease() as server:
+            server.add_response(Response(data=b"abc"))
+            assert get_data(server) == b"abc"
+            assert server.num_req_processed == 1
+        with pool.lease() as server2:
+            # Released server is reset
+            assert server2 is server
+            assert server2.num_req_processed == 0
+    finally:
+        pool.stop()
+
+
+def test_release_removes_namespaces():
+    # type: () -> None
+    pool = TestServerPool(size=1)
+    try:
+        for _ in range(2):
+            with pool.lease() as server:
+                nspace = server.namespace(prefix="/api")
+                nspace.add_response(Response(data=b"api"))
+                conn = HTTPConnection(
+                    server.address, server.port, timeout=NETWORK_TIMEOUT
+                )
+                try:
+                    conn.request("GET", "/api/users")
+                    assert conn.getresponse().read() == b"api"
+                finally:
+                    conn.close()
+        with pool.lease() as server:
+            # Namespace of previous lease does not catch requests
+            server.add_response(Response(data=b"main"))
+            assert get_data(server) == b"main"
+            assert server.route_request(None, "/api/users") == (server, "/api/users")
+    finally:
+        pool.stop()
+
+
+def test_parallel_leases():
+    # type: () -> None
+    pool = TestServerPool(size=3)
+    errors = []  # type: list[BaseException]
+    seen = set()  # type: set[int]
+
+    def worker(idx):
+        # type: (int) -> None
+        try:
+            for _ in range(5):
+                with pool.lease(timeout=NETWORK_TIMEOUT) as server:
+                    seen.add(id(server))
+                    data = str(idx).encode()
+                    server.add_response(Response(data=data))
+                    assert get_data(server) == data
+                    assert server.get_request().path == "/"
+        except BaseException as ex:  # noqa: BLE001
+            errors.append(ex)
+
+    threads = [Thread(target=worker, args=(idx,)) for idx in range(6)]
+    try:
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        assert not errors
+        assert len(seen) <= 3  # noqa: PLR2004
+        stats = pool.stats()
+        assert stats["acquired"] == 30  # noqa: PLR2004
+        assert stats["leased"] == 0
+        assert stats["max_leased"] <= 3  # noqa: PLR2004
+        assert 0 < stats["utilization"] <= 1
+    finally:
+        pool.stop()
+
+
+def test_acquire_timeout():
+    # type: () -> None
+    pool = TestServerPool(size=1)
+    try:
+        server = pool.acquire()
+        with pytest.raises(WaitTimeoutError):
+            pool.acquire(timeout=0.05)
+        pool.release(server)
+        assert pool.stats()["waited"] == 1
+    finally:
+        pool.stop()
+
+
+def test_release_foreign_server():
+    # type: () -> None
+    pool = TestServerPool(size=1)
+    try:
+        with pytest.raises(TestServerError):
+            pool.release(TestServer())
+    finally:
+        pool.stop()
+
+
+def test_invalid_size():
+    # type: () -> None
+    with pytest.raises(TestServerError):
+        TestServerPool(size=0)
+
+
+def test_acquire_stopped_pool():
+    # type: () -> None
+    pool = TestServerPool(size=1)
+    pool.stop()
+    with pytest.raises(TestServerError):
+        pool.acquire()
@@ -0,0 +1,75 @@
+# from __future__ import annotations
+
+import pytest
+
+from test_server.request_log import RequestLog
+
+
+class FakeRequest(object):
+    def __init__(
+        self,
+        data,  # type: bytes
+    ):
+        # type: (...) -> None
+        self.body_size = len(data)
+        self.headers = {"Host": "localhost"}
+
+
+def test_no_limits():
+    # type: () -> None
+    log = RequestLog()
+    for idx in range(100):
+        log.append(idx)
+    assert len(log) == 100  # noqa: PLR2004
+    assert log.num_logged == 100  # noqa: PLR2004
+    assert log.num_dropped == 0
+
+
+def test_keep_last_requests():
+    # type: () -> None
+    log = RequestLog(max_requests=3)
+    for idx in range(10):
+        log.append(idx)
+    assert log.requests() == [7, 8, 9]
+    assert log.last() == 9  # noqa: PLR2004
+    assert log.num_logged == 10  # noqa: PLR2004
+    assert log.num_dropped == 7  # noqa: PLR2004
+
+
+def test_keep_first_requests():
+    # type: () -> None
+    log = RequestLog(max_requests=3, retention="first")
+    for idx in range(10):
+        log.append(idx)
+    assert log.requests() == [0, 1, 2]
+    assert log.num_dropped == 7  # noqa: PLR2004
+
+
+def test_max_bytes():
+    # type: () -> None
+    log = RequestLog(max_bytes=100)
+    reqs = [FakeRequest(b"x" * 30) for _ in range(10)]
+    for req in reqs:
+        log.append(req)
+    # each request takes 30 bytes of body and 13 bytes of headers
+    assert log.requests() == reqs[-2:]
+    assert log.size <= 100  # noqa: PLR2004
+    big = FakeRequest(b"x" * 1000)
+    log.append(big)
+    assert log.requests() == [big]
+
+
+def test_since():
+    # type: () -> None
+    log = RequestLog(max_requests=2)
+    for idx in range(5):
+        log.append(idx)
+    assert log.since(0) == [(4, 3), (5, 4)]
+    assert log.since(4) == [(5, 4)]
+    assert not log.since(5)
+
+
+def test_invalid_retention():
+    # type: () -> None
+    with pytest.raises(ValueError, match="Invalid retention"):
+        RequestLog(retention="middle")
@@ -0,0 +1,40 @@
+# from __future__ import annotations
+
+import time
+from threading import Event
+
+from test_server.scheduler import DelayScheduler
+
+
+def test_tasks_run_in_deadline_order():
+    # type: () -> None
+    scheduler = DelayScheduler()
+    done = Event()
+    order = []  # type: list[int]
+
+    def last_task():
+        # type: () -> None
+        order.append(2)
+        done.set()
+
+    scheduler.schedule(0.2, last_task, lambda: None)
+    scheduler.schedule(0.1, lambda: order.append(1), lambda: None)
+    start = time.time()
+    assert done.wait(1)
+    assert time.time() - start >= 0.2  # noqa: PLR2004
+    assert order == [1, 2]
+    assert not scheduler
+    scheduler.shutdown()
+
+
+def test_shutdown_cancels_pending_tasks():
+    # type: () -> None
+    scheduler = DelayScheduler()
+    calls = []  # type: list[str]
+    scheduler.schedule(10, lambda: calls.append("task"), lambda: calls.append("cancel"))
+    assert len(scheduler) == 1
+    scheduler.shutdown()
+    assert calls == ["cancel"]
+    # Tasks scheduled after shutdown are cancelled immediately
+    scheduler.schedule(0, lambda: calls.append("task"), lambda: calls.append("cancel"))
+    assert calls == ["cancel", "cancel"]
@@ -0,0 +1,68 @@
+# from __future__ import annotations
+
+import pytest
+
+from test_server.stats import (
+    MAX_STATS_PATHS,
+    OTHER_PATHS_KEY,
+    Histogram,
+    RequestStats,
+    phase_durations,
+)
+
+
+def test_histogram_empty():
+    # type: () -> None
+    assert Histogram().summary() == {"count": 0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+
+
+def test_histogram_percentiles():
+    # type: () -> None
+    hist = Histogram()
+    for idx in range(1, 1001):
+        hist.add(idx / 1000.0)
+    summary = hist.summary()
+    assert summary["count"] == 1000  # noqa: PLR2004
+    assert summary["max"] == 1.0
+    assert summary["p50"] == pytest.approx(0.5, rel=0.05)
+    assert summary["p99"] == pytest.approx(0.99, rel=0.05)
+    assert summary["p99"] <= summary["max"]
+
+
+def test_histogram_tiny_values():
+    # type: () -> None
+    hist = Histogram()
+    hist.add(0.0)
+    hist.add(1e-9)
+    assert hist.count == 2  # noqa: PLR2004
+    assert hist.percentile(99) <= 1e-9  # noqa: PLR2004
+
+
+def test_phase_durations():
+    # type: () -> None
+    durations = phase_durations(
+        {"received": 1.0, "parsed": 1.5, "built": 2.0, "sent": 3.0}
+    )
+    assert durations == {"parse": 0.5, "write": 1.0, "total": 2.0}
+
+
+def test_request_stats():
+    # type: () -> None
+    stats = RequestStats()
+    stats.add("/foo", {"received": 1.0, "sent": 2.0})
+    stats.add("/bar", {"received": 1.0, "sent": 3.0})
+    summary = stats.summary()
+    assert summary["phases"]["total"]["count"] == 2  # noqa: PLR2004
+    assert summary["phases"]["total"]["max"] == 2.0  # noqa: PLR2004
+    assert summary["paths"]["/foo"]["total"]["max"] == 1.0
+    assert RequestStats().summary() == {"phases": {}, "paths": {}}
+
+
+def test_request_stats_paths_limit():
+    # type: () -> None
+    stats = RequestStats()
+    for idx in range(MAX_STATS_PATHS + 10):
+        stats.add("/{}".format(idx), {"received": 1.0, "sent": 2.0})
+    paths = stats.summary()["paths"]
+    assert len(paths) == MAX_STATS_PATHS + 1
+    assert paths[OTHER_PATHS_KEY]["total"]["count"] == 10  # noqa: PLR2004
@@ -1,6 +1,11 @@
 # coding: utf-8
+# pylint: disable=too-many-lines
 # from __future__ import annotations
 
+import errno
+import os
+import socket
+import threading
 import time
 from pprint import pprint  # pylint: disable=unused-import
 from threading import Thread
@@ -8,6 +13,12 @@ from typing import Any, cast
 
 import pytest
 import six  # pylint: disable=unused-import
+
+# pylint: disable=import-error
+from six.moves.collections_abc import Iterator
+
+# pylint: enable=import-error
+from six.moves.http_client import HTTPConnection, IncompleteRead
 from six.moves.urllib.parse import quote, unquote
 from urllib3 import PoolManager
 from urllib3.response import HTTPResponse
@@ -15,6 +26,7 @@ from urllib3.util.retry import Retry
 
 import test_server
 from test_server import (
+    NoResponseError,
     Request,
     RequestNotProcessedError,
     Response,
@@ -22,9 +34,18 @@ from test_server import (
     TestServerError,
     WaitTimeoutError,
 )
+from test_server.delay import UniformDelay
 from test_server.server import INTERNAL_ERROR_RESPONSE_STATUS
 
-from .util import fixture_global_server, fixture_server  # pylint: disable=unused-import
+from .util import (  # pylint: disable=unused-import
+    CHUNKED_REQUEST,
+    check_stop_closes_connection,
+    fixture_data_file,
+    fixture_server,
+    fixture_server_pool,
+    read_until_closed,
+    wait_recorded_requests,
+)
 
 NETWORK_TIMEOUT = 1
 SPECIFIC_TEST_PORT = 10100
@@ -228,6 +249,55 @@ def test_request_cookies(server):
     assert server.get_request().cookies["foo"].value == "bar"
 
 
+def read_raw_response(
+    server,  # type: TestServer
+    data,  # type: bytes
+):
+    # type: (...) -> bytes
+    sock = socket.create_connection((server.address, cast(int, server.port)))
+    sock.settimeout(NETWORK_TIMEOUT)
+    try:
+        sock.sendall(data)
+        return read_until_closed(sock)
+    finally:
+        sock.close()
+
+
+def test_request_duplicate_headers(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"abc"))
+    raw_headers = (
+        b"Host: localhost\r\n"
+        b"Cookie: foo=1\r\n"
+        b"X-Forwarded-For: 1.1.1.1\r\n"
+        b"Cookie: bar=2\r\n"
+        b"X-Forwarded-For: 2.2.2.2\r\n"
+    )
+    res = read_raw_response(server, b"GET / HTTP/1.0\r\n" + raw_headers + b"\r\n")
+    assert res.endswith(b"abc")
+    req = server.get_request()
+    assert req.headers.getlist("x-forwarded-for") == ["1.1.1.1", "2.2.2.2"]
+    assert req.headers.getlist("cookie") == ["foo=1", "bar=2"]
+    assert req.cookies["foo"].value == "1"
+    assert req.cookies["bar"].value == "2"
+    assert req.raw_headers == raw_headers
+
+
+@pytest.mark.parametrize(
+    ("data", "status"),
+    [
+        (b"GET / HTTP/1.0\r\n" + b"Foo: bar\r\n" * 101 + b"\r\n", b"431"),
+        (b"GET / HTTP/1.0\r\nFoo\r\n\r\n", b"400"),
+        (b"GET / HTTP/2.0\r\n\r\n", b"505"),
+    ],
+)
+def test_bad_request_head(server, data, status):
+    # type: (TestServer, bytes, bytes) -> None
+    res = read_raw_response(server, data)
+    assert res.split(b" ")[1] == status
+    assert server.num_req_processed == 0
+
+
 def test_default_header_content_type(server):
     # type: (TestServer) -> None
     server.add_response(Response())
@@ -292,6 +362,21 @@ def test_specific_port():
         server.stop()
 
 
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_busy_port(server, max_workers):
+    # type: (TestServer, None | int) -> None
+    num_threads = threading.active_count()
+    busy = TestServer(port=cast(int, server.port), max_workers=max_workers)
+    with pytest.raises(socket.error) as ex:  # noqa: PT011
+        busy.start()
+    assert ex.value.errno == errno.EADDRINUSE
+    # Threads of the worker pool are stopped
+    deadline = time.time() + NETWORK_TIMEOUT
+    while threading.active_count() > num_threads:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
 def test_null_bytes(server):
     # type: (TestServer) -> None
     server.add_response(
@@ -611,3 +696,1009 @@ def test_multiple_parts_same_name(server):
     assert req.files["field"][0]["content"] == "first data"
     assert req.files["field"][1]["name"] == "field"
     assert req.files["field"][1]["content"] == "second data"
+
+
+def test_invalid_protocol_version():
+    # type: () -> None
+    with pytest.raises(TestServerError) as ex:
+        TestServer(protocol_version="HTTP/2")
+    assert "Invalid protocol version" in str(ex.value)
+
+
+def test_response_content_length(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"abc"))
+    res = request(server.get_url())
+    assert res.headers["content-length"] == "3"
+
+
+def test_keep_alive_connection_reused():
+    # type: () -> None
+    server = TestServer(protocol_version="HTTP/1.1")
+    server.start()
+    try:
+        server.add_response(Response(data=b"abc"), count=3)
+        conn = HTTPConnection(server.address, server.port, timeout=NETWORK_TIMEOUT)
+        conn.request("GET", "/")
+        assert conn.getresponse().read() == b"abc"
+        sock = conn.sock
+        assert sock is not None
+        for _ in range(2):
+            conn.request("GET", "/")
+            assert conn.getresponse().read() == b"abc"
+            assert conn.sock is sock
+        conn.close()
+    finally:
+        server.stop()
+
+
+def test_http10_connection_not_reused(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"abc"))
+    conn = HTTPConnection(server.address, server.port, timeout=NETWORK_TIMEOUT)
+    conn.request("GET", "/")
+    assert conn.getresponse().read() == b"abc"
+    assert conn.sock is None
+
+
+def test_keep_alive_max_requests():
+    # type: () -> None
+    server = TestServer(protocol_version="HTTP/1.1", keep_alive_max_requests=2)
+    server.start()
+    try:
+        server.add_response(Response(), count=2)
+        conn = HTTPConnection(server.address, server.port, timeout=NETWORK_TIMEOUT)
+        conn.request("GET", "/")
+        res = conn.getresponse()
+        res.read()
+        assert res.getheader("connection") is None
+        conn.request("GET", "/")
+        res = conn.getresponse()
+        res.read()
+        assert res.getheader("connection") == "close"
+        assert conn.sock is None
+    finally:
+        server.stop()
+
+
+def test_keep_alive_idle_timeout():
+    # type: () -> None
+    server = TestServer(protocol_version="HTTP/1.1", keep_alive_timeout=0.1)
+    server.start()
+    try:
+        server.add_response(Response(data=b"abc"))
+        sock = socket.create_connection((server.address, cast(int, server.port)))
+        sock.settimeout(NETWORK_TIMEOUT)
+        sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        data = b""
+        while not data.endswith(b"abc"):
+            data += sock.recv(1024)
+        time.sleep(0.3)
+        assert sock.recv(1024) == b""
+        sock.close()
+    finally:
+        server.stop()
+
+
+def test_keep_alive_timeout_not_applied_to_transfer():
+    # type: () -> None
+    server = TestServer(protocol_version="HTTP/1.1", keep_alive_timeout=0.1)
+    server.start()
+    try:
+        data = b"x" * (20 * 1024 * 1024)
+        server.add_response(Response(data=b"abc"))
+        server.add_response(Response(data=data))
+        sock = socket.create_connection((server.address, cast(int, server.port)))
+        sock.settimeout(NETWORK_TIMEOUT)
+        sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        received = b""
+        while not received.endswith(b"abc"):
+            received += sock.recv(1024)
+        # Slow upload of the body of the next request
+        sock.sendall(b"POST / HTTP/1.1\r\nHost: localhost\r\nContent-Length: 3\r\n\r\n")
+        time.sleep(0.3)
+        sock.sendall(b"abc")
+        # Slow reading of the response
+        time.sleep(0.3)
+        resp = bytearray()
+        while len(resp) < resp.find(b"\r\n\r\n") + 4 + len(data):
+            chunk = sock.recv(65536)
+            assert chunk
+            resp += chunk
+        assert bytes(resp).partition(b"\r\n\r\n")[2] == data
+        assert server.get_request().data == b"abc"
+        sock.close()
+    finally:
+        server.stop()
+
+
+def test_invalid_overflow_mode():
+    # type: () -> None
+    with pytest.raises(TestServerError) as ex:
+        TestServer(overflow="drop")
+    assert "Invalid overflow mode" in str(ex.value)
+
+
+def test_worker_pool_fixed_threads():
+    # type: () -> None
+    server = TestServer(max_workers=2)
+    server.start()
+    try:
+        server.add_response(Response(data=b"abc"), count=-1)
+        for _ in range(20):
+            assert request(server.get_url()).data == b"abc"
+        workers = [
+            th for th in threading.enumerate() if th.name.startswith("TestServerWorker")
+        ]
+        assert len(workers) == 2  # noqa: PLR2004
+    finally:
+        server.stop()
+
+
+def test_worker_pool_reject_overflow():
+    # type: () -> None
+    def callback():
+        # type: () -> dict[str, Any]
+        # Delays set with sleep option do not occupy the worker
+        time.sleep(0.3)
+        return {"type": "response"}
+
+    server = TestServer(max_workers=1, max_queued_connections=1, overflow="reject")
+    server.start()
+    try:
+        server.add_response(Response(callback=callback), count=-1)
+        socks = []
+        for _ in range(3):
+            sock = socket.create_connection((server.address, cast(int, server.port)))
+            sock.settimeout(NETWORK_TIMEOUT * 2)
+            sock.sendall(b"GET / HTTP/1.0\r\n\r\n")
+            socks.append(sock)
+        statuses = []
+        for sock in socks:
+            data = read_until_closed(sock)
+            statuses.append(int(data.split(b" ")[1]))
+            sock.close()
+        assert 503 in statuses  # noqa: PLR2004
+        assert HTTP_STATUS_OK in statuses
+        assert server.num_conn_rejected == statuses.count(503)  # noqa: PLR2004
+    finally:
+        server.stop()
+
+
+def test_worker_pool_rejects_delayed_response_if_queue_is_full():
+    # type: () -> None
+    started = threading.Event()
+
+    def callback():
+        # type: () -> dict[str, Any]
+        started.set()
+        time.sleep(0.5)
+        return {"type": "response"}
+
+    server = TestServer(max_workers=1, max_queued_connections=1)
+    server.start()
+    try:
+        server.add_response(Response(sleep=0.1), path="/delayed")
+        server.add_response(Response(callback=callback), path="/busy")
+        server.add_response(Response(), path="/queued")
+        socks = []
+        for path in ("/delayed", "/busy", "/queued"):
+            sock = socket.create_connection((server.address, cast(int, server.port)))
+            sock.settimeout(NETWORK_TIMEOUT)
+            sock.sendall("GET {} HTTP/1.0\r\n\r\n".format(path).encode())
+            if path == "/busy":
+                # The only worker is occupied, next connection fills the queue
+                assert started.wait(NETWORK_TIMEOUT)
+            socks.append(sock)
+        start = time.time()
+        # Delayed response does not wait for free slot in the queue
+        assert socks[0].recv(1024).startswith(b"HTTP/1.0 503 ")
+        assert time.time() - start < 0.3  # noqa: PLR2004
+        assert server.num_conn_rejected == 1
+        for sock in socks:
+            sock.close()
+    finally:
+        server.stop()
+
+
+def test_worker_pool_stop_timeout_with_full_queue():
+    # type: () -> None
+    started = threading.Event()
+
+    def callback():
+        # type: () -> dict[str, Any]
+        started.set()
+        time.sleep(2)
+        return {"type": "response"}
+
+    server = TestServer(max_workers=1, max_queued_connections=1)
+    server.start()
+    server.add_response(Response(callback=callback), path="/busy")
+    server.add_response(Response(), path="/queued")
+    socks = []
+    for path in ("/busy", "/queued"):
+        sock = socket.create_connection((server.address, cast(int, server.port)))
+        sock.settimeout(NETWORK_TIMEOUT)
+        sock.sendall("GET {} HTTP/1.0\r\n\r\n".format(path).encode())
+        assert started.wait(NETWORK_TIMEOUT)
+        socks.append(sock)
+    time.sleep(0.05)
+    start = time.time()
+    server.stop(timeout=0.1)
+    assert time.time() - start < 0.5  # noqa: PLR2004
+    # Busy connection is aborted, queued one is dropped without response
+    for sock in socks:
+        assert sock.recv(1024) == b""
+        sock.close()
+    assert server.num_req_processed == 0
+
+
+def test_wait_requests(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(), count=3)
+
+    def worker():
+        # type: () -> None
+        for _ in range(3):
+            time.sleep(0.1)
+            request(server.get_url())
+
+    th = Thread(target=worker)
+    th.start()
+    with pytest.raises(WaitTimeoutError):
+        server.wait_requests(3, 0.15)
+    server.wait_requests(3, 2)
+    assert server.num_req_processed == 3  # noqa: PLR2004
+    th.join()
+
+
+def test_wait_for_path_and_method(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(), count=3)
+
+    def worker():
+        # type: () -> None
+        time.sleep(0.1)
+        request(server.get_url("/foo"))
+        request(server.get_url("/bar"))
+        request(server.get_url("/bar"), data=b"data")
+
+    th = Thread(target=worker)
+    th.start()
+    req = server.wait_for(path="/bar", method="post", timeout=2)
+    assert req.data == b"data"
+    th.join()
+
+
+def test_wait_for_predicate_already_processed(server):
+    # type: (TestServer) -> None
+    server.add_response(Response())
+    request(server.get_url("/?key=val"))
+    req = server.wait_for(lambda req: req.args.get("key") == "val", timeout=0)
+    assert req.path == "/"
+    with pytest.raises(WaitTimeoutError):
+        server.wait_for(lambda req: "zzz" in req.args, timeout=0.1)
+
+
+def test_wait_request_wakes_up_immediately(server):
+    # type: (TestServer) -> None
+    server.add_response(Response())
+    done = []
+
+    def worker():
+        # type: () -> None
+        server.wait_request(2)
+        done.append(time.time())
+
+    th = Thread(target=worker)
+    th.start()
+    time.sleep(0.1)
+    request(server.get_url())
+    finished = time.time()
+    th.join()
+    assert done
+    assert done[0] - finished < 0.01  # noqa: PLR2004
+
+
+def test_add_responses(server):
+    # type: (TestServer) -> None
+    server.add_responses([Response(data=b"1"), Response(data=b"2")], count=2)
+    assert [request(server.get_url()).data for _ in range(4)] == [
+        b"1",
+        b"1",
+        b"2",
+        b"2",
+    ]
+    assert b"No response" in request(server.get_url()).data
+
+
+def test_add_responses_invalid_method(server):
+    # type: (TestServer) -> None
+    with pytest.raises(TestServerError):
+        server.add_responses([Response()], method="foo")
+
+
+def test_add_response_path_routing(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"default"), count=-1)
+    server.add_response(Response(data=b"foo"), path="/foo", count=-1)
+    server.add_response(Response(data=b"item"), path_regex=r"/item/\d+$", count=-1)
+    server.add_response(Response(data=b"post-foo"), path="/foo", method="post")
+    assert request(server.get_url("/foo?a=b")).data == b"foo"
+    assert request(server.get_url("/item/12")).data == b"item"
+    assert request(server.get_url("/item/ab")).data == b"default"
+    assert request(server.get_url("/foo"), data=b"x").data == b"post-foo"
+    assert request(server.get_url("/foo"), data=b"x").data == b"foo"
+
+
+def test_add_response_headers_and_args(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"default"), count=-1)
+    server.add_response(Response(data=b"special"), headers={"X-Foo": "bar"}, count=-1)
+    server.add_response(Response(data=b"page"), args={"page": "1"}, count=-1)
+    assert request(server.get_url(), headers={"x-foo": "bar"}).data == b"special"
+    assert request(server.get_url("/?page=1")).data == b"page"
+    assert request(server.get_url("/?page=2")).data == b"default"
+
+
+def test_add_response_path_and_path_regex(server):
+    # type: (TestServer) -> None
+    with pytest.raises(TestServerError):
+        server.add_response(Response(), path="/", path_regex="/")
+
+
+def test_request_log_retention():
+    # type: () -> None
+    server = TestServer(max_logged_requests=2)
+    server.start()
+    try:
+        server.add_response(Response(), count=-1)
+        for idx in range(5):
+            request(server.get_url("/{}".format(idx)))
+        assert [req.path for req in server.get_requests()] == ["/3", "/4"]
+        assert server.get_request().path == "/4"
+        assert server.num_req_logged == 5  # noqa: PLR2004
+        assert server.num_req_dropped == 3  # noqa: PLR2004
+        assert server.num_req_processed == 5  # noqa: PLR2004
+    finally:
+        server.stop()
+
+
+def test_invalid_log_retention():
+    # type: () -> None
+    with pytest.raises(TestServerError):
+        TestServer(log_retention="zzz")
+
+
+def test_large_request_body_spooled():
+    # type: () -> None
+    server = TestServer(spool_threshold=1000)
+    server.start()
+    try:
+        server.add_response(Response(), count=2)
+        request(server.get_url(), data=b"x" * 10)
+        assert server.get_request().body.in_memory
+        data = b"abc" * 100000
+        request(server.get_url(), data=data)
+        req = server.get_request()
+        assert not req.body.in_memory
+        assert req.body_size == len(data)
+        assert req.data == data
+    finally:
+        server.stop()
+
+
+def test_large_multipart_file_spooled():
+    # type: () -> None
+    server = TestServer(spool_threshold=1000)
+    server.start()
+    try:
+        server.add_response(Response())
+        content = b"z" * 100000
+        request(server.get_url(), fields={"image": ("big.png", content)})
+        img = server.get_request().files["image"][0]
+        assert img["filename"] == "big.png"
+        assert not img["body"].in_memory
+        assert img["content"] == content
+    finally:
+        server.stop()
+
+
+def test_chunked_request_body():
+    # type: () -> None
+    server = TestServer(protocol_version="HTTP/1.1")
+    server.start()
+    try:
+        server.add_response(Response(data=b"abc"), count=2)
+        sock = socket.create_connection((server.address, cast(int, server.port)))
+        sock.settimeout(NETWORK_TIMEOUT)
+        sock.sendall(CHUNKED_REQUEST)
+        data = b""
+        while not data.endswith(b"abc"):
+            data += sock.recv(1024)
+        req = server.get_request()
+        assert req.data == b"foo-bar"
+        assert req.trailers.get("x-sum") == "1"
+        # Connection is reused after chunked body
+        sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        data = b""
+        while not data.endswith(b"abc"):
+            data += sock.recv(1024)
+        assert server.get_request().method == "GET"
+        sock.close()
+    finally:
+        server.stop()
+
+
+def test_stream_response_data(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=(b"x" * 1000 for _ in range(1000))))
+    res = request(server.get_url())
+    assert res.data == b"x" * 1000000
+    # HTTP/1.0 server delimits the body by closing the connection
+    assert res.headers.get("content-length") is None
+
+
+def test_stream_response_data_size(server):
+    # type: (TestServer) -> None
+    chunks = [b"foo", u"bar"]  # type: list[bytes | str]
+    server.add_response(Response(data=iter(chunks), size=6))
+    res = request(server.get_url())
+    assert res.headers["content-length"] == "6"
+    assert res.data == b"foobar"
+
+
+def test_callback_stream_data(server):
+    # type: (TestServer) -> None
+    def callback():
+        # type: () -> dict[str, Any]
+        return {"type": "response", "data": iter([b"foo", b"bar"])}
+
+    server.add_response(Response(callback=callback))
+    assert request(server.get_url()).data == b"foobar"
+
+
+def test_stream_response_chunked():
+    # type: () -> None
+    server = TestServer(protocol_version="HTTP/1.1")
+    server.start()
+    try:
+        server.add_response(Response(data=[b"foo", b"", b"bar"]), count=2)
+        conn = HTTPConnection(server.address, server.port, timeout=NETWORK_TIMEOUT)
+        conn.request("GET", "/")
+        res = conn.getresponse()
+        assert res.getheader("transfer-encoding") == "chunked"
+        assert res.read() == b"foobar"
+        sock = conn.sock
+        conn.request("GET", "/")
+        assert conn.getresponse().read() == b"foobar"
+        assert conn.sock is sock
+        conn.close()
+    finally:
+        server.stop()
+
+
+def test_stream_response_error_closes_connection():
+    # type: () -> None
+    def gen():
+        # type: () -> Iterator[bytes]
+        yield b"foo"
+        raise RuntimeError("stream failed")
+
+    server = TestServer(protocol_version="HTTP/1.1")
+    server.start()
+    try:
+        server.add_response(Response(data=gen()))
+        conn = HTTPConnection(server.address, server.port, timeout=NETWORK_TIMEOUT)
+        conn.request("GET", "/")
+        res = conn.getresponse()
+        assert res.status == HTTP_STATUS_OK
+        with pytest.raises(IncompleteRead):
+            res.read()
+        conn.close()
+    finally:
+        server.stop()
+
+
+def test_file_response(server, data_file):
+    # type: (TestServer, Any) -> None
+    data = data_file.read_binary()
+    server.add_response(Response(file=str(data_file)))
+    server.add_response(Response(file=str(data_file), offset=10, length=5))
+    res = request(server.get_url())
+    assert res.headers["content-length"] == str(len(data))
+    assert res.data == data
+    assert request(server.get_url()).data == b"01234"
+    with data_file.open("rb") as inp:
+        server.add_response(Response(file=inp, offset=len(data) - 3), count=2)
+        assert request(server.get_url()).data == b"789"
+        assert request(server.get_url()).data == b"789"
+
+
+def test_file_response_missing_file(server, tmpdir):
+    # type: (TestServer, Any) -> None
+    server.add_response(Response(file=str(tmpdir.join("missing.bin"))))
+    assert request(server.get_url()).status == INTERNAL_ERROR_RESPONSE_STATUS
+
+
+def test_delayed_responses_do_not_hold_threads(server):
+    # type: (TestServer) -> None
+    delay = 0.5
+    server.add_response(Response(sleep=delay), count=-1)
+    num_threads = threading.active_count()
+    start = time.time()
+    socks = []
+    for _ in range(50):
+        sock = socket.create_connection((server.address, cast(int, server.port)))
+        sock.settimeout(NETWORK_TIMEOUT * 2)
+        sock.sendall(b"GET / HTTP/1.0\r\n\r\n")
+        socks.append(sock)
+    time.sleep(0.2)
+    assert threading.active_count() - num_threads < 10  # noqa: PLR2004
+    for sock in socks:
+        data = read_until_closed(sock)
+        sock.close()
+        assert data.startswith(b"HTTP/1.0 200 OK")
+    assert time.time() - start >= delay
+    assert server.num_req_processed == 50  # noqa: PLR2004
+
+
+def test_delayed_response_keep_alive():
+    # type: () -> None
+    server = TestServer(protocol_version="HTTP/1.1")
+    server.start()
+    try:
+        server.add_response(Response(data=b"abc", sleep=0.1), count=2)
+        conn = HTTPConnection(server.address, server.port, timeout=NETWORK_TIMEOUT)
+        for _ in range(2):
+            start = time.time()
+            conn.request("GET", "/")
+            assert conn.getresponse().read() == b"abc"
+            assert time.time() - start >= 0.1  # noqa: PLR2004
+        conn.close()
+    finally:
+        server.stop()
+
+
+def test_stop_server_with_pending_delayed_response():
+    # type: () -> None
+    server = TestServer()
+    server.start()
+    server.add_response(Response(sleep=10))
+    sock = socket.create_connection((server.address, cast(int, server.port)))
+    sock.settimeout(NETWORK_TIMEOUT)
+    sock.sendall(b"GET / HTTP/1.0\r\n\r\n")
+    time.sleep(0.1)
+    server.stop()
+    assert sock.recv(1024) == b""
+    sock.close()
+
+
+def test_delay_distribution(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(sleep=UniformDelay(0.1, 0.2)))
+    start = time.time()
+    request(server.get_url())
+    assert 0.1 <= time.time() - start < 1  # noqa: PLR2004
+
+
+def test_response_rate_limit(server):
+    # type: (TestServer) -> None
+    data = b"x" * 20000
+    server.add_response(Response(data=data, rate_limit_bps=40000, burst=4000))
+    start = time.time()
+    assert request(server.get_url()).data == data
+    assert time.time() - start >= 0.35  # noqa: PLR2004
+
+
+def test_file_response_rate_limit(server, tmpdir):
+    # type: (TestServer, Any) -> None
+    path = tmpdir.join("data.bin")
+    data = b"0123456789" * 2000
+    path.write_binary(data)
+    server.add_response(Response(file=str(path), rate_limit_bps=40000, burst=4000))
+    start = time.time()
+    assert request(server.get_url()).data == data
+    assert time.time() - start >= 0.35  # noqa: PLR2004
+
+
+def test_server_bandwidth_limit():
+    # type: () -> None
+    server = TestServer(bandwidth_limit_bps=50000)
+    server.start()
+    try:
+        data = b"x" * 10000
+        server.add_response(Response(data=data), count=2)
+        results = []  # type: list[bytes]
+        ths = [
+            Thread(target=lambda: results.append(request(server.get_url()).data))
+            for _ in range(2)
+        ]
+        start = time.time()
+        for th in ths:
+            th.start()
+        for th in ths:
+            th.join()
+        # Both responses share the limit
+        assert time.time() - start >= 0.3  # noqa: PLR2004
+        assert results == [data, data]
+    finally:
+        server.stop()
+
+
+def test_invalid_bandwidth_limit():
+    # type: () -> None
+    with pytest.raises(TestServerError):
+        TestServer(bandwidth_limit_bps=-1)
+
+
+def test_static_response_serialized_once(server):
+    # type: (TestServer) -> None
+    resp = Response(data=b"foo", headers=[("X-Foo", "bar")])
+    server.add_response(resp, count=2)
+    prepared = resp.prepare(server.port, server.protocol_version)
+    assert prepared is not None
+    for _ in range(2):
+        res = request(server.get_url())
+        assert res.data == b"foo"
+        assert res.headers["x-foo"] == "bar"
+        assert res.headers["content-length"] == "3"
+    assert resp.prepare(server.port, server.protocol_version) is prepared
+
+
+def test_static_response_changed_after_serve(server):
+    # type: (TestServer) -> None
+    resp = Response(data=b"foo")
+    server.add_response(resp, count=-1)
+    assert request(server.get_url()).data == b"foo"
+    resp.data = b"bar"
+    resp.status = 201
+    res = request(server.get_url())
+    assert (res.status, res.data) == (201, b"bar")
+    resp.headers.set("X-Foo", "baz")
+    assert request(server.get_url()).headers["x-foo"] == "baz"
+
+
+def test_dynamic_response_not_prepared(server):
+    # type: (TestServer) -> None
+    assert Response(callback=lambda: {"data": b""}).prepare(server.port, "") is None
+    assert Response(data=[b"foo"]).prepare(server.port, "") is None
+
+
+def test_static_response_connection_header():
+    # type: () -> None
+    server = TestServer(protocol_version="HTTP/1.1")
+    server.start()
+    try:
+        server.add_responses(
+            [
+                Response(data=b"foo"),
+                Response(data=b"bar", headers=[("Connection", "close")]),
+            ]
+        )
+        conn = HTTPConnection(server.address, server.port, timeout=NETWORK_TIMEOUT)
+        conn.request("GET", "/")
+        assert conn.getresponse().read() == b"foo"
+        sock = conn.sock
+        conn.request("GET", "/")
+        res = conn.getresponse()
+        assert res.read() == b"bar"
+        assert res.getheader("connection") == "close"
+        assert conn.sock is None or conn.sock is not sock
+        conn.close()
+        # Connection of HTTP/1.0 client is closed
+        server.add_response(Response(data=b"foo"))
+        sock = socket.create_connection((server.address, server.port))
+        sock.settimeout(NETWORK_TIMEOUT)
+        sock.sendall(b"GET / HTTP/1.0\r\n\r\n")
+        data = read_until_closed(sock)
+        sock.close()
+        head, body = data.split(b"\r\n\r\n", 1)
+        assert b"\r\nConnection: close" in head
+        assert body == b"foo"
+    finally:
+        server.stop()
+
+
+def test_request_fields_computed_lazily():
+    # type: () -> None
+    req = Request(
+        path="/foo",
+        headers=[("Cookie", "name=value"), ("X-Foo", "bar")],
+        query_string="a=1&b=2",
+    )
+    args = req.args
+    assert args == {"a": "1", "b": "2"}
+    assert req.args is args
+    assert req.cookies["name"].value == "value"
+    headers = req.headers
+    assert headers.get("x-foo") == "bar"
+    assert req.headers is headers
+    assert req.files == {}
+    assert req.trailers.count_items() == 0
+
+
+def test_request_fields_passed_explicitly():
+    # type: () -> None
+    req = Request(args={"x": "y"}, files={"f": []}, query_string="a=1")
+    assert req.args == {"x": "y"}
+    assert req.files == {"f": []}
+    req.args = {"z": "1"}
+    assert req.args == {"z": "1"}
+
+
+def test_worker_processes():
+    # type: () -> None
+    def callback():
+        # type: () -> dict[str, Any]
+        return {"type": "response", "data": str(os.getpid()).encode()}
+
+    server = TestServer(workers=2)
+    # Callback could not be passed to worker process after it is forked
+    server.add_response(Response(callback=callback), count=-1, path="/pid")
+    server.start()
+    try:
+        pids = {request(server.get_url("/pid")).data for _ in range(50)}
+        assert len(pids) == 2  # noqa: PLR2004
+        assert str(os.getpid()).encode() not in pids
+        server.add_response(Response(data=b"foo"))
+        assert request(server.get_url("/?a=1")).data == b"foo"
+        assert server.num_req_processed == 51  # noqa: PLR2004
+        req = server.get_request()
+        assert req.args == {"a": "1"}
+        assert req.path == "/"
+        server.reset()
+        server.add_response(Response(data=b"bar"))
+        assert request(server.get_url()).data == b"bar"
+        server.wait_request(NETWORK_TIMEOUT)
+        assert server.num_req_processed == 1
+    finally:
+        server.stop()
+
+
+def pickled_callback():
+    # type: () -> dict[str, Any]
+    return {"type": "response", "data": b"pickled"}
+
+
+def test_worker_processes_callback_added_after_start():
+    # type: () -> None
+    server = TestServer(workers=1)
+    server.start()
+    try:
+        with pytest.raises(TestServerError):
+            server.add_response(Response(callback=lambda: {"type": "response"}))
+        server.reset()
+        with pytest.raises(TestServerError):
+            server.add_responses([Response(data=(x for x in [b"abc"]))])
+        # Function which is pickled by reference could be passed to workers
+        server.add_response(Response(callback=pickled_callback))
+        assert request(server.get_url()).data == b"pickled"
+    finally:
+        server.stop()
+
+
+def test_worker_processes_wait_server_started():
+    # type: () -> None
+    server = TestServer(workers=2)
+    server.start()
+    try:
+        th = Thread(target=server.wait_server_started)
+        th.daemon = True
+        th.start()
+        th.join(NETWORK_TIMEOUT)
+        assert not th.is_alive()
+    finally:
+        server.stop()
+
+
+def test_invalid_workers():
+    # type: () -> None
+    with pytest.raises(TestServerError):
+        TestServer(workers=0)
+    with pytest.raises(TestServerError):
+        TestServer(workers=1).namespace()
+
+
+def test_request_timings(server):
+    # type: (TestServer) -> None
+    server.add_response(Response(data=b"foo"))
+    server.add_response(Response(callback=lambda: {"type": "response"}))
+    request(server.get_url("/foo?a=1"))
+    request(server.get_url("/bar"), method="POST", data=b"x" * 100)
+    req = server.get_request()
+    for key in ("connected", "received", "parsed", "dispatched", "body_read"):
+        assert key in req.timings
+    assert req.timings["received"] <= req.timings["parsed"] <= req.timings["body_read"]
+    assert req.durations["parse"] >= 0
+    wait_recorded_requests(server, 2, NETWORK_TIMEOUT)
+    stats = server.stats()
+    for phase in ("accept", "parse", "dispatch", "body", "callback", "write"):
+        assert stats["phases"][phase]["count"] == 2  # noqa: PLR2004
+    assert stats["paths"]["/foo"]["total"]["count"] == 1
+    assert set(stats["paths"]["/bar"]["total"]) == {"count", "p50", "p99", "max"}
+    server.reset()
+    assert server.stats() == {"phases": {}, "paths": {}}
+
+
+def test_delayed_request_timings(server):
+    # type: (TestServer) -> None
+    # Response to the connection which is not kept alive is deferred
+    server.add_response(Response(data=b"foo", sleep=0.2))
+    assert request(server.get_url(), data=b"x" * 100).data == b"foo"
+    wait_recorded_requests(server, 1, NETWORK_TIMEOUT)
+    req = server.get_request()
+    assert req.data == b"x" * 100
+    durations = req.durations
+    assert set(durations) >= {"delay", "body", "callback", "write", "total"}
+    assert all(val >= 0 for val in durations.values())
+    assert durations["delay"] >= 0.2  # noqa: PLR2004
+    assert durations["body"] < 0.1  # noqa: PLR2004
+
+
+def test_fast_start_stop():
+    # type: () -> None
+    start = time.time()
+    for _ in range(20):
+        server = TestServer()
+        server.start()
+        server.stop()
+    # Stop does not wait for polling interval of serving loop
+    assert time.time() - start < 1
+
+
+def test_connect_right_after_start():
+    # type: () -> None
+    server = TestServer()
+    server.start()
+    try:
+        # The socket is listening when start() returns
+        sock = socket.create_connection((server.address, cast(int, server.port)))
+        sock.close()
+    finally:
+        server.stop()
+
+
+def test_stop_keep_alive_connection():
+    # type: () -> None
+    server = TestServer(protocol_version="HTTP/1.1")
+    server.start()
+    server.add_response(Response(data=b"abc"))
+    sock = socket.create_connection((server.address, cast(int, server.port)))
+    sock.settimeout(NETWORK_TIMEOUT)
+    sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    data = b""
+    while not data.endswith(b"abc"):
+        data += sock.recv(1024)
+    start = time.time()
+    server.stop()
+    # Idle connection does not delay stop
+    assert time.time() - start < 0.5  # noqa: PLR2004
+    assert sock.recv(1024) == b""
+    sock.close()
+
+
+def test_stop_timeout_in_flight_request():
+    # type: () -> None
+    server = TestServer()
+    server.start()
+    started = threading.Event()
+
+    def callback():
+        # type: () -> dict[str, Any]
+        started.set()
+        time.sleep(2)
+        return {"type": "response", "data": b"abc"}
+
+    server.add_response(Response(callback=callback))
+    sock = socket.create_connection((server.address, cast(int, server.port)))
+    sock.settimeout(NETWORK_TIMEOUT)
+    sock.sendall(b"GET / HTTP/1.0\r\nHost: localhost\r\n\r\n")
+    assert started.wait(NETWORK_TIMEOUT)
+    check_stop_closes_connection(server, sock)
+
+
+def test_reset_drops_stale_request(server):
+    # type: (TestServer) -> None
+    started = threading.Event()
+    proceed = threading.Event()
+
+    def callback():
+        # type: () -> dict[str, Any]
+        started.set()
+        proceed.wait(NETWORK_TIMEOUT)
+        return {"type": "response", "data": b"old"}
+
+    server.add_response(Response(callback=callback))
+    result = []  # type: list[bytes]
+    th = Thread(target=lambda: result.append(request(server.get_url("/old")).data))
+    th.start()
+    assert started.wait(NETWORK_TIMEOUT)
+    server.reset()
+    server.add_response(Response(data=b"new"))
+    proceed.set()
+    th.join()
+    assert result == [b"old"]
+    # Request received before reset is not logged and not counted
+    assert server.num_req_processed == 0
+    assert server.num_req_stale == 1
+    with pytest.raises(RequestNotProcessedError):
+        server.get_request()
+    # Response added after reset is still available
+    assert request(server.get_url("/new")).data == b"new"
+    assert server.get_request().path == "/new"
+
+
+def test_select_response_stale_generation(server):
+    # type: (TestServer) -> None
+    generation = server.generation
+    server.reset()
+    server.add_response(Response(data=b"new"))
+    with pytest.raises(NoResponseError):
+        server.select_response("get", "/", None, generation)
+    assert server.select_response("get")[0] == server.generation
+
+
+def test_namespace_prefix(server):
+    # type: (TestServer) -> None
+    ns1 = server.namespace()
+    ns2 = server.namespace(prefix="/two")
+    ns1.add_response(Response(data=b"one"), path="/foo")
+    ns2.add_response(Response(data=b"two"))
+    server.add_response(Response(data=b"main"))
+    assert request(ns1.get_url("/foo?a=1")).data == b"one"
+    assert request(ns2.get_url()).data == b"two"
+    assert request(server.get_url("/twofold")).data == b"main"
+    ns1.wait_request(NETWORK_TIMEOUT)
+    req = ns1.get_request()
+    # Prefix is removed from the path of request
+    assert req.path == "/foo"
+    assert req.args == {"a": "1"}
+    assert ns2.get_request().path == "/"
+    assert server.get_request().path == "/twofold"
+    assert (ns1.num_req_processed, ns2.num_req_processed) == (1, 1)
+    assert server.num_req_processed == 1
+    ns1.remove()
+    ns2.remove()
+    server.add_response(Response(data=b"main"))
+    assert request(ns1.get_url("/foo")).data == b"main"
+
+
+def test_namespace_host(server):
+    # type: (TestServer) -> None
+    nspace = server.namespace(host="API.example.com")
+    nspace.add_response(Response(data=b"api"))
+    assert nspace.get_url("/x") == "http://api.example.com:{}/x".format(server.port)
+    conn = HTTPConnection(server.address, server.port, timeout=NETWORK_TIMEOUT)
+    host = "api.example.com:{}".format(server.port)
+    conn.request("GET", "/x", headers={"Host": host})
+    assert conn.getresponse().read() == b"api"
+    conn.close()
+    assert nspace.get_request().path == "/x"
+    assert server.num_req_processed == 0
+
+
+def test_namespace_no_response(server):
+    # type: (TestServer) -> None
+    nspace = server.namespace()
+    server.add_response(Response(data=b"main"))
+    res = request(nspace.get_url())
+    # Response of the server is not used for the namespace
+    assert res.status == INTERNAL_ERROR_RESPONSE_STATUS
+    nspace.reset()
+    assert nspace.num_req_processed == 0
+
+
+def test_namespace_invalid_options(server):
+    # type: (TestServer) -> None
+    for prefix in ("foo", "/", "/a/b"):
+        with pytest.raises(TestServerError):
+            server.namespace(prefix=prefix)
+    with pytest.raises(TestServerError):
+        server.namespace(prefix="/a", host="a")
+    nspace = server.namespace(prefix="/dup")
+    with pytest.raises(TestServerError):
+        server.namespace(prefix="/dup")
+    nspace.remove()
+    # Prefix of removed namespace could be used again
+    server.namespace(prefix="/dup")
@@ -0,0 +1,55 @@
+# from __future__ import annotations
+
+import pytest
+
+from test_server.throttle import Throttle, TokenBucket, create_throttle
+
+
+def test_token_bucket_reserve():
+    # type: () -> None
+    bucket = TokenBucket(1000, burst=100)
+    assert bucket.reserve(100) == 0
+    wait = bucket.reserve(100)
+    assert 0.09 < wait <= 0.1  # noqa: PLR2004
+    # Tokens are taken in advance, next caller waits longer
+    assert bucket.reserve(100) > wait
+
+
+def test_token_bucket_default_burst():
+    # type: () -> None
+    assert TokenBucket(1000).burst == 50  # noqa: PLR2004
+    assert TokenBucket(1).burst == 1
+
+
+def test_token_bucket_invalid():
+    # type: () -> None
+    with pytest.raises(ValueError, match="must be positive"):
+        TokenBucket(0)
+    with pytest.raises(ValueError, match="must be positive"):
+        TokenBucket(100, burst=0)
+
+
+def test_throttle_spans():
+    # type: () -> None
+    throttle = Throttle([TokenBucket(1000, burst=300), TokenBucket(10**6)])
+    assert throttle.chunk_size == 300  # noqa: PLR2004
+    spans = list(throttle.iter_spans(700))
+    assert [(start, end) for _, start, end in spans] == [
+        (0, 300),
+        (300, 600),
+        (600, 700),
+    ]
+    assert spans[0][0] == 0
+    assert spans[-1][0] > 0
+
+
+def test_create_throttle():
+    # type: () -> None
+    assert create_throttle(None, None, None) is None
+    shared = TokenBucket(1000)
+    throttle = create_throttle(None, None, shared)
+    assert throttle is not None
+    assert throttle.buckets == [shared]
+    throttle = create_throttle(500, 10, shared)
+    assert throttle is not None
+    assert len(throttle.buckets) == 2  # noqa: PLR2004
@@ -1,6 +1,8 @@
 # from __future__ import annotations
 
-from threading import Lock
+import socket
+import time
+from typing import Any
 
 import pytest
 
@@ -8,36 +10,79 @@ import pytest
 from six.moves.collections_abc import Iterator
 
 # pylint: enable=import-error
-from typing_extensions import TypedDict
+from test_server import TestServer, TestServerPool
 
-from test_server import TestServer
+# Tests could be run in parallel threads, each one leases its own server
+SERVER_POOL_SIZE = 2
+# Body "foo-bar" in two chunks, the second one with extension, and trailer
+CHUNKED_REQUEST = (
+    b"POST / HTTP/1.1\r\nHost: localhost\r\n"
+    b"Transfer-Encoding: chunked\r\n\r\n"
+    b"4\r\nfoo-\r\n3;ext=1\r\nbar\r\n0\r\nX-Sum: 1\r\n\r\n"
+)
 
-# pylint: disable=invalid-name
-CacheDict = TypedDict("CacheDict", {"server": TestServer}, total=False)
-# pylint: enable=invalid-name
 
+@pytest.fixture(scope="session", name="server_pool")
+def fixture_server_pool():
+    # type: () -> Iterator[TestServerPool]
+    pool = TestServerPool(size=SERVER_POOL_SIZE)
+    yield pool
+    pool.stop()
 
-CACHE = {}  # type: CacheDict
-CACHE_LOCK = Lock()
 
+@pytest.fixture(name="server")
+def fixture_server(server_pool):
+    # type: (TestServerPool) -> Iterator[TestServer]
+    with server_pool.lease() as srv:
+        yield srv
 
-@pytest.fixture(scope="session", name="global_server")
-def fixture_global_server():
-    # type: () -> Iterator[TestServer]
-    with CACHE_LOCK:
-        if "server" not in CACHE:
-            srv = TestServer()
-            srv.start()
-            CACHE["server"] = srv
-    yield CACHE["server"]
-    with CACHE_LOCK:
-        if CACHE["server"]:
-            CACHE["server"].stop()
-            del CACHE["server"]
 
+@pytest.fixture(name="data_file")
+def fixture_data_file(tmpdir):
+    # type: (Any) -> Any
+    """File with 1MB of data larger than single read or sendfile() call."""
+    path = tmpdir.join("data.bin")
+    path.write_binary(b"0123456789" * 100000)
+    return path
 
-@pytest.fixture(name="server")
-def fixture_server(global_server):
-    # type: (TestServer) -> TestServer
-    global_server.reset()
-    return global_server
+
+def read_until_closed(
+    sock,  # type: socket.socket
+):
+    # type: (...) -> bytes
+    """Read data from socket until the server closes the connection."""
+    chunks = []  # type: list[bytes]
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def wait_recorded_requests(
+    server,  # type: TestServer
+    count,  # type: int
+    timeout,  # type: float
+):
+    # type: (...) -> None
+    """Wait until phases of count responses are recorded in server stats.
+
+    Response phases are recorded after the request is counted as processed.
+    """
+    deadline = time.time() + timeout
+    while server.stats()["phases"].get("total", {}).get("count") != count:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def check_stop_closes_connection(
+    server,  # type: TestServer
+    sock,  # type: socket.socket
+):
+    # type: (...) -> None
+    """Check stop() closes connection of request which is not finished in time."""
+    start = time.time()
+    server.stop(timeout=0.1)
+    assert time.time() - start < 0.5  # noqa: PLR2004
+    assert sock.recv(1024) == b""
+    sock.close()